@@ -0,0 +1,338 @@
+import asyncio
+import json
+import logging
+import random
+import sqlite3
+import threading
+import time
+import zlib
+from collections import defaultdict
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, NamedTuple, Optional
+from api.prompts import FALLBACK_CHAT_RESPONSE, FALLBACK_COMPLETION, FallbackSentiment
+from api.single_flight import SingleFlight
+from utils.response_cache import ResponseCache
+
+logger = logging.getLogger(__name__)
+
+# Cassette modes
+RECORD = 'record'
+REPLAY = 'replay'
+
+# What replay does for a request that was never recorded
+MISS_ANY = 'any'      # serve another recording of the same method
+MISS_ERROR = 'error'  # raise CassetteMissError
+
+class CassetteMissError(LookupError):
+    """Raised in replay mode when no recording can answer a request"""
+
+class Recording(NamedTuple):
+    """One recorded upstream call"""
+    response: Any
+    latency: float
+    first_chunk_latency: Optional[float]
+
+class CassetteStore:
+    """Compact on-disk store of recorded LLM calls
+
+    Recordings live in a SQLite file, one row per call, with the response
+    stored as zlib-compressed JSON. The same request may be recorded many times.
+    """
+
+    def __init__(self, path: str):
+        """Open (or create) a cassette file
+
+        Args:
+            path: SQLite file path
+        """
+        self.path = path
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS recordings ('
+            'id INTEGER PRIMARY KEY, key TEXT NOT NULL, method TEXT NOT NULL, '
+            'response BLOB NOT NULL, latency REAL NOT NULL, first_chunk_latency REAL)'
+        )
+        self._db.execute('CREATE INDEX IF NOT EXISTS recordings_key ON recordings (key)')
+        self._db.commit()
+        self._lock = threading.Lock()
+
+    def add(self, key: str, method: str, recording: Recording) -> None:
+        """Append a recording
+
+        Args:
+            key: Request key
+            method: Client method name
+            recording: Response and observed latencies
+        """
+        blob = zlib.compress(json.dumps(recording.response, separators=(',', ':')).encode('utf-8'))
+        with self._lock:
+            try:
+                self._db.execute(
+                    'INSERT INTO recordings (key, method, response, latency, first_chunk_latency) VALUES (?, ?, ?, ?, ?)',
+                    (key, method, blob, recording.latency, recording.first_chunk_latency)
+                )
+                self._db.commit()
+            except sqlite3.Error as e:
+                logger.error(f"Error writing recording to cassette: {str(e)}")
+
+    def load(self) -> Dict[str, Dict[str, List[Recording]]]:
+        """Read every recording
+
+        Returns:
+            Method name -> request key -> recordings in the order they were made
+        """
+        recordings: Dict[str, Dict[str, List[Recording]]] = defaultdict(lambda: defaultdict(list))
+        with self._lock:
+            rows = self._db.execute(
+                'SELECT key, method, response, latency, first_chunk_latency FROM recordings ORDER BY id'
+            ).fetchall()
+        for key, method, blob, latency, first_chunk_latency in rows:
+            response = json.loads(zlib.decompress(blob).decode('utf-8'))
+            recordings[method][key].append(Recording(response, latency, first_chunk_latency))
+        return recordings
+
+class CassetteClient:
+    """Records or replays the calls of an LLM client with the same interface
+
+    In record mode every call goes to the wrapped client, and the response and
+    observed latency are written to the cassette. In replay mode responses are
+    served from the cassette without any network access, optionally after a
+    delay drawn from the recorded latencies of that method.
+    """
+
+    def __init__(
+        self,
+        client: Any,
+        store: CassetteStore,
+        mode: str = REPLAY,
+        reproduce_latency: bool = False,
+        latency_scale: float = 1.0,
+        on_miss: str = MISS_ERROR,
+        seed: Optional[int] = None
+    ):
+        """Initialize the cassette client
+
+        Args:
+            client: LLM client to record (unused in replay mode, may be None)
+            store: Cassette store
+            mode: RECORD or REPLAY
+            reproduce_latency: Delay replayed responses like the recorded calls
+            latency_scale: Factor applied to reproduced latencies
+            on_miss: MISS_ERROR (default) or MISS_ANY for requests that were never recorded
+            seed: Seed for choosing latencies and substitute recordings
+        """
+        if mode not in (RECORD, REPLAY):
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        if mode == RECORD and client is None:
+            raise ValueError("Record mode needs a client to record")
+        if on_miss not in (MISS_ANY, MISS_ERROR):
+            raise ValueError(f"Unknown cassette miss policy: {on_miss}")
+
+        self.client = client
+        self.store = store
+        self.mode = mode
+        self.reproduce_latency = reproduce_latency
+        self.latency_scale = latency_scale
+        self.on_miss = on_miss
+        self.single_flight = getattr(client, 'single_flight', None) or SingleFlight()
+
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._recordings = store.load() if mode == REPLAY else {}
+        self._by_method = {
+            method: [recording for recordings in by_key.values() for recording in recordings]
+            for method, by_key in self._recordings.items()
+        }
+        self._latencies = {method: [recording.latency for recording in recordings] for method, recordings in self._by_method.items()}
+        self._positions: Dict[str, int] = defaultdict(int)
+
+        # Counters
+        self.recorded = 0
+        self.replayed = 0
+        self.misses = 0
+
+    # Recording
+
+    def _record(self, method: str, key: str, response: Any, latency: float, first_chunk_latency: Optional[float] = None):
+        """Store a successful call; fallback responses are not recorded"""
+        if isinstance(response, FallbackSentiment):
+            return
+        if response in (FALLBACK_CHAT_RESPONSE, FALLBACK_COMPLETION) or response == [FALLBACK_CHAT_RESPONSE]:
+            return
+        self.store.add(key, method, Recording(response, latency, first_chunk_latency))
+        with self._lock:
+            self.recorded += 1
+
+    def _call(self, method: str, key: str, func: Callable[[], Any]) -> Any:
+        started = time.perf_counter()
+        response = func()
+        self._record(method, key, response, time.perf_counter() - started)
+        return response
+
+    async def _call_async(self, method: str, key: str, func: Callable[[], Any]) -> Any:
+        started = time.perf_counter()
+        response = await func()
+        self._record(method, key, response, time.perf_counter() - started)
+        return response
+
+    # Replay
+
+    def _lookup(self, method: str, key: str) -> Recording:
+        """Pick the recording that answers a request
+
+        Repeated identical requests cycle through that request's recordings.
+        """
+        by_key = self._recordings.get(method, {})
+        with self._lock:
+            recordings = by_key.get(key)
+            if recordings:
+                self.replayed += 1
+                position = self._positions[key]
+                self._positions[key] = position + 1
+                return recordings[position % len(recordings)]
+
+            self.misses += 1
+            if self.on_miss == MISS_ANY and self._by_method.get(method):
+                self.replayed += 1
+                return self._random.choice(self._by_method[method])
+
+        raise CassetteMissError(f"No recording for {method} request {key[:12]}")
+
+    def _replay_delay(self, method: str) -> float:
+        """Latency drawn from the recorded latencies of a method"""
+        latencies = self._latencies.get(method)
+        if not self.reproduce_latency or not latencies:
+            return 0.0
+        with self._lock:
+            return self._random.choice(latencies) * self.latency_scale
+
+    def _replay(self, method: str, key: str) -> Any:
+        recording = self._lookup(method, key)
+        delay = self._replay_delay(method)
+        if delay:
+            time.sleep(delay)
+        return recording.response
+
+    async def _replay_async(self, method: str, key: str) -> Any:
+        recording = self._lookup(method, key)
+        delay = self._replay_delay(method)
+        if delay:
+            await asyncio.sleep(delay)
+        return recording.response
+
+    def _stream_delays(self, method: str, recording: Recording) -> List[float]:
+        """Delays before each replayed chunk, keeping the recorded share of time to the first chunk"""
+        total = self._replay_delay(method)
+        chunks = len(recording.response)
+        if not total or not chunks:
+            return [0.0] * chunks
+        if chunks == 1:
+            return [total]
+        share = recording.first_chunk_latency / recording.latency if recording.latency and recording.first_chunk_latency else 1 / chunks
+        first = total * share
+        return [first] + [(total - first) / (chunks - 1)] * (chunks - 1)
+
+    # Client interface
+
+    def get_chat_response(self, system_message: str, user_message: str, chat_history: List[Dict[str, str]] = None) -> str:
+        """Get (or replay) a chat response"""
+        key = ResponseCache.make_key('chat', system_message, user_message, chat_history or [])
+        if self.mode == REPLAY:
+            return self._replay('chat', key)
+        return self._call('chat', key, lambda: self.client.get_chat_response(system_message, user_message, chat_history))
+
+    async def get_chat_response_async(self, system_message: str, user_message: str, chat_history: List[Dict[str, str]] = None) -> str:
+        """Async version of get_chat_response"""
+        key = ResponseCache.make_key('chat', system_message, user_message, chat_history or [])
+        if self.mode == REPLAY:
+            return await self._replay_async('chat', key)
+        return await self._call_async(
+            'chat', key, lambda: self.client.get_chat_response_async(system_message, user_message, chat_history)
+        )
+
+    def stream_chat_response(self, system_message: str, user_message: str, chat_history: List[Dict[str, str]] = None) -> Iterator[str]:
+        """Stream (or replay) a chat response chunk by chunk"""
+        key = ResponseCache.make_key('chat', system_message, user_message, chat_history or [])
+
+        if self.mode == REPLAY:
+            recording = self._lookup('stream', key)
+            for delay, chunk in zip(self._stream_delays('stream', recording), recording.response):
+                if delay:
+                    time.sleep(delay)
+                yield chunk
+            return
+
+        chunks = []
+        first_chunk_latency = None
+        started = time.perf_counter()
+        for chunk in self.client.stream_chat_response(system_message, user_message, chat_history):
+            if first_chunk_latency is None:
+                first_chunk_latency = time.perf_counter() - started
+            chunks.append(chunk)
+            yield chunk
+        self._record('stream', key, chunks, time.perf_counter() - started, first_chunk_latency)
+
+    async def stream_chat_response_async(
+        self, system_message: str, user_message: str, chat_history: List[Dict[str, str]] = None
+    ) -> AsyncIterator[str]:
+        """Async version of stream_chat_response"""
+        key = ResponseCache.make_key('chat', system_message, user_message, chat_history or [])
+
+        if self.mode == REPLAY:
+            recording = self._lookup('stream', key)
+            for delay, chunk in zip(self._stream_delays('stream', recording), recording.response):
+                if delay:
+                    await asyncio.sleep(delay)
+                yield chunk
+            return
+
+        chunks = []
+        first_chunk_latency = None
+        started = time.perf_counter()
+        async for chunk in self.client.stream_chat_response_async(system_message, user_message, chat_history):
+            if first_chunk_latency is None:
+                first_chunk_latency = time.perf_counter() - started
+            chunks.append(chunk)
+            yield chunk
+        self._record('stream', key, chunks, time.perf_counter() - started, first_chunk_latency)
+
+    def get_completion(self, prompt: str, max_tokens: int = 500) -> str:
+        """Get (or replay) a completion"""
+        key = ResponseCache.make_key('completion', prompt, max_tokens)
+        if self.mode == REPLAY:
+            return self._replay('completion', key)
+        return self._call('completion', key, lambda: self.client.get_completion(prompt, max_tokens))
+
+    async def get_completion_async(self, prompt: str, max_tokens: int = 500) -> str:
+        """Async version of get_completion"""
+        key = ResponseCache.make_key('completion', prompt, max_tokens)
+        if self.mode == REPLAY:
+            return await self._replay_async('completion', key)
+        return await self._call_async('completion', key, lambda: self.client.get_completion_async(prompt, max_tokens))
+
+    def analyze_sentiment(self, text: str) -> Dict[str, Any]:
+        """Get (or replay) a sentiment analysis"""
+        key = ResponseCache.make_key('sentiment', text)
+        if self.mode == REPLAY:
+            return dict(self._replay('sentiment', key))
+        return self._call('sentiment', key, lambda: self.client.analyze_sentiment(text))
+
+    async def analyze_sentiment_async(self, text: str) -> Dict[str, Any]:
+        """Async version of analyze_sentiment"""
+        key = ResponseCache.make_key('sentiment', text)
+        if self.mode == REPLAY:
+            return dict(await self._replay_async('sentiment', key))
+        return await self._call_async('sentiment', key, lambda: self.client.analyze_sentiment_async(text))
+
+    def stats(self) -> Dict[str, Any]:
+        """Record/replay counters
+
+        Returns:
+            Dictionary with the mode and recorded, replayed and missed calls
+        """
+        return {
+            'mode': self.mode,
+            'recorded': self.recorded,
+            'replayed': self.replayed,
+            'misses': self.misses,
+            'recordings': sum(len(recordings) for recordings in self._by_method.values())
+        }
@@ -1,30 +1,126 @@
 import os
 import logging
-import json
+import google.ai.generativelanguage as glm
 import google.generativeai as genai
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Iterator, AsyncIterator
+from api.single_flight import SingleFlight
+from api.prompts import FALLBACK_CHAT_RESPONSE, FALLBACK_COMPLETION, build_sentiment_prompt, copy_sentiment, fallback_sentiment, parse_sentiment
 
 logger = logging.getLogger(__name__)
 
+# Model turn that acknowledges the system message at the start of each chat
+SYSTEM_ACKNOWLEDGEMENT = "I understand. I'll act as Anaira, an empathetic AI companion for FertilityNest."
+
+# Raw protobuf message behind glm.Content. Building it directly and wrapping it
+# is several times cheaper than converting dicts (or proto-plus kwargs) per turn.
+_CONTENT_PB = glm.Content.pb()
+
+def _content(role: str, text: str):
+    """Build a chat turn without going through the SDK's dict conversion"""
+    return glm.Content.wrap(_CONTENT_PB(role=role, parts=[{'text': text}]))
+
 class GeminiClient:
     """Client for interacting with Google Gemini API"""
     
-    def __init__(self, api_key: Optional[str] = None):
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        transport: Optional[str] = None,
+        api_endpoint: Optional[str] = None,
+        pool_size: Optional[int] = None,
+        raise_errors: bool = False
+    ):
         """Initialize Gemini client
         
         Args:
             api_key: Gemini API key (defaults to environment variable)
+            transport: 'grpc' or 'rest' (defaults to GEMINI_TRANSPORT, then the SDK default)
+            api_endpoint: Alternative API host, e.g. a local stub (defaults to GEMINI_API_ENDPOINT)
+            pool_size: Keep-alive connections kept by the REST transport (defaults to GEMINI_POOL_SIZE)
+            raise_errors: Raise upstream errors instead of returning fallback responses
         """
         self.api_key = api_key or os.getenv('GEMINI_API_KEY')
         if not self.api_key:
             raise ValueError("Gemini API key is required")
         
+        self.transport = transport or os.getenv('GEMINI_TRANSPORT') or None
+        self.api_endpoint = api_endpoint or os.getenv('GEMINI_API_ENDPOINT') or None
+        self.pool_size = int(pool_size or os.getenv('GEMINI_POOL_SIZE', 10))
+        self.raise_errors = raise_errors
+        
         # Configure the Gemini API
-        genai.configure(api_key=self.api_key)
+        genai.configure(
+            api_key=self.api_key,
+            transport=self.transport,
+            client_options={'api_endpoint': self.api_endpoint} if self.api_endpoint else None
+        )
+        self._configure_connection_pool()
         
-        # Default model for chat
+        # Default model for chat, built once and shared by every call
         self.chat_model = "gemini-1.5-pro"
+        self._model = genai.GenerativeModel(self.chat_model)
+        
+        # Completion models by max_tokens, with the generation config baked in
+        # so the SDK doesn't convert it again on every call
+        self._completion_models: Dict[int, Any] = {}
+        
+        # Shares in-flight upstream calls between identical concurrent requests
+        self.single_flight = SingleFlight()
+    
+    def _configure_connection_pool(self):
+        """Size the keep-alive connection pool of the REST transport
+        
+        The gRPC transport needs no pool: it multiplexes every call over one
+        persistent HTTP/2 channel created by genai.configure.
+        
+        The SDK has no public hook for this, so the requests session is taken
+        from the REST transport's private ``_session`` attribute (present in
+        google-generativeai 0.3 through 0.8; requirements.txt pins the version).
+        Any other SDK layout keeps the SDK defaults.
+        """
+        if self.transport != 'rest':
+            return
+        
+        try:
+            import requests
+            from requests.adapters import HTTPAdapter
+            from google.generativeai import client as genai_client
+            
+            transport = getattr(genai_client.get_default_generative_client(), '_transport', None)
+            session = getattr(transport, '_session', None)
+            if not isinstance(session, requests.Session):
+                logger.warning("Gemini REST transport has no requests session to pool, using SDK defaults")
+                return
+            adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+        except Exception as e:
+            logger.warning(f"Could not configure Gemini connection pool, using SDK defaults: {str(e)}")
+    
+    def _start_chat(self, system_message: str, chat_history: List[Dict[str, str]] = None):
+        """Start a Gemini chat session primed with the system message and history
+        
+        Args:
+            system_message: System message for context
+            chat_history: Previous chat messages
+            
+        Returns:
+            Gemini chat session
+        """
+        # In Gemini, the system message goes in as the first user turn,
+        # acknowledged by the model, followed by the previous messages
+        history = [
+            _content("user", system_message),
+            _content("model", SYSTEM_ACKNOWLEDGEMENT)
+        ] if system_message else []
         
+        history.extend(
+            _content("user" if msg["role"] == "user" else "model", msg["content"])
+            for msg in chat_history or ()
+        )
+        
+        return self._model.start_chat(history=history)
+    
     def get_chat_response(
         self, 
         system_message: str, 
@@ -42,26 +138,7 @@ class GeminiClient:
             AI response text
         """
         try:
-            # Initialize the model
-            model = genai.GenerativeModel(self.chat_model)
-            
-            # Start a chat session
-            chat = model.start_chat(history=[])
-            
-            # Add system message as the first message
-            if system_message:
-                # In Gemini, we need to add the system message as part of the first user message
-                # or use it to initialize the chat
-                chat = model.start_chat(history=[
-                    {"role": "user", "parts": [system_message]},
-                    {"role": "model", "parts": ["I understand. I'll act as Anaira, an empathetic AI companion for FertilityNest."]}
-                ])
-            
-            # Add chat history if provided
-            if chat_history:
-                for msg in chat_history:
-                    role = "user" if msg["role"] == "user" else "model"
-                    chat.history.append({"role": role, "parts": [msg["content"]]})
+            chat = self._start_chat(system_message, chat_history)
             
             # Send the user message and get response
             response = chat.send_message(user_message)
@@ -70,43 +147,252 @@ class GeminiClient:
         
         except Exception as e:
             logger.error(f"Error getting chat response: {str(e)}")
+            if self.raise_errors:
+                raise
             # Return fallback response
-            return "I apologize, but I'm having trouble connecting to my knowledge base right now. Could you please try again in a moment?"
+            return FALLBACK_CHAT_RESPONSE
     
-    def get_completion(self, prompt: str, max_tokens: int = 500) -> str:
-        """Get response from Gemini completion API
+    async def get_chat_response_async(
+        self, 
+        system_message: str, 
+        user_message: str, 
+        chat_history: List[Dict[str, str]] = None
+    ) -> str:
+        """Async version of get_chat_response that doesn't block the event loop
         
         Args:
-            prompt: Text prompt
-            max_tokens: Maximum tokens in response
+            system_message: System message for context
+            user_message: User message
+            chat_history: Previous chat messages
             
         Returns:
-            AI completion text
+            AI response text
         """
         try:
-            # Initialize the model
-            model = genai.GenerativeModel(self.chat_model)
+            chat = self._start_chat(system_message, chat_history)
             
-            # Generate content with the prompt
-            response = model.generate_content(
-                prompt,
+            # Send the user message and await the response
+            response = await chat.send_message_async(user_message)
+            
+            return response.text
+        
+        except Exception as e:
+            logger.error(f"Error getting chat response: {str(e)}")
+            if self.raise_errors:
+                raise
+            # Return fallback response
+            return FALLBACK_CHAT_RESPONSE
+    
+    def stream_chat_response(
+        self, 
+        system_message: str, 
+        user_message: str, 
+        chat_history: List[Dict[str, str]] = None
+    ) -> Iterator[str]:
+        """Stream a chat response from Gemini as text chunks arrive
+        
+        Args:
+            system_message: System message for context
+            user_message: User message
+            chat_history: Previous chat messages
+            
+        Yields:
+            Response text chunks
+        """
+        streamed = False
+        try:
+            chat = self._start_chat(system_message, chat_history)
+            
+            for chunk in chat.send_message(user_message, stream=True):
+                if chunk.text:
+                    streamed = True
+                    yield chunk.text
+        
+        except Exception as e:
+            logger.error(f"Error streaming chat response: {str(e)}")
+            if self.raise_errors:
+                raise
+            # Only fall back if nothing reached the user yet
+            if not streamed:
+                yield FALLBACK_CHAT_RESPONSE
+    
+    async def stream_chat_response_async(
+        self, 
+        system_message: str, 
+        user_message: str, 
+        chat_history: List[Dict[str, str]] = None
+    ) -> AsyncIterator[str]:
+        """Async version of stream_chat_response
+        
+        Args:
+            system_message: System message for context
+            user_message: User message
+            chat_history: Previous chat messages
+            
+        Yields:
+            Response text chunks
+        """
+        streamed = False
+        try:
+            chat = self._start_chat(system_message, chat_history)
+            
+            response = await chat.send_message_async(user_message, stream=True)
+            async for chunk in response:
+                if chunk.text:
+                    streamed = True
+                    yield chunk.text
+        
+        except Exception as e:
+            logger.error(f"Error streaming chat response: {str(e)}")
+            if self.raise_errors:
+                raise
+            # Only fall back if nothing reached the user yet
+            if not streamed:
+                yield FALLBACK_CHAT_RESPONSE
+    
+    def _completion_model(self, max_tokens: int):
+        """Get the model used for completions of a given length
+        
+        Args:
+            max_tokens: Maximum tokens in response
+            
+        Returns:
+            Gemini model configured for completions
+        """
+        model = self._completion_models.get(max_tokens)
+        if model is None:
+            model = genai.GenerativeModel(
+                self.chat_model,
                 generation_config=genai.GenerationConfig(
                     max_output_tokens=max_tokens,
                     temperature=0.7,
                     top_p=1.0
                 )
             )
+            self._completion_models[max_tokens] = model
+        
+        return model
+    
+    def get_completion(self, prompt: str, max_tokens: int = 500) -> str:
+        """Get response from Gemini completion API
+        
+        Identical concurrent requests share one upstream call.
+        
+        Args:
+            prompt: Text prompt
+            max_tokens: Maximum tokens in response
+            
+        Returns:
+            AI completion text
+        """
+        return self.single_flight.do(("completion", prompt, max_tokens), self._get_completion, prompt, max_tokens)
+    
+    def _get_completion(self, prompt: str, max_tokens: int = 500) -> str:
+        """Call the Gemini completion API
+        
+        Args:
+            prompt: Text prompt
+            max_tokens: Maximum tokens in response
+            
+        Returns:
+            AI completion text
+        """
+        try:
+            # Generate content with the prompt
+            response = self._completion_model(max_tokens).generate_content(prompt)
             
             return response.text
         
         except Exception as e:
             logger.error(f"Error getting completion: {str(e)}")
+            if self.raise_errors:
+                raise
             # Return fallback response
-            return "I apologize, but I'm having trouble generating a response right now. Please try again later."
+            return FALLBACK_COMPLETION
+    
+    async def get_completion_async(self, prompt: str, max_tokens: int = 500) -> str:
+        """Async version of get_completion that doesn't block the event loop
+        
+        Args:
+            prompt: Text prompt
+            max_tokens: Maximum tokens in response
+            
+        Returns:
+            AI completion text
+        """
+        return await self.single_flight.do_async(
+            ("completion", prompt, max_tokens), self._get_completion_async, prompt, max_tokens
+        )
+    
+    async def _get_completion_async(self, prompt: str, max_tokens: int = 500) -> str:
+        """Call the Gemini completion API asynchronously
+        
+        Args:
+            prompt: Text prompt
+            max_tokens: Maximum tokens in response
+            
+        Returns:
+            AI completion text
+        """
+        try:
+            # Generate content with the prompt
+            response = await self._completion_model(max_tokens).generate_content_async(prompt)
+            
+            return response.text
+        
+        except Exception as e:
+            logger.error(f"Error getting completion: {str(e)}")
+            if self.raise_errors:
+                raise
+            # Return fallback response
+            return FALLBACK_COMPLETION
     
     def analyze_sentiment(self, text: str) -> Dict[str, Any]:
         """Analyze sentiment of text using Gemini
         
+        Identical concurrent requests share one upstream call.
+        
+        Args:
+            text: Text to analyze
+            
+        Returns:
+            Dictionary with sentiment analysis
+        """
+        return copy_sentiment(self.single_flight.do(("sentiment", text), self._analyze_sentiment, text))
+    
+    def _analyze_sentiment(self, text: str) -> Dict[str, Any]:
+        """Run sentiment analysis through a Gemini completion
+        
+        Args:
+            text: Text to analyze
+            
+        Returns:
+            Dictionary with sentiment analysis
+        """
+        try:
+            response = self.get_completion(build_sentiment_prompt(text))
+            return self._parse_sentiment(response)
+        
+        except Exception as e:
+            logger.error(f"Error analyzing sentiment: {str(e)}")
+            if self.raise_errors:
+                raise
+            return fallback_sentiment()
+    
+    async def analyze_sentiment_async(self, text: str) -> Dict[str, Any]:
+        """Async version of analyze_sentiment
+        
+        Args:
+            text: Text to analyze
+            
+        Returns:
+            Dictionary with sentiment analysis
+        """
+        return copy_sentiment(await self.single_flight.do_async(("sentiment", text), self._analyze_sentiment_async, text))
+    
+    async def _analyze_sentiment_async(self, text: str) -> Dict[str, Any]:
+        """Run sentiment analysis through an async Gemini completion
+        
         Args:
             text: Text to analyze
             
@@ -114,42 +400,26 @@ class GeminiClient:
             Dictionary with sentiment analysis
         """
         try:
-            prompt = f"""Analyze the sentiment and emotion in the following text. 
-            Return a JSON object with keys for 'sentiment' (positive, negative, or neutral), 
-            'emotion' (happy, sad, angry, anxious, distressed, hopeful, or neutral), 
-            and 'distressLevel' (0-10 scale).
-            
-            Text: "{text}"
-            
-            JSON:"""
-            
-            response = self.get_completion(prompt)
-            
-            # Parse JSON response
-            try:
-                # Clean the response to ensure it's valid JSON
-                # Sometimes the model might include markdown formatting or extra text
-                json_str = response.strip()
-                if json_str.startswith("```json"):
-                    json_str = json_str[7:]
-                if json_str.endswith("```"):
-                    json_str = json_str[:-3]
-                
-                json_str = json_str.strip()
-                result = json.loads(json_str)
-                return result
-            except json.JSONDecodeError:
-                logger.error(f"Error parsing sentiment analysis JSON: {response}")
-                return {
-                    "sentiment": "neutral",
-                    "emotion": "neutral",
-                    "distressLevel": 0
-                }
+            response = await self.get_completion_async(build_sentiment_prompt(text))
+            return self._parse_sentiment(response)
         
         except Exception as e:
             logger.error(f"Error analyzing sentiment: {str(e)}")
-            return {
-                "sentiment": "neutral",
-                "emotion": "neutral",
-                "distressLevel": 0
-            }
+            if self.raise_errors:
+                raise
+            return fallback_sentiment()
+    
+    def _parse_sentiment(self, response: str) -> Dict[str, Any]:
+        """Parse the JSON sentiment analysis returned by the model
+        
+        Args:
+            response: Raw model response
+            
+        Returns:
+            Dictionary with sentiment analysis (neutral if the response doesn't match the schema)
+        """
+        try:
+            return parse_sentiment(response)
+        except ValueError as e:
+            logger.error(f"Invalid sentiment analysis ({str(e)}): {response}")
+            return fallback_sentiment()
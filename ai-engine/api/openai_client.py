@@ -1,24 +1,77 @@
 import os
 import logging
 import openai
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Iterator, AsyncIterator
+from api.single_flight import SingleFlight
+from api.prompts import FALLBACK_CHAT_RESPONSE, FALLBACK_COMPLETION, build_sentiment_prompt, copy_sentiment, fallback_sentiment, parse_sentiment
 
 logger = logging.getLogger(__name__)
 
+# Request parameters for the chat completion API
+CHAT_PARAMS = {
+    "model": "gpt-3.5-turbo",
+    "temperature": 0.7,
+    "max_tokens": 500,
+    "top_p": 1.0,
+    "frequency_penalty": 0.0,
+    "presence_penalty": 0.0
+}
+
+# Request parameters for the completion API
+COMPLETION_PARAMS = {
+    "model": "text-davinci-003",
+    "temperature": 0.7,
+    "top_p": 1.0,
+    "frequency_penalty": 0.0,
+    "presence_penalty": 0.0
+}
+
 class OpenAIClient:
     """Client for interacting with OpenAI API"""
     
-    def __init__(self, api_key: Optional[str] = None):
+    def __init__(self, api_key: Optional[str] = None, raise_errors: bool = False):
         """Initialize OpenAI client
         
         Args:
             api_key: OpenAI API key (defaults to environment variable)
+            raise_errors: Raise upstream errors instead of returning fallback responses
         """
         self.api_key = api_key or os.getenv('OPENAI_API_KEY')
         if not self.api_key:
             raise ValueError("OpenAI API key is required")
         
         openai.api_key = self.api_key
+        self.raise_errors = raise_errors
+        
+        # Shares in-flight upstream calls between identical concurrent requests
+        self.single_flight = SingleFlight()
+    
+    def _build_messages(
+        self, 
+        system_message: str, 
+        user_message: str, 
+        chat_history: List[Dict[str, str]] = None
+    ) -> List[Dict[str, str]]:
+        """Build the chat completion message list
+        
+        Args:
+            system_message: System message for context
+            user_message: User message
+            chat_history: Previous chat messages
+            
+        Returns:
+            Messages for the chat completion API
+        """
+        messages = [{"role": "system", "content": system_message}]
+        
+        # Add chat history if provided
+        if chat_history:
+            messages.extend(chat_history)
+        
+        # Add current user message
+        messages.append({"role": "user", "content": user_message})
+        
+        return messages
     
     def get_chat_response(
         self, 
@@ -37,35 +90,144 @@ class OpenAIClient:
             AI response text
         """
         try:
-            messages = [{"role": "system", "content": system_message}]
-            
-            # Add chat history if provided
-            if chat_history:
-                messages.extend(chat_history)
+            response = openai.ChatCompletion.create(
+                messages=self._build_messages(system_message, user_message, chat_history),
+                **CHAT_PARAMS
+            )
             
-            # Add current user message
-            messages.append({"role": "user", "content": user_message})
+            return response.choices[0].message.content.strip()
+        
+        except Exception as e:
+            logger.error(f"Error getting chat response: {str(e)}")
+            if self.raise_errors:
+                raise
+            # Return fallback response
+            return FALLBACK_CHAT_RESPONSE
+    
+    async def get_chat_response_async(
+        self, 
+        system_message: str, 
+        user_message: str, 
+        chat_history: List[Dict[str, str]] = None
+    ) -> str:
+        """Async version of get_chat_response that doesn't block the event loop
+        
+        Args:
+            system_message: System message for context
+            user_message: User message
+            chat_history: Previous chat messages
             
-            response = openai.ChatCompletion.create(
-                model="gpt-3.5-turbo",
-                messages=messages,
-                temperature=0.7,
-                max_tokens=500,
-                top_p=1.0,
-                frequency_penalty=0.0,
-                presence_penalty=0.0
+        Returns:
+            AI response text
+        """
+        try:
+            response = await openai.ChatCompletion.acreate(
+                messages=self._build_messages(system_message, user_message, chat_history),
+                **CHAT_PARAMS
             )
             
             return response.choices[0].message.content.strip()
         
         except Exception as e:
             logger.error(f"Error getting chat response: {str(e)}")
+            if self.raise_errors:
+                raise
             # Return fallback response
-            return "I apologize, but I'm having trouble connecting to my knowledge base right now. Could you please try again in a moment?"
+            return FALLBACK_CHAT_RESPONSE
+    
+    def stream_chat_response(
+        self, 
+        system_message: str, 
+        user_message: str, 
+        chat_history: List[Dict[str, str]] = None
+    ) -> Iterator[str]:
+        """Stream a chat response from OpenAI as tokens arrive
+        
+        Args:
+            system_message: System message for context
+            user_message: User message
+            chat_history: Previous chat messages
+            
+        Yields:
+            Response text chunks
+        """
+        streamed = False
+        try:
+            response = openai.ChatCompletion.create(
+                messages=self._build_messages(system_message, user_message, chat_history),
+                stream=True,
+                **CHAT_PARAMS
+            )
+            
+            for chunk in response:
+                content = chunk.choices[0].delta.get("content")
+                if content:
+                    streamed = True
+                    yield content
+        
+        except Exception as e:
+            logger.error(f"Error streaming chat response: {str(e)}")
+            if self.raise_errors:
+                raise
+            # Only fall back if nothing reached the user yet
+            if not streamed:
+                yield FALLBACK_CHAT_RESPONSE
+    
+    async def stream_chat_response_async(
+        self, 
+        system_message: str, 
+        user_message: str, 
+        chat_history: List[Dict[str, str]] = None
+    ) -> AsyncIterator[str]:
+        """Async version of stream_chat_response
+        
+        Args:
+            system_message: System message for context
+            user_message: User message
+            chat_history: Previous chat messages
+            
+        Yields:
+            Response text chunks
+        """
+        streamed = False
+        try:
+            response = await openai.ChatCompletion.acreate(
+                messages=self._build_messages(system_message, user_message, chat_history),
+                stream=True,
+                **CHAT_PARAMS
+            )
+            
+            async for chunk in response:
+                content = chunk.choices[0].delta.get("content")
+                if content:
+                    streamed = True
+                    yield content
+        
+        except Exception as e:
+            logger.error(f"Error streaming chat response: {str(e)}")
+            if self.raise_errors:
+                raise
+            # Only fall back if nothing reached the user yet
+            if not streamed:
+                yield FALLBACK_CHAT_RESPONSE
     
     def get_completion(self, prompt: str, max_tokens: int = 500) -> str:
         """Get response from OpenAI completion API
         
+        Identical concurrent requests share one upstream call.
+        
+        Args:
+            prompt: Text prompt
+            max_tokens: Maximum tokens in response
+            
+        Returns:
+            AI completion text
+        """
+        return self.single_flight.do(("completion", prompt, max_tokens), self._get_completion, prompt, max_tokens)
+    
+    def _get_completion(self, prompt: str, max_tokens: int = 500) -> str:
+        """Call the OpenAI completion API
+        
         Args:
             prompt: Text prompt
             max_tokens: Maximum tokens in response
@@ -75,25 +237,106 @@ class OpenAIClient:
         """
         try:
             response = openai.Completion.create(
-                model="text-davinci-003",
                 prompt=prompt,
-                temperature=0.7,
                 max_tokens=max_tokens,
-                top_p=1.0,
-                frequency_penalty=0.0,
-                presence_penalty=0.0
+                **COMPLETION_PARAMS
+            )
+            
+            return response.choices[0].text.strip()
+        
+        except Exception as e:
+            logger.error(f"Error getting completion: {str(e)}")
+            if self.raise_errors:
+                raise
+            # Return fallback response
+            return FALLBACK_COMPLETION
+    
+    async def get_completion_async(self, prompt: str, max_tokens: int = 500) -> str:
+        """Async version of get_completion that doesn't block the event loop
+        
+        Args:
+            prompt: Text prompt
+            max_tokens: Maximum tokens in response
+            
+        Returns:
+            AI completion text
+        """
+        return await self.single_flight.do_async(
+            ("completion", prompt, max_tokens), self._get_completion_async, prompt, max_tokens
+        )
+    
+    async def _get_completion_async(self, prompt: str, max_tokens: int = 500) -> str:
+        """Call the OpenAI completion API asynchronously
+        
+        Args:
+            prompt: Text prompt
+            max_tokens: Maximum tokens in response
+            
+        Returns:
+            AI completion text
+        """
+        try:
+            response = await openai.Completion.acreate(
+                prompt=prompt,
+                max_tokens=max_tokens,
+                **COMPLETION_PARAMS
             )
             
             return response.choices[0].text.strip()
         
         except Exception as e:
             logger.error(f"Error getting completion: {str(e)}")
+            if self.raise_errors:
+                raise
             # Return fallback response
-            return "I apologize, but I'm having trouble generating a response right now. Please try again later."
+            return FALLBACK_COMPLETION
     
     def analyze_sentiment(self, text: str) -> Dict[str, Any]:
         """Analyze sentiment of text using OpenAI
         
+        Identical concurrent requests share one upstream call.
+        
+        Args:
+            text: Text to analyze
+            
+        Returns:
+            Dictionary with sentiment analysis
+        """
+        return copy_sentiment(self.single_flight.do(("sentiment", text), self._analyze_sentiment, text))
+    
+    def _analyze_sentiment(self, text: str) -> Dict[str, Any]:
+        """Run sentiment analysis through an OpenAI completion
+        
+        Args:
+            text: Text to analyze
+            
+        Returns:
+            Dictionary with sentiment analysis
+        """
+        try:
+            response = self.get_completion(build_sentiment_prompt(text))
+            return self._parse_sentiment(response)
+        
+        except Exception as e:
+            logger.error(f"Error analyzing sentiment: {str(e)}")
+            if self.raise_errors:
+                raise
+            return fallback_sentiment()
+    
+    async def analyze_sentiment_async(self, text: str) -> Dict[str, Any]:
+        """Async version of analyze_sentiment
+        
+        Args:
+            text: Text to analyze
+            
+        Returns:
+            Dictionary with sentiment analysis
+        """
+        return copy_sentiment(await self.single_flight.do_async(("sentiment", text), self._analyze_sentiment_async, text))
+    
+    async def _analyze_sentiment_async(self, text: str) -> Dict[str, Any]:
+        """Run sentiment analysis through an async OpenAI completion
+        
         Args:
             text: Text to analyze
             
@@ -101,34 +344,26 @@ class OpenAIClient:
             Dictionary with sentiment analysis
         """
         try:
-            prompt = f"""Analyze the sentiment and emotion in the following text. 
-            Return a JSON object with keys for 'sentiment' (positive, negative, or neutral), 
-            'emotion' (happy, sad, angry, anxious, distressed, hopeful, or neutral), 
-            and 'distressLevel' (0-10 scale).
-            
-            Text: "{text}"
-            
-            JSON:"""
-            
-            response = self.get_completion(prompt)
-            
-            # Parse JSON response
-            import json
-            try:
-                result = json.loads(response)
-                return result
-            except json.JSONDecodeError:
-                logger.error(f"Error parsing sentiment analysis JSON: {response}")
-                return {
-                    "sentiment": "neutral",
-                    "emotion": "neutral",
-                    "distressLevel": 0
-                }
+            response = await self.get_completion_async(build_sentiment_prompt(text))
+            return self._parse_sentiment(response)
         
         except Exception as e:
             logger.error(f"Error analyzing sentiment: {str(e)}")
-            return {
-                "sentiment": "neutral",
-                "emotion": "neutral",
-                "distressLevel": 0
-            }
+            if self.raise_errors:
+                raise
+            return fallback_sentiment()
+    
+    def _parse_sentiment(self, response: str) -> Dict[str, Any]:
+        """Parse the JSON sentiment analysis returned by the model
+        
+        Args:
+            response: Raw model response
+            
+        Returns:
+            Dictionary with sentiment analysis (neutral if the response doesn't match the schema)
+        """
+        try:
+            return parse_sentiment(response)
+        except ValueError as e:
+            logger.error(f"Invalid sentiment analysis ({str(e)}): {response}")
+            return fallback_sentiment()
@@ -0,0 +1,100 @@
+# Prompts and fallback responses shared by the LLM clients
+
+import json
+import math
+from typing import Any, Dict
+
+FALLBACK_CHAT_RESPONSE = "I apologize, but I'm having trouble connecting to my knowledge base right now. Could you please try again in a moment?"
+
+FALLBACK_COMPLETION = "I apologize, but I'm having trouble generating a response right now. Please try again later."
+
+NEUTRAL_SENTIMENT = {
+    "sentiment": "neutral",
+    "emotion": "neutral",
+    "distressLevel": 0
+}
+
+class FallbackSentiment(dict):
+    """NEUTRAL_SENTIMENT returned in place of a model answer
+
+    A distinct type so callers can tell a failed or unparseable call from a
+    model that really answered neutral.
+    """
+    is_fallback = True
+
+def fallback_sentiment() -> FallbackSentiment:
+    """A fresh fallback sentiment analysis"""
+    return FallbackSentiment(NEUTRAL_SENTIMENT)
+
+def copy_sentiment(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Copy of a sentiment analysis that stays recognizable as a fallback"""
+    return FallbackSentiment(result) if isinstance(result, FallbackSentiment) else dict(result)
+
+SENTIMENTS = ('positive', 'negative', 'neutral')
+
+EMOTIONS = ('happy', 'sad', 'angry', 'anxious', 'distressed', 'hopeful', 'neutral')
+
+def build_sentiment_prompt(text: str) -> str:
+    """Build the sentiment analysis prompt
+    
+    Args:
+        text: Text to analyze
+        
+    Returns:
+        Prompt asking for a JSON sentiment analysis
+    """
+    return f"""Analyze the sentiment and emotion in the following text. 
+            Return only a JSON object with keys for 'sentiment' (positive, negative, or neutral), 
+            'emotion' (happy, sad, angry, anxious, distressed, hopeful, or neutral), 
+            and 'distressLevel' (integer, 0-10 scale).
+            
+            Text: "{text}"
+            
+            JSON:"""
+
+def parse_sentiment(response: str) -> Dict[str, Any]:
+    """Parse and validate the sentiment JSON returned by a model
+    
+    The first JSON object in the response is used, so markdown fences and
+    surrounding prose are ignored. Labels are lowercased and the distress
+    level is rounded and clamped to 0-10; anything else in the object is dropped.
+    
+    Args:
+        response: Raw model response
+        
+    Returns:
+        Dictionary with 'sentiment', 'emotion' and 'distressLevel'
+        
+    Raises:
+        ValueError: If the response has no JSON object or a field is missing or invalid
+    """
+    start = response.find('{')
+    if start < 0:
+        raise ValueError('no JSON object in the response')
+    data, _ = json.JSONDecoder().raw_decode(response, start)
+    if not isinstance(data, dict):
+        raise ValueError('the sentiment analysis is not a JSON object')
+    
+    sentiment = str(data.get('sentiment', '')).strip().lower()
+    if sentiment not in SENTIMENTS:
+        raise ValueError(f"invalid sentiment {data.get('sentiment')!r}")
+    
+    emotion = str(data.get('emotion', '')).strip().lower()
+    if emotion not in EMOTIONS:
+        raise ValueError(f"invalid emotion {data.get('emotion')!r}")
+    
+    level = data.get('distressLevel')
+    if isinstance(level, bool):
+        raise ValueError(f"invalid distressLevel {level!r}")
+    try:
+        level = float(level)
+    except (TypeError, ValueError):
+        raise ValueError(f"invalid distressLevel {level!r}")
+    if not math.isfinite(level):
+        raise ValueError(f"distressLevel is not finite: {level!r}")
+    
+    return {
+        'sentiment': sentiment,
+        'emotion': emotion,
+        'distressLevel': min(10, max(0, int(round(level))))
+    }
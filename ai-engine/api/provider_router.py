@@ -0,0 +1,627 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+from api.single_flight import SingleFlight
+from api.prompts import FALLBACK_CHAT_RESPONSE, FALLBACK_COMPLETION, copy_sentiment, fallback_sentiment
+
+logger = logging.getLogger(__name__)
+
+# Circuit breaker states
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+class ProviderHealth:
+    """Rolling latency/error window and circuit breaker for one provider"""
+
+    def __init__(self, name: str, window: int, failure_threshold: int, error_rate_threshold: float, cooldown: float):
+        """Initialize a healthy provider
+
+        Args:
+            name: Provider name
+            window: Number of recent calls kept
+            failure_threshold: Consecutive failures that open the circuit
+            error_rate_threshold: Error rate over the window that opens the circuit
+            cooldown: Seconds the circuit stays open before a probe call is allowed
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.error_rate_threshold = error_rate_threshold
+        self.cooldown = cooldown
+
+        self.samples: deque = deque(maxlen=window)
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def available(self) -> bool:
+        """Check whether calls may currently be sent (without claiming a probe)"""
+        if self.state == CLOSED:
+            return True
+        if self._probing:
+            return False
+        return self.state == HALF_OPEN or time.monotonic() - self.opened_at >= self.cooldown
+
+    def acquire(self) -> bool:
+        """Claim permission for one call, letting a single probe through an open circuit"""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.cooldown:
+                self.state = HALF_OPEN
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def release(self) -> None:
+        """Give back a call that was abandoned without an outcome"""
+        with self._lock:
+            self._probing = False
+
+    def record(self, latency: float, ok: bool) -> None:
+        """Record the outcome of a call
+
+        Args:
+            latency: Seconds the call took
+            ok: Whether the call succeeded
+        """
+        with self._lock:
+            self.samples.append((latency, ok))
+            self._probing = False
+
+            if ok:
+                self.consecutive_failures = 0
+                if self.state != CLOSED:
+                    logger.info(f"Circuit for {self.name} closed")
+                self.state = CLOSED
+                return
+
+            self.consecutive_failures += 1
+            if (
+                self.state == HALF_OPEN
+                or self.consecutive_failures >= self.failure_threshold
+                or (len(self.samples) >= 10 and self.error_rate() >= self.error_rate_threshold)
+            ):
+                if self.state != OPEN:
+                    logger.warning(f"Circuit for {self.name} opened")
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+
+    def error_rate(self) -> float:
+        """Share of failed calls in the window"""
+        if not self.samples:
+            return 0.0
+        return sum(1 for _, ok in self.samples if not ok) / len(self.samples)
+
+    def latency_percentile(self, percentile: float) -> Optional[float]:
+        """Latency percentile of successful calls in the window, or None without data"""
+        latencies = sorted(latency for latency, ok in self.samples if ok)
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(percentile * len(latencies)))]
+
+    def stats(self) -> Dict[str, Any]:
+        """Health summary for monitoring"""
+        return {
+            'state': self.state,
+            'samples': len(self.samples),
+            'errorRate': self.error_rate(),
+            'p50': self.latency_percentile(0.5),
+            'p95': self.latency_percentile(0.95)
+        }
+
+class ProviderRouter:
+    """Routes LLM calls across providers with the same client interface
+
+    Providers are tried in configured order, skipping those whose circuit is
+    open and moving those slower than ``latency_budget`` (rolling p95) to the
+    back. Failed or timed-out calls fail over to the next provider. With
+    hedging enabled, a second provider is also asked once the first has taken
+    longer than its own p95, and the first successful answer wins.
+
+    The wrapped clients should be built with ``raise_errors=True`` so the
+    router can see failures; it returns the usual fallback responses itself
+    once every provider has failed.
+
+    A sync call that times out can't be interrupted and keeps its thread until
+    the provider answers. Each provider has its own threads, and a provider
+    whose threads are all busy while some of them hold timed-out calls is
+    skipped rather than queued behind, so hung calls never delay failover.
+    Async calls are cancelled at the timeout.
+    """
+
+    def __init__(
+        self,
+        providers: List[Tuple[str, Any]],
+        timeout: float = 15.0,
+        latency_budget: Optional[float] = None,
+        failure_threshold: int = 3,
+        error_rate_threshold: float = 0.5,
+        cooldown: float = 30.0,
+        window: int = 100,
+        hedge: bool = False,
+        hedge_min_delay: float = 1.0,
+        max_workers: int = 64
+    ):
+        """Initialize the router
+
+        Args:
+            providers: (name, client) pairs in order of preference
+            timeout: Seconds before a provider call counts as failed
+            latency_budget: Rolling p95 above which a provider is deprioritized (defaults to timeout / 2)
+            failure_threshold: Consecutive failures that open a provider's circuit
+            error_rate_threshold: Windowed error rate that opens a provider's circuit
+            cooldown: Seconds before an open circuit lets a probe call through
+            window: Number of recent calls tracked per provider
+            hedge: Send a hedged request to the next provider after the p95 delay
+            hedge_min_delay: Lower bound (and default before enough data) for the hedge delay
+            max_workers: Threads per provider for concurrent sync calls (including timed-out calls still running)
+        """
+        if not providers:
+            raise ValueError("At least one provider is required")
+
+        self.providers = dict(providers)
+        self.order = [name for name, _ in providers]
+        self.timeout = timeout
+        self.latency_budget = latency_budget if latency_budget is not None else timeout / 2
+        self.hedge = hedge
+        self.hedge_min_delay = hedge_min_delay
+
+        self.health = {
+            name: ProviderHealth(name, window, failure_threshold, error_rate_threshold, cooldown)
+            for name in self.order
+        }
+        self.single_flight = SingleFlight()
+        self.max_workers = max_workers
+        self._executors = {
+            name: ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f'llm-{name}')
+            for name in self.order
+        }
+        self._in_flight = {name: 0 for name in self.order}  # sync calls holding a thread
+        self._hung = {name: 0 for name in self.order}  # of which timed out and still running
+        self._in_flight_lock = threading.Lock()
+
+        # Counters
+        self.failovers = 0
+        self.hedged = 0
+        self.exhausted = 0
+        self.saturated = 0
+
+    def _candidates(self) -> List[str]:
+        """Providers to try, healthy and fast ones first"""
+        fast, slow = [], []
+        for name in self.order:
+            health = self.health[name]
+            if not health.available():
+                continue
+            p95 = health.latency_percentile(0.95)
+            (slow if p95 is not None and p95 > self.latency_budget else fast).append(name)
+        return fast + slow
+
+    def _hedge_delay(self, name: str) -> Optional[float]:
+        """Seconds to wait for a provider before hedging, or None if hedging is off"""
+        if not self.hedge:
+            return None
+        p95 = self.health[name].latency_percentile(0.95)
+        return max(self.hedge_min_delay, p95 or 0.0)
+
+    def preferred_provider(self) -> str:
+        """Name of the provider the next call will most likely go to"""
+        candidates = [name for name in self.order if self.health[name].state == CLOSED]
+        return (candidates or self.order)[0]
+
+    def _reserve_thread(self, name: str) -> bool:
+        """Count a sync call against a provider's threads
+
+        Returns:
+            False if every thread is busy and some hold timed-out calls, so a
+            new call would wait behind calls that may never return
+        """
+        with self._in_flight_lock:
+            if self._in_flight[name] >= self.max_workers and self._hung[name]:
+                self.saturated += 1
+                return False
+            self._in_flight[name] += 1
+            return True
+
+    def _call(self, method: str, fallback: Any, *args, **kwargs) -> Any:
+        """Call a client method on the best provider, failing over and hedging as configured
+
+        Args:
+            method: Client method name
+            fallback: Value returned when every provider fails
+            *args: Positional arguments for the method
+            **kwargs: Keyword arguments for the method
+
+        Returns:
+            The first successful result, or the fallback
+        """
+        candidates = self._candidates()
+        pending: Dict[Future, Tuple[str, float]] = {}
+        timed_out, finished = set(), set()
+
+        next_index = 0
+
+        def launch() -> Optional[str]:
+            """Start a call on the next provider that accepts one"""
+            nonlocal next_index
+            while next_index < len(candidates):
+                name = candidates[next_index]
+                next_index += 1
+                # A provider whose threads are all held by hung calls would only queue this one
+                if not self._reserve_thread(name):
+                    logger.warning(f"{name} threads are held by timed-out calls, skipping it")
+                    continue
+                if not self.health[name].acquire():
+                    with self._in_flight_lock:
+                        self._in_flight[name] -= 1
+                    continue
+
+                started = time.monotonic()
+                future = self._executors[name].submit(getattr(self.providers[name], method), *args, **kwargs)
+                pending[future] = (name, started)
+
+                # Outcomes are recorded when calls finish, including hedges that lost
+                def record(done: Future, name=name, started=started):
+                    with self._in_flight_lock:
+                        finished.add(done)
+                        self._in_flight[name] -= 1
+                        abandoned = done in timed_out
+                        if abandoned:
+                            self._hung[name] -= 1
+                    if not abandoned:
+                        self.health[name].record(time.monotonic() - started, done.exception() is None)
+                future.add_done_callback(record)
+                return name
+            return None
+
+        hedge_at = None
+        first = launch()
+        if first is not None:
+            delay = self._hedge_delay(first)
+            hedge_at = time.monotonic() + delay if delay is not None else None
+
+        while pending:
+            now = time.monotonic()
+            deadline = min(started for _, started in pending.values()) + self.timeout
+            wake_at = min(deadline, hedge_at) if hedge_at is not None and next_index < len(candidates) else deadline
+
+            done, _ = wait(list(pending), timeout=max(0.0, wake_at - now), return_when=FIRST_COMPLETED)
+
+            if not done:
+                now = time.monotonic()
+                if hedge_at is not None and now >= hedge_at and next_index < len(candidates):
+                    # Primary is slower than usual: ask the next provider too
+                    hedge_at = None
+                    if launch() is not None:
+                        self.hedged += 1
+                    continue
+
+                # Calls past their deadline count as failures; their threads stay reserved until they return
+                for future, (name, started) in list(pending.items()):
+                    if now - started >= self.timeout:
+                        with self._in_flight_lock:
+                            timed_out.add(future)
+                            if future not in finished:
+                                self._hung[name] += 1
+                        # A call still queued for a thread is dropped; a running one can't be interrupted
+                        future.cancel()
+                        self.health[name].record(now - started, False)
+                        logger.warning(f"{name} {method} timed out after {self.timeout}s")
+                        del pending[future]
+            else:
+                for future in done:
+                    name, _ = pending.pop(future)
+                    error = future.exception()
+                    if error is None:
+                        return future.result()
+                    logger.error(f"{name} {method} failed: {str(error)}")
+
+            # Fail over once nothing is left in flight
+            if not pending and launch() is not None:
+                self.failovers += 1
+                hedge_at = None
+
+        self.exhausted += 1
+        logger.error(f"All providers failed for {method}, returning fallback")
+        return fallback
+
+    async def _call_async(self, method: str, fallback: Any, *args, **kwargs) -> Any:
+        """Async version of _call using the clients' async methods
+
+        Args:
+            method: Async client method name
+            fallback: Value returned when every provider fails
+            *args: Positional arguments for the method
+            **kwargs: Keyword arguments for the method
+
+        Returns:
+            The first successful result, or the fallback
+        """
+        candidates = self._candidates()
+        pending: Dict[asyncio.Task, Tuple[str, float]] = {}
+
+        next_index = 0
+
+        def launch() -> Optional[str]:
+            """Start a call on the next provider that accepts one"""
+            nonlocal next_index
+            while next_index < len(candidates):
+                name = candidates[next_index]
+                next_index += 1
+                if not self.health[name].acquire():
+                    continue
+
+                started = time.monotonic()
+                task = asyncio.ensure_future(getattr(self.providers[name], method)(*args, **kwargs))
+                pending[task] = (name, started)
+
+                def record(done: asyncio.Task, name=name, started=started):
+                    if done.cancelled():
+                        self.health[name].release()
+                    else:
+                        self.health[name].record(time.monotonic() - started, done.exception() is None)
+                task.add_done_callback(record)
+                return name
+            return None
+
+        hedge_at = None
+        first = launch()
+        if first is not None:
+            delay = self._hedge_delay(first)
+            hedge_at = time.monotonic() + delay if delay is not None else None
+
+        try:
+            while pending:
+                now = time.monotonic()
+                deadline = min(started for _, started in pending.values()) + self.timeout
+                wake_at = min(deadline, hedge_at) if hedge_at is not None and next_index < len(candidates) else deadline
+
+                done, _ = await asyncio.wait(list(pending), timeout=max(0.0, wake_at - now), return_when=asyncio.FIRST_COMPLETED)
+
+                if not done:
+                    now = time.monotonic()
+                    if hedge_at is not None and now >= hedge_at and next_index < len(candidates):
+                        hedge_at = None
+                        if launch() is not None:
+                            self.hedged += 1
+                        continue
+
+                    for task, (name, started) in list(pending.items()):
+                        if now - started >= self.timeout:
+                            task.cancel()
+                            self.health[name].record(now - started, False)
+                            logger.warning(f"{name} {method} timed out after {self.timeout}s")
+                            del pending[task]
+                else:
+                    for task in done:
+                        name, _ = pending.pop(task)
+                        error = task.exception()
+                        if error is None:
+                            return task.result()
+                        logger.error(f"{name} {method} failed: {str(error)}")
+
+                if not pending and launch() is not None:
+                    self.failovers += 1
+                    hedge_at = None
+        finally:
+            # Losing hedges are no longer needed
+            for task in pending:
+                task.cancel()
+
+        self.exhausted += 1
+        logger.error(f"All providers failed for {method}, returning fallback")
+        return fallback
+
+    def get_chat_response(
+        self,
+        system_message: str,
+        user_message: str,
+        chat_history: List[Dict[str, str]] = None
+    ) -> str:
+        """Get a chat response from the best available provider
+
+        Args:
+            system_message: System message for context
+            user_message: User message
+            chat_history: Previous chat messages
+
+        Returns:
+            AI response text
+        """
+        return self._call('get_chat_response', FALLBACK_CHAT_RESPONSE, system_message, user_message, chat_history)
+
+    async def get_chat_response_async(
+        self,
+        system_message: str,
+        user_message: str,
+        chat_history: List[Dict[str, str]] = None
+    ) -> str:
+        """Async version of get_chat_response
+
+        Args:
+            system_message: System message for context
+            user_message: User message
+            chat_history: Previous chat messages
+
+        Returns:
+            AI response text
+        """
+        return await self._call_async(
+            'get_chat_response_async', FALLBACK_CHAT_RESPONSE, system_message, user_message, chat_history
+        )
+
+    def get_completion(self, prompt: str, max_tokens: int = 500) -> str:
+        """Get a completion from the best available provider
+
+        Args:
+            prompt: Text prompt
+            max_tokens: Maximum tokens in response
+
+        Returns:
+            AI completion text
+        """
+        return self.single_flight.do(
+            ('completion', prompt, max_tokens), self._call, 'get_completion', FALLBACK_COMPLETION, prompt, max_tokens
+        )
+
+    async def get_completion_async(self, prompt: str, max_tokens: int = 500) -> str:
+        """Async version of get_completion
+
+        Args:
+            prompt: Text prompt
+            max_tokens: Maximum tokens in response
+
+        Returns:
+            AI completion text
+        """
+        return await self.single_flight.do_async(
+            ('completion', prompt, max_tokens), self._call_async, 'get_completion_async', FALLBACK_COMPLETION, prompt, max_tokens
+        )
+
+    def analyze_sentiment(self, text: str) -> Dict[str, Any]:
+        """Analyze sentiment with the best available provider
+
+        Args:
+            text: Text to analyze
+
+        Returns:
+            Dictionary with sentiment analysis
+        """
+        return copy_sentiment(self.single_flight.do(
+            ('sentiment', text), self._call, 'analyze_sentiment', fallback_sentiment(), text
+        ))
+
+    async def analyze_sentiment_async(self, text: str) -> Dict[str, Any]:
+        """Async version of analyze_sentiment
+
+        Args:
+            text: Text to analyze
+
+        Returns:
+            Dictionary with sentiment analysis
+        """
+        return copy_sentiment(await self.single_flight.do_async(
+            ('sentiment', text), self._call_async, 'analyze_sentiment_async', fallback_sentiment(), text
+        ))
+
+    def stream_chat_response(
+        self,
+        system_message: str,
+        user_message: str,
+        chat_history: List[Dict[str, str]] = None
+    ) -> Iterator[str]:
+        """Stream a chat response, failing over until a provider starts streaming
+
+        Args:
+            system_message: System message for context
+            user_message: User message
+            chat_history: Previous chat messages
+
+        Yields:
+            Response text chunks
+        """
+        for name in self._candidates():
+            if not self.health[name].acquire():
+                continue
+            started = time.monotonic()
+            streamed = False
+            settled = False
+            try:
+                for chunk in self.providers[name].stream_chat_response(system_message, user_message, chat_history):
+                    if not streamed:
+                        # Latency to the first chunk is what users feel
+                        self.health[name].record(time.monotonic() - started, True)
+                        streamed = settled = True
+                    yield chunk
+                if not streamed:
+                    self.health[name].record(time.monotonic() - started, True)
+                    settled = True
+                return
+            except Exception as e:
+                logger.error(f"{name} stream_chat_response failed: {str(e)}")
+                if streamed:
+                    return
+                self.health[name].record(time.monotonic() - started, False)
+                settled = True
+                self.failovers += 1
+            finally:
+                # Closing or cancelling the stream before its first chunk raises
+                # GeneratorExit/CancelledError, which the handler above doesn't see
+                if not settled:
+                    self.health[name].release()
+
+        self.exhausted += 1
+        yield FALLBACK_CHAT_RESPONSE
+
+    async def stream_chat_response_async(
+        self,
+        system_message: str,
+        user_message: str,
+        chat_history: List[Dict[str, str]] = None
+    ) -> AsyncIterator[str]:
+        """Async version of stream_chat_response
+
+        Args:
+            system_message: System message for context
+            user_message: User message
+            chat_history: Previous chat messages
+
+        Yields:
+            Response text chunks
+        """
+        for name in self._candidates():
+            if not self.health[name].acquire():
+                continue
+            started = time.monotonic()
+            streamed = False
+            settled = False
+            try:
+                async for chunk in self.providers[name].stream_chat_response_async(system_message, user_message, chat_history):
+                    if not streamed:
+                        self.health[name].record(time.monotonic() - started, True)
+                        streamed = settled = True
+                    yield chunk
+                if not streamed:
+                    self.health[name].record(time.monotonic() - started, True)
+                    settled = True
+                return
+            except Exception as e:
+                logger.error(f"{name} stream_chat_response_async failed: {str(e)}")
+                if streamed:
+                    return
+                self.health[name].record(time.monotonic() - started, False)
+                settled = True
+                self.failovers += 1
+            finally:
+                # Closing or cancelling the stream before its first chunk raises
+                # GeneratorExit/CancelledError, which the handler above doesn't see
+                if not settled:
+                    self.health[name].release()
+
+        self.exhausted += 1
+        yield FALLBACK_CHAT_RESPONSE
+
+    def stats(self) -> Dict[str, Any]:
+        """Routing counters and per-provider health
+
+        Returns:
+            Dictionary with failover/hedge counters and provider health
+        """
+        return {
+            'failovers': self.failovers,
+            'hedged': self.hedged,
+            'exhausted': self.exhausted,
+            'saturated': self.saturated,
+            'providers': {
+                name: dict(health.stats(), inFlight=self._in_flight[name], hung=self._hung[name])
+                for name, health in self.health.items()
+            }
+        }
@@ -0,0 +1,330 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future, TimeoutError
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Request priorities (lower runs first)
+PRIORITY_CRISIS = 0
+PRIORITY_CHAT = 1
+PRIORITY_INSIGHTS = 2
+
+PRIORITY_NAMES = {
+    PRIORITY_CRISIS: 'crisis',
+    PRIORITY_CHAT: 'chat',
+    PRIORITY_INSIGHTS: 'insights'
+}
+
+class SchedulerBusyError(RuntimeError):
+    """Raised when a request can't get an upstream slot (queue full or waited too long)"""
+
+class TokenBucket:
+    """Token bucket rate limiter"""
+
+    def __init__(self, rate: float, capacity: float):
+        """Initialize a full bucket
+
+        Args:
+            rate: Tokens added per second
+            capacity: Maximum tokens (burst size)
+        """
+        self.rate = rate
+        self.capacity = max(1.0, capacity)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now: float) -> float:
+        """Seconds until a token is available (0 if one is available now)"""
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate if self.rate > 0 else float('inf')
+
+    def take(self, now: float) -> None:
+        """Consume one token"""
+        self._refill(now)
+        self.tokens -= 1
+
+class _Waiter:
+    """A queued request for an upstream slot"""
+    __slots__ = ('priority', 'user_id', 'provider', 'enqueued_at', 'future')
+
+    def __init__(self, priority: int, user_id: Optional[str], provider: Optional[str]):
+        self.priority = priority
+        self.user_id = user_id
+        self.provider = provider
+        self.enqueued_at = time.monotonic()
+        self.future: Future = Future()
+
+class RequestScheduler:
+    """Priority scheduler with rate limits in front of the LLM clients
+
+    Callers wait in a priority queue for a slot before calling upstream.
+    Slots are granted highest priority first, subject to a concurrency limit
+    and token buckets per provider and per user. Crisis requests are exempt
+    from per-user limits. A request whose user or provider is throttled does
+    not hold back requests behind it that could run.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 32,
+        provider_limits: Optional[Dict[str, Tuple[float, float]]] = None,
+        user_limit: Optional[Tuple[float, float]] = None,
+        max_queue: int = 1000,
+        max_wait: float = 30.0,
+        max_tracked_users: int = 100000
+    ):
+        """Initialize the scheduler and start its dispatcher thread
+
+        Args:
+            max_concurrency: Upstream calls allowed in flight at once
+            provider_limits: Provider name -> (requests per second, burst)
+            user_limit: (requests per second, burst) applied to each user
+            max_queue: Requests allowed to wait before new ones are rejected
+            max_wait: Seconds a request may wait for a slot
+            max_tracked_users: Per-user buckets kept in memory
+        """
+        self.max_concurrency = max_concurrency
+        self.user_limit = user_limit
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.max_tracked_users = max_tracked_users
+
+        self._provider_buckets = {
+            name: TokenBucket(rate, burst) for name, (rate, burst) in (provider_limits or {}).items()
+        }
+        self._user_buckets: 'OrderedDict[str, TokenBucket]' = OrderedDict()
+
+        self._heap = []
+        self._sequence = itertools.count()
+        self._in_flight = 0
+        self._cond = threading.Condition()
+
+        # Statistics
+        self.depth = {priority: 0 for priority in PRIORITY_NAMES}
+        self.granted = {priority: 0 for priority in PRIORITY_NAMES}
+        self.rejected = 0
+        self._wait_times = {priority: deque(maxlen=500) for priority in PRIORITY_NAMES}
+
+        self._dispatcher = threading.Thread(target=self._dispatch_loop, name='llm-scheduler', daemon=True)
+        self._dispatcher.start()
+
+    def _user_bucket(self, user_id: str) -> TokenBucket:
+        """Get (or create) the bucket for a user (condition held)"""
+        bucket = self._user_buckets.get(user_id)
+        if bucket is None:
+            bucket = TokenBucket(*self.user_limit)
+            self._user_buckets[user_id] = bucket
+            while len(self._user_buckets) > self.max_tracked_users:
+                self._user_buckets.popitem(last=False)
+        else:
+            self._user_buckets.move_to_end(user_id)
+        return bucket
+
+    def _delay(self, waiter: _Waiter, now: float) -> float:
+        """Seconds until the waiter's rate limits allow it to run (condition held)"""
+        delay = 0.0
+        bucket = self._provider_buckets.get(waiter.provider)
+        if bucket is not None:
+            delay = bucket.delay(now)
+        if self.user_limit and waiter.user_id and waiter.priority != PRIORITY_CRISIS:
+            delay = max(delay, self._user_bucket(waiter.user_id).delay(now))
+        return delay
+
+    def _dispatch_loop(self):
+        """Grant slots to waiting requests in priority order"""
+        with self._cond:
+            while True:
+                if not self._heap or self._in_flight >= self.max_concurrency:
+                    self._cond.wait()
+                    continue
+
+                now = time.monotonic()
+                chosen = None
+                retry_in = None
+                skipped = []
+
+                while self._heap:
+                    entry = heapq.heappop(self._heap)
+                    waiter = entry[2]
+                    if waiter.future.cancelled():
+                        self.depth[waiter.priority] -= 1
+                        continue
+                    delay = self._delay(waiter, now)
+                    if delay == 0:
+                        chosen = waiter
+                        break
+                    skipped.append(entry)
+                    retry_in = delay if retry_in is None else min(retry_in, delay)
+
+                for entry in skipped:
+                    heapq.heappush(self._heap, entry)
+
+                if chosen is None:
+                    self._cond.wait(timeout=retry_in)
+                    continue
+
+                self.depth[chosen.priority] -= 1
+                if not chosen.future.set_running_or_notify_cancel():
+                    continue
+
+                bucket = self._provider_buckets.get(chosen.provider)
+                if bucket is not None:
+                    bucket.take(now)
+                if self.user_limit and chosen.user_id and chosen.priority != PRIORITY_CRISIS:
+                    self._user_bucket(chosen.user_id).take(now)
+
+                self._in_flight += 1
+                self.granted[chosen.priority] += 1
+                waited = now - chosen.enqueued_at
+                self._wait_times[chosen.priority].append(waited)
+                chosen.future.set_result(waited)
+
+    def _enqueue(self, priority: int, user_id: Optional[str], provider: Optional[str]) -> Future:
+        """Queue a request for a slot
+
+        Returns:
+            Future resolved with the seconds waited when the slot is granted
+        """
+        waiter = _Waiter(priority, user_id, provider)
+        with self._cond:
+            if sum(self.depth.values()) >= self.max_queue:
+                self.rejected += 1
+                raise SchedulerBusyError("Too many requests are waiting for the AI service")
+            heapq.heappush(self._heap, (priority, next(self._sequence), waiter))
+            self.depth[priority] += 1
+            self._cond.notify()
+        return waiter.future
+
+    def _release(self, _future: Any = None) -> None:
+        """Return a slot once its upstream call has finished"""
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify()
+
+    def _abandon(self, future: Future) -> None:
+        """Give up waiting; return the slot if it was granted in the meantime"""
+        if not future.cancel():
+            future.add_done_callback(self._release)
+
+    @contextmanager
+    def slot(self, priority: int = PRIORITY_CHAT, user_id: Optional[str] = None, provider: Optional[str] = None):
+        """Wait for an upstream slot (threaded callers)
+
+        Args:
+            priority: Request priority (PRIORITY_CRISIS, PRIORITY_CHAT or PRIORITY_INSIGHTS)
+            user_id: User the request is made for (None skips per-user limits)
+            provider: Provider the call will use (None skips per-provider limits)
+
+        Yields:
+            Seconds spent waiting for the slot
+        """
+        future = self._enqueue(priority, user_id, provider)
+        try:
+            waited = future.result(timeout=self.max_wait)
+        except TimeoutError:
+            self._abandon(future)
+            self.rejected += 1
+            raise SchedulerBusyError("Timed out waiting for the AI service")
+        except BaseException:
+            self._abandon(future)
+            raise
+
+        try:
+            yield waited
+        finally:
+            self._release()
+
+    @asynccontextmanager
+    async def slot_async(self, priority: int = PRIORITY_CHAT, user_id: Optional[str] = None, provider: Optional[str] = None):
+        """Wait for an upstream slot without blocking the event loop
+
+        Args:
+            priority: Request priority (PRIORITY_CRISIS, PRIORITY_CHAT or PRIORITY_INSIGHTS)
+            user_id: User the request is made for (None skips per-user limits)
+            provider: Provider the call will use (None skips per-provider limits)
+
+        Yields:
+            Seconds spent waiting for the slot
+        """
+        future = self._enqueue(priority, user_id, provider)
+        try:
+            waited = await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), timeout=self.max_wait)
+        except asyncio.TimeoutError:
+            self._abandon(future)
+            self.rejected += 1
+            raise SchedulerBusyError("Timed out waiting for the AI service")
+        except BaseException:
+            self._abandon(future)
+            raise
+
+        try:
+            yield waited
+        finally:
+            self._release()
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth and wait-time statistics
+
+        Returns:
+            Dictionary with in-flight count, rejections and per-priority depth/wait stats
+        """
+        by_priority = {}
+        for priority, name in PRIORITY_NAMES.items():
+            waits = sorted(self._wait_times[priority])
+            by_priority[name] = {
+                'queued': self.depth[priority],
+                'granted': self.granted[priority],
+                'avgWait': sum(waits) / len(waits) if waits else 0.0,
+                'p95Wait': waits[min(len(waits) - 1, int(0.95 * len(waits)))] if waits else 0.0
+            }
+
+        return {
+            'inFlight': self._in_flight,
+            'maxConcurrency': self.max_concurrency,
+            'rejected': self.rejected,
+            'priorities': by_priority
+        }
+
+def parse_rate_limit(value: str) -> Optional[Tuple[float, float]]:
+    """Parse a 'rate:burst' rate limit setting
+
+    Args:
+        value: Requests per second and burst size, e.g. '2:10' (empty disables the limit)
+
+    Returns:
+        Tuple of (rate, burst), or None
+    """
+    if not value:
+        return None
+    rate, _, burst = value.partition(':')
+    return float(rate), float(burst or rate)
+
+def parse_provider_limits(value: str) -> Dict[str, Tuple[float, float]]:
+    """Parse per-provider rate limits, e.g. 'gemini=1:5,openai=3:10'
+
+    Args:
+        value: Comma-separated provider=rate:burst entries
+
+    Returns:
+        Provider name -> (rate, burst)
+    """
+    limits = {}
+    for entry in value.split(','):
+        name, _, limit = entry.partition('=')
+        parsed = parse_rate_limit(limit.strip())
+        if name.strip() and parsed:
+            limits[name.strip().lower()] = parsed
+    return limits
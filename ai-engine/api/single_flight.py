@@ -0,0 +1,123 @@
+import asyncio
+import logging
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+class _Call:
+    """A threaded call in flight and its outcome
+
+    The event is only created once a second caller has to wait, so an
+    uncontended call costs a dict entry rather than a Future and its Condition.
+    """
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done: Optional[threading.Event] = None
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+class SingleFlight:
+    """Coalesces concurrent identical calls into one in-flight call
+
+    The first caller for a key runs the call; callers arriving with the same
+    key while it is in flight wait for that call and share its result.
+    Nothing is cached once the call completes.
+    """
+
+    def __init__(self):
+        """Initialize with no calls in flight"""
+        self._calls: Dict[Hashable, _Call] = {}
+        self._async_calls: Dict[Tuple[int, Hashable], 'asyncio.Task'] = {}
+        self._lock = threading.Lock()
+
+        # Counters
+        self.calls = 0
+        self.coalesced = 0
+
+    def do(self, key: Hashable, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run func once for all concurrent threaded callers with the same key
+
+        Args:
+            key: Hashable identity of the call
+            func: Function to run
+            *args: Positional arguments for func
+            **kwargs: Keyword arguments for func
+
+        Returns:
+            The shared result of func
+        """
+        with self._lock:
+            self.calls += 1
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.coalesced += 1
+                if call.done is None:
+                    call.done = threading.Event()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            # Waiters can only join while the call is registered, so once it
+            # is removed no new event can appear
+            with self._lock:
+                self._calls.pop(key, None)
+                done = call.done
+            if done is not None:
+                done.set()
+
+    async def do_async(self, key: Hashable, func: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        """Await func once for all concurrent async callers with the same key
+
+        Args:
+            key: Hashable identity of the call
+            func: Coroutine function to run
+            *args: Positional arguments for func
+            **kwargs: Keyword arguments for func
+
+        Returns:
+            The shared result of func
+        """
+        # Tasks belong to one event loop, so calls are only shared within a loop
+        loop_key = (id(asyncio.get_running_loop()), key)
+
+        task = self._async_calls.get(loop_key)
+        with self._lock:
+            self.calls += 1
+            if task is not None:
+                self.coalesced += 1
+
+        if task is None:
+            task = asyncio.ensure_future(func(*args, **kwargs))
+            self._async_calls[loop_key] = task
+            task.add_done_callback(lambda _: self._async_calls.pop(loop_key, None))
+
+        # A cancelled waiter must not cancel the call the others share
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict[str, Any]:
+        """Get coalescing counters
+
+        Returns:
+            Dictionary with total calls, coalesced calls and calls in flight
+        """
+        return {
+            'calls': self.calls,
+            'coalesced': self.coalesced,
+            'coalescedRate': self.coalesced / self.calls if self.calls else 0.0,
+            'inFlight': len(self._calls) + len(self._async_calls)
+        }
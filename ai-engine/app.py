@@ -1,14 +1,37 @@
 import os
-import json
+import time
 import logging
-from flask import Flask, request, jsonify
+from functools import partial
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from flask_cors import CORS
 from dotenv import load_dotenv
-import tensorflow as tf
-import numpy as np
 from utils.emotion_detector import EmotionDetector
+from utils.emotion_classifier import TransformerEmotionDetector, DEFAULT_EMOTION_MODEL
+from utils.model_registry import model_registry
 from utils.text_processor import TextProcessor
+from utils.text_analysis import TextAnalyzer, TextAnalysis
+from utils.analysis_pool import AnalysisPool
+from utils.sentiment_cascade import SentimentCascade
+from utils.prompt_builder import (
+    build_system_message, format_chat_history, build_insights_prompt, format_insights_prompt, INSIGHTS_PROMPT_VERSION
+)
+from utils.insight_aggregates import InsightAggregateStore, AggregateResyncError
+from utils.response_cache import ResponseCache
+from utils.semantic_cache import SemanticCache, SentenceEmbedder, DEFAULT_EMBEDDING_MODEL, is_context_independent
+from utils.knowledge_index import KnowledgeIndex, KnowledgeHit
+from utils.history_compactor import HistoryCompactor, count_tokens
+from utils.conversation_store import ConversationStore, ConversationResyncError, ChatMessage
+from utils.metrics import metrics, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from utils.sse import format_sse, SSE_HEADERS
 from api.gemini_client import GeminiClient
+from api.provider_router import ProviderRouter
+from api.cassette import CassetteClient, CassetteStore, MISS_ERROR
+from api.request_scheduler import (
+    RequestScheduler, SchedulerBusyError, PRIORITY_CRISIS, PRIORITY_CHAT, PRIORITY_INSIGHTS,
+    parse_rate_limit, parse_provider_limits
+)
+from api.prompts import FALLBACK_CHAT_RESPONSE, FALLBACK_COMPLETION
 
 # Load environment variables
 load_dotenv()
@@ -24,15 +47,517 @@ logger = logging.getLogger(__name__)
 app = Flask(__name__)
 CORS(app)
 
-# Initialize Gemini client
-ai_client = GeminiClient(api_key=os.getenv('GEMINI_API_KEY'))
+def build_provider_client():
+    """Build the LLM client from LLM_PROVIDERS
+
+    A single provider is used directly. Several providers (e.g. 'gemini,openai')
+    are wrapped in a ProviderRouter that fails over between them in that order.
+    """
+    names = [name.strip().lower() for name in os.getenv('LLM_PROVIDERS', 'gemini').split(',') if name.strip()]
+    if names == ['gemini']:
+        return GeminiClient(api_key=os.getenv('GEMINI_API_KEY'))
+
+    providers = []
+    for name in names:
+        if name == 'gemini':
+            providers.append((name, GeminiClient(api_key=os.getenv('GEMINI_API_KEY'), raise_errors=True)))
+        elif name == 'openai':
+            from api.openai_client import OpenAIClient
+            providers.append((name, OpenAIClient(api_key=os.getenv('OPENAI_API_KEY'), raise_errors=True)))
+        else:
+            raise ValueError(f"Unknown LLM provider: {name}")
+
+    return ProviderRouter(
+        providers,
+        timeout=float(os.getenv('LLM_TIMEOUT_SECONDS', 15)),
+        cooldown=float(os.getenv('LLM_CIRCUIT_COOLDOWN_SECONDS', 30)),
+        hedge=os.getenv('LLM_HEDGE_REQUESTS', 'False').lower() == 'true'
+    )
+
+def build_ai_client():
+    """Build the LLM client, wrapped in a cassette when LLM_CASSETTE_MODE is set
+
+    'record' writes every upstream call to LLM_CASSETTE_PATH; 'replay' serves
+    the recorded responses without contacting (or configuring) any provider.
+    A replayed request that was never recorded fails unless
+    LLM_CASSETTE_ON_MISS=any, which serves another recording of the same method.
+    """
+    mode = os.getenv('LLM_CASSETTE_MODE', '').lower()
+    if not mode:
+        return build_provider_client()
+
+    return CassetteClient(
+        build_provider_client() if mode == 'record' else None,
+        CassetteStore(os.getenv('LLM_CASSETTE_PATH', 'llm_cassette.sqlite3')),
+        mode=mode,
+        reproduce_latency=os.getenv('LLM_CASSETTE_REPLAY_LATENCY', 'False').lower() == 'true',
+        latency_scale=float(os.getenv('LLM_CASSETTE_LATENCY_SCALE', 1.0)),
+        on_miss=os.getenv('LLM_CASSETTE_ON_MISS', MISS_ERROR).lower()
+    )
+
+# Initialize LLM client
+ai_client = build_ai_client()
+
+# Upstream calls wait here for a slot; distress messages are served first and
+# per-provider and per-user token buckets keep us inside rate limits
+request_scheduler = RequestScheduler(
+    max_concurrency=int(os.getenv('LLM_MAX_CONCURRENCY', 32)),
+    provider_limits=parse_provider_limits(os.getenv('LLM_PROVIDER_RATE_LIMITS', '')),
+    user_limit=parse_rate_limit(os.getenv('LLM_USER_RATE_LIMIT', '')),
+    max_queue=int(os.getenv('LLM_QUEUE_SIZE', 1000)),
+    max_wait=float(os.getenv('LLM_QUEUE_MAX_WAIT_SECONDS', 30))
+)
 
-# Initialize emotion detector
-emotion_detector = EmotionDetector()
+# Initialize emotion detector (EMOTION_BACKEND=transformer adds the local
+# classifier on top of the keyword detector, which stays as the fallback)
+keyword_emotion_detector = EmotionDetector()
+if os.getenv('EMOTION_BACKEND', 'keyword').lower() == 'transformer':
+    emotion_detector = TransformerEmotionDetector(
+        fallback=keyword_emotion_detector,
+        model_name=os.getenv('EMOTION_MODEL', DEFAULT_EMOTION_MODEL),
+        max_batch_size=int(os.getenv('EMOTION_MAX_BATCH_SIZE', 32)),
+        max_wait_ms=float(os.getenv('EMOTION_MAX_WAIT_MS', 5)),
+        timeout=float(os.getenv('EMOTION_TIMEOUT_SECONDS', 2))
+    )
+else:
+    emotion_detector = keyword_emotion_detector
 
 # Initialize text processor
 text_processor = TextProcessor()
 
+# Emotion, distress, abbreviation expansion and keywords from one scan per message
+text_analyzer = TextAnalyzer(keyword_emotion_detector, text_processor)
+
+# Sentiment comes from the keyword detector unless its calibrated confidence is
+# below the threshold, in which case the LLM is asked
+sentiment_cascade = SentimentCascade.from_calibration(
+    keyword_emotion_detector,
+    os.getenv('SENTIMENT_CALIBRATION_PATH') or None,
+    threshold=float(os.getenv('SENTIMENT_CONFIDENCE_THRESHOLD', 0.7))
+)
+
+# ANALYSIS_WORKERS > 0 moves keyword analysis into worker processes so it scales
+# with cores instead of sharing the GIL with request handling. The workers fork
+# from a forkserver that builds the lexicons and matchers (utils/analysis_tasks.py)
+# once and shares them copy-on-write.
+ANALYSIS_WORKERS = int(os.getenv('ANALYSIS_WORKERS', 0))
+# Shorter texts are analyzed in-process: a round trip to a worker costs the
+# server process more CPU than analyzing a typical chat message itself
+ANALYSIS_MIN_TEXT_LENGTH = int(os.getenv('ANALYSIS_MIN_TEXT_LENGTH', 1000))
+if ANALYSIS_WORKERS > 0:
+    analysis_pool = AnalysisPool(ANALYSIS_WORKERS, min_chunk_size=int(os.getenv('ANALYSIS_MIN_CHUNK_SIZE', 64)))
+else:
+    analysis_pool = None
+
+# Knowledge base passages retrieved into the chat prompt. The index file is
+# memory-mapped, so workers share it through the page cache; it is opened on
+# first use like the other registry backends.
+KNOWLEDGE_INDEX_PATH = os.getenv('KNOWLEDGE_INDEX_PATH')
+KNOWLEDGE_TOP_K = int(os.getenv('KNOWLEDGE_TOP_K', 3))
+KNOWLEDGE_MIN_SCORE = float(os.getenv('KNOWLEDGE_MIN_SCORE', 2.0))
+if KNOWLEDGE_INDEX_PATH:
+    model_registry.register('knowledge_index', lambda: KnowledgeIndex(KNOWLEDGE_INDEX_PATH))
+
+# Heavy ML backends are imported on first use through the model registry.
+# AI_ENGINE_PRELOAD (comma-separated names) loads them at import time instead,
+# so a pre-forking server (gunicorn --preload) shares them with its workers.
+preload_backends = [name.strip() for name in os.getenv('AI_ENGINE_PRELOAD', '').split(',') if name.strip()]
+if preload_backends:
+    model_registry.preload(preload_backends)
+
+# Chat history is compacted to fit this token budget; older turns become a rolling summary
+history_compactor = HistoryCompactor(
+    token_budget=int(os.getenv('CHAT_TOKEN_BUDGET', 3000)),
+    summary_token_budget=int(os.getenv('CHAT_SUMMARY_TOKEN_BUDGET', 400)),
+    text_processor=text_processor
+)
+
+# Chat history kept server-side per session, so clients only send new messages
+conversation_store = ConversationStore(
+    max_conversations=int(os.getenv('CONVERSATION_STORE_SIZE', 10000)),
+    idle_seconds=float(os.getenv('CONVERSATION_IDLE_SECONDS', 1800)),
+    max_messages=int(os.getenv('CONVERSATION_MAX_MESSAGES', 200))
+)
+
+# Cache for generated insights, keyed on the normalized input and prompt version
+insights_cache = ResponseCache(
+    max_entries=int(os.getenv('INSIGHTS_CACHE_SIZE', 512)),
+    ttl_seconds=float(os.getenv('INSIGHTS_CACHE_TTL_SECONDS', 6 * 3600)),
+    disk_path=os.getenv('INSIGHTS_CACHE_PATH') or None
+)
+
+# Answers to general FAQ-style questions, looked up by embedding similarity
+# (SEMANTIC_CACHE_ENABLED=True loads a local CPU sentence embedding model on first use)
+if os.getenv('SEMANTIC_CACHE_ENABLED', 'False').lower() == 'true':
+    semantic_cache = SemanticCache(
+        SentenceEmbedder(
+            model_name=os.getenv('SEMANTIC_CACHE_MODEL', DEFAULT_EMBEDDING_MODEL),
+            max_batch_size=int(os.getenv('SEMANTIC_CACHE_MAX_BATCH_SIZE', 32)),
+            max_wait_ms=float(os.getenv('SEMANTIC_CACHE_MAX_WAIT_MS', 5))
+        ),
+        max_entries=int(os.getenv('SEMANTIC_CACHE_SIZE', 1000)),
+        threshold=float(os.getenv('SEMANTIC_CACHE_THRESHOLD', 0.92)),
+        timeout=float(os.getenv('SEMANTIC_CACHE_TIMEOUT_SECONDS', 1))
+    )
+else:
+    semantic_cache = None
+
+# Per-user running insight statistics, so insight requests only need to send new events
+insight_aggregates = InsightAggregateStore(
+    os.getenv('INSIGHTS_AGGREGATE_PATH', 'insight_aggregates.sqlite3'),
+    max_cached=int(os.getenv('INSIGHTS_AGGREGATE_CACHE_SIZE', 1024))
+)
+
+# Maximum number of texts accepted by the batch emotion endpoint
+EMOTION_BATCH_MAX_TEXTS = int(os.getenv('EMOTION_BATCH_MAX_TEXTS', 10000))
+
+# Longest draft accepted by the distress WebSocket (asgi.py)
+DISTRESS_STREAM_MAX_LENGTH = int(os.getenv('DISTRESS_STREAM_MAX_LENGTH', 10000))
+
+# Returned with 503 when the scheduler can't get a request an upstream slot
+BUSY_ERROR = 'The AI service is busy, please try again shortly'
+
+def analyze_text(text: str) -> TextAnalysis:
+    """Single-pass analysis of a message, in the analysis pool when enabled and the text is long"""
+    if analysis_pool is not None and len(text) >= ANALYSIS_MIN_TEXT_LENGTH:
+        return analysis_pool.run('text_analysis', text)
+    return text_analyzer.analyze(text)
+
+def detect_emotion(text: str) -> Tuple[str, int]:
+    """Emotion and distress level of a text
+
+    Keyword detection of long texts runs in the analysis pool when enabled.
+    The transformer classifier stays in-process, where its micro-batcher can
+    group requests.
+    """
+    if analysis_pool is not None and emotion_detector is keyword_emotion_detector and len(text) >= ANALYSIS_MIN_TEXT_LENGTH:
+        return analysis_pool.run('keyword_emotion', text)
+    return emotion_detector.detect_emotion_and_distress(text)
+
+def detect_emotion_batch(texts: List[str]) -> List[Tuple[str, int]]:
+    """Emotion and distress levels of many texts, split across the analysis pool when enabled"""
+    if analysis_pool is not None and emotion_detector is keyword_emotion_detector:
+        return analysis_pool.map('keyword_emotion_batch', texts)
+    return emotion_detector.detect_batch(texts)
+
+def schedule_for(data: Dict[str, Any], priority: int) -> Dict[str, Any]:
+    """Scheduler arguments for an upstream call made on behalf of a request
+
+    Args:
+        data: Request payload (an optional 'userId' enables per-user rate limits)
+        priority: Request priority
+
+    Returns:
+        Keyword arguments for request_scheduler.slot / slot_async
+    """
+    preferred_provider = getattr(ai_client, 'preferred_provider', None)
+    return {
+        'priority': priority,
+        'user_id': data.get('userId'),
+        'provider': preferred_provider() if preferred_provider else 'gemini'
+    }
+
+def chat_priority(distress_level: int) -> int:
+    """Messages in distress go ahead of normal chat and insights"""
+    return PRIORITY_CRISIS if distress_level >= 7 else PRIORITY_CHAT
+
+# Instrumentation exported at /metrics
+REQUEST_SECONDS = metrics.histogram(
+    'ai_engine_request_seconds', 'Request latency by endpoint (time to first byte for streams)', ['endpoint']
+)
+REQUESTS = metrics.counter('ai_engine_requests_total', 'Requests by endpoint, method and status', ['endpoint', 'method', 'status'])
+ERRORS = metrics.counter('ai_engine_errors_total', 'Failed requests and failed streams by endpoint', ['endpoint'])
+STAGE_SECONDS = metrics.histogram('ai_engine_stage_seconds', 'Latency of each processing stage', ['stage'])
+LLM_TOKENS = metrics.counter(
+    'ai_engine_llm_tokens_total', 'Approximate tokens sent to and received from the LLM', ['operation', 'direction']
+)
+LLM_FALLBACKS = metrics.counter('ai_engine_llm_fallbacks_total', 'Fallback responses returned instead of LLM output', ['operation'])
+TOKENS_SAVED = metrics.counter('ai_engine_history_tokens_saved_total', 'Prompt tokens saved by history compaction')
+
+def record_request(endpoint: str, method: str, status: int, seconds: float) -> None:
+    """Record latency and outcome of one request"""
+    REQUEST_SECONDS.observe(seconds, endpoint)
+    REQUESTS.inc(1, endpoint, method, str(status))
+    if status >= 500:
+        ERRORS.inc(1, endpoint)
+
+def record_llm_tokens(operation: str, prompt_parts: Iterable[str], response: str) -> None:
+    """Record approximate prompt and response token counts for an LLM call"""
+    LLM_TOKENS.inc(sum(count_tokens(part) for part in prompt_parts), operation, 'prompt')
+    LLM_TOKENS.inc(count_tokens(response), operation, 'response')
+
+def collect_component_metrics():
+    """Read the counters kept by the caches, conversation store, coalescing, scheduler, router and analysis pool"""
+    cache = insights_cache.stats()
+    yield ('ai_engine_insights_cache_lookups_total', 'counter', 'Insights cache lookups by result', [
+        ({'result': 'hit'}, cache['hits']),
+        ({'result': 'disk_hit'}, cache['diskHits']),
+        ({'result': 'miss'}, cache['misses'])
+    ])
+    yield ('ai_engine_insights_cache_hit_ratio', 'gauge', 'Share of insights cache lookups served from cache', [({}, cache['hitRate'])])
+    yield ('ai_engine_insights_cache_entries', 'gauge', 'Entries in the in-memory insights cache', [({}, cache['size'])])
+    yield ('ai_engine_insights_cache_evictions_total', 'counter', 'Insights cache evictions', [({}, cache['evictions'])])
+
+    if semantic_cache is not None:
+        semantic = semantic_cache.stats()
+        yield ('ai_engine_semantic_cache_lookups_total', 'counter', 'Semantic cache lookups by result', [
+            ({'result': 'hit'}, semantic['hits']),
+            ({'result': 'miss'}, semantic['misses'])
+        ])
+        yield ('ai_engine_semantic_cache_entries', 'gauge', 'Answers in the semantic cache', [({}, semantic['size'])])
+
+    if analysis_pool is not None:
+        pool = analysis_pool.stats()
+        yield ('ai_engine_analysis_pool_tasks_total', 'counter', 'Analysis tasks sent to worker processes', [({}, pool['tasks'])])
+        yield ('ai_engine_analysis_pool_fallbacks_total', 'counter', 'Analysis tasks run in-process after the pool broke', [({}, pool['fallbacks'])])
+
+    sentiment = sentiment_cascade.stats()
+    yield ('ai_engine_sentiment_requests_total', 'counter', 'Sentiment analyses by the stage that answered', [
+        ({'source': 'local'}, sentiment['local'] + sentiment['llmFailed']),
+        ({'source': 'llm'}, sentiment['escalated'] - sentiment['llmFailed'])
+    ])
+    yield ('ai_engine_sentiment_escalation_ratio', 'gauge', 'Share of sentiment analyses escalated to the LLM', [({}, sentiment['escalationRate'])])
+
+    conversations = conversation_store.stats()
+    yield ('ai_engine_conversations', 'gauge', 'Chat sessions held in the conversation store', [({}, conversations['conversations'])])
+    yield ('ai_engine_conversation_resyncs_total', 'counter', 'Chat requests that had to resend the full history', [({}, conversations['resyncs'])])
+    yield ('ai_engine_conversation_evictions_total', 'counter', 'Idle or least recently used chat sessions evicted', [({}, conversations['evictions'])])
+
+    aggregates = insight_aggregates.stats()
+    yield ('ai_engine_insight_aggregate_updates_total', 'counter', 'Deltas folded into per-user insight aggregates', [({}, aggregates['updates'])])
+    yield ('ai_engine_insight_aggregate_resyncs_total', 'counter', 'Deltas rejected because the full history was needed', [({}, aggregates['resyncs'])])
+
+    coalescing = ai_client.single_flight.stats()
+    yield ('ai_engine_llm_calls_total', 'counter', 'LLM calls made through single-flight', [({}, coalescing['calls'])])
+    yield ('ai_engine_llm_coalesced_calls_total', 'counter', 'LLM calls served by an identical in-flight call', [({}, coalescing['coalesced'])])
+
+    scheduler = request_scheduler.stats()
+    priorities = scheduler['priorities']
+    yield ('ai_engine_scheduler_in_flight', 'gauge', 'Upstream calls holding a scheduler slot', [({}, scheduler['inFlight'])])
+    yield ('ai_engine_scheduler_rejected_total', 'counter', 'Requests rejected by the scheduler', [({}, scheduler['rejected'])])
+    yield ('ai_engine_scheduler_queued', 'gauge', 'Requests waiting for a slot by priority',
+           [({'priority': name}, stats['queued']) for name, stats in priorities.items()])
+    yield ('ai_engine_scheduler_granted_total', 'counter', 'Slots granted by priority',
+           [({'priority': name}, stats['granted']) for name, stats in priorities.items()])
+    yield ('ai_engine_scheduler_wait_p95_seconds', 'gauge', 'Recent p95 wait for a slot by priority',
+           [({'priority': name}, stats['p95Wait']) for name, stats in priorities.items()])
+
+    if isinstance(ai_client, CassetteClient):
+        cassette = ai_client.stats()
+        yield ('ai_engine_cassette_calls_total', 'counter', 'LLM calls recorded to or replayed from the cassette', [
+            ({'result': 'recorded'}, cassette['recorded']),
+            ({'result': 'replayed'}, cassette['replayed']),
+            ({'result': 'miss'}, cassette['misses'])
+        ])
+
+    if isinstance(ai_client, ProviderRouter):
+        routing = ai_client.stats()
+        providers = routing['providers']
+        yield ('ai_engine_router_failovers_total', 'counter', 'Calls that failed over to another provider', [({}, routing['failovers'])])
+        yield ('ai_engine_router_hedged_total', 'counter', 'Hedged requests sent', [({}, routing['hedged'])])
+        yield ('ai_engine_router_exhausted_total', 'counter', 'Calls where every provider failed', [({}, routing['exhausted'])])
+        yield ('ai_engine_provider_circuit_open', 'gauge', 'Whether the provider circuit is open (1) or not (0)',
+               [({'provider': name}, int(health['state'] == 'open')) for name, health in providers.items()])
+        yield ('ai_engine_provider_error_rate', 'gauge', 'Recent provider error rate',
+               [({'provider': name}, health['errorRate']) for name, health in providers.items()])
+        yield ('ai_engine_provider_latency_p95_seconds', 'gauge', 'Recent provider p95 latency',
+               [({'provider': name}, health['p95']) for name, health in providers.items() if health['p95'] is not None])
+
+metrics.register_collector(collect_component_metrics)
+
+def prepare_insights(data: Dict[str, Any]) -> Tuple[str, Callable[[], str], Optional[int]]:
+    """Cache key and prompt builder for an insights request
+
+    With 'userId' and 'delta' the new events are folded into the user's stored
+    aggregate at the client's 'version' ('reset' replaces it with the delta as
+    the full history) and the key covers the resulting summary. Otherwise the
+    full history in the request is summarized.
+
+    Args:
+        data: Insights request payload
+
+    Returns:
+        Cache key, a function that builds the prompt and the new aggregate
+        version (None without a delta)
+
+    Raises:
+        AggregateResyncError: If the delta can't be applied to the stored aggregate
+    """
+    if 'delta' in data:
+        delta = data['delta']
+        with STAGE_SECONDS.time('insights_aggregate_update'):
+            summary, version = insight_aggregates.apply(
+                str(data['userId']),
+                delta.get('cycles', []),
+                delta.get('symptoms', []),
+                delta.get('medications', []),
+                reset=bool(data.get('reset')),
+                version=data.get('version')
+            )
+        return (
+            ResponseCache.make_key('insights-summary', INSIGHTS_PROMPT_VERSION, summary),
+            partial(format_insights_prompt, summary),
+            version
+        )
+
+    cycles = data.get('cycles', [])
+    symptoms = data.get('symptoms', [])
+    medications = data.get('medications', [])
+    return (
+        ResponseCache.make_key('insights', INSIGHTS_PROMPT_VERSION, cycles, symptoms, medications),
+        partial(build_insights_prompt, cycles, symptoms, medications),
+        None
+    )
+
+def is_valid_insights_delta(data: Dict[str, Any]) -> bool:
+    """Incremental requests need a user id, a delta object and (unless resetting) a version"""
+    if 'delta' not in data:
+        return True
+    version = data.get('version')
+    has_version = isinstance(version, int) and not isinstance(version, bool)
+    return bool(data.get('userId')) and isinstance(data['delta'], dict) and (bool(data.get('reset')) or has_version)
+
+class PreparedChat(NamedTuple):
+    """Analysis results and prompt parts for one chat request"""
+    emotion: str
+    distress_level: int
+    system_message: str
+    user_message: str
+    history: List[Dict[str, str]]
+    tokens_saved: int
+    question_vector: Any = None  # set for FAQ questions eligible for the semantic cache
+    cached_response: Optional[str] = None
+    session_id: Optional[str] = None  # set when the conversation is kept in the conversation store
+    version: Optional[int] = None
+
+    def prompt_parts(self) -> List[str]:
+        """Text sent to the LLM for this chat"""
+        return [self.system_message, self.user_message] + [msg['content'] for msg in self.history]
+
+def prepare_chat(data: Dict[str, Any]) -> PreparedChat:
+    """Analyze a chat request and build the prompt parts for the LLM
+
+    With a 'sessionId' the history is kept in the conversation store: a request
+    with a 'version' continues the stored conversation, one without starts it
+    from 'history' (the full history, or none for a new session).
+
+    Args:
+        data: Chat request payload with 'message' and optional 'context', 'history', 'sessionId' and 'version'
+
+    Returns:
+        PreparedChat for the request
+
+    Raises:
+        ConversationResyncError: If the stored conversation isn't at the client's version
+    """
+    user_message = data['message']
+    context = data.get('context', {})
+    session_id = data.get('sessionId')
+    version = None
+
+    with STAGE_SECONDS.time('conversation_load'):
+        if not session_id:
+            chat_history = format_chat_history(data.get('history', []))
+        elif data.get('version') is not None and 'history' not in data:
+            session_id, version = str(session_id), int(data['version'])
+            chat_history = conversation_store.get(session_id, version)
+        else:
+            session_id = str(session_id)
+            version = conversation_store.reset(session_id, data.get('history', []))
+            chat_history = conversation_store.get(session_id, version)
+
+    # Detect emotion and distress and preprocess the message in one pass
+    with STAGE_SECONDS.time('text_analysis'):
+        analysis = analyze_text(user_message)
+    emotion, distress_level = analysis.emotion, analysis.distress_level
+    processed_message = analysis.processed_text
+
+    # The transformer backend classifies emotion itself
+    if emotion_detector is not keyword_emotion_detector:
+        with STAGE_SECONDS.time('emotion_detection'):
+            emotion, distress_level = emotion_detector.detect_emotion_and_distress(user_message)
+
+    # General questions can be answered from the semantic cache. They are asked
+    # without the user's context and history so the answer can be shared.
+    question_vector, cached_response = None, None
+    if semantic_cache is not None and distress_level < 7 and is_context_independent(user_message):
+        with STAGE_SECONDS.time('semantic_cache_lookup'):
+            question_vector = semantic_cache.embed(processed_message)
+            if question_vector is not None:
+                cached_response = semantic_cache.get(question_vector)
+        if question_vector is not None:
+            context, chat_history = {}, []
+
+    with STAGE_SECONDS.time('knowledge_retrieval'):
+        knowledge = retrieve_knowledge(processed_message)
+
+    # Prepare context and history for Gemini, compacted to the token budget
+    with STAGE_SECONDS.time('prompt_build'):
+        prompt = history_compactor.compact(
+            build_system_message(context, knowledge),
+            processed_message,
+            chat_history,
+            session_id
+        )
+    TOKENS_SAVED.inc(prompt.tokens_saved)
+
+    return PreparedChat(
+        emotion=emotion,
+        distress_level=distress_level,
+        system_message=prompt.system_message,
+        user_message=processed_message,
+        # Only the kept turns become dicts for the LLM clients
+        history=[message.to_dict() if isinstance(message, ChatMessage) else message for message in prompt.history],
+        tokens_saved=prompt.tokens_saved,
+        question_vector=question_vector,
+        cached_response=cached_response,
+        session_id=session_id,
+        version=version
+    )
+
+def retrieve_knowledge(text: str) -> List[KnowledgeHit]:
+    """Knowledge base passages relevant to a message (none if the index is missing or fails)"""
+    if not KNOWLEDGE_INDEX_PATH:
+        return []
+    try:
+        return model_registry.get('knowledge_index').search(text, KNOWLEDGE_TOP_K, KNOWLEDGE_MIN_SCORE)
+    except Exception as e:
+        logger.error(f"Error retrieving knowledge passages: {str(e)}")
+        return []
+
+def remember_answer(chat_request: PreparedChat, response: str) -> None:
+    """Add the answer to an eligible FAQ question to the semantic cache"""
+    if chat_request.question_vector is not None and response != FALLBACK_CHAT_RESPONSE:
+        semantic_cache.set(chat_request.question_vector, chat_request.user_message, response)
+
+def record_turn(chat_request: PreparedChat, response: str) -> Optional[int]:
+    """Add the exchange to the stored conversation and return its new version (None if not stored)"""
+    if chat_request.version is None:
+        return None
+    try:
+        return conversation_store.append(
+            chat_request.session_id,
+            chat_request.version,
+            [ChatMessage('user', chat_request.user_message), ChatMessage('assistant', response)]
+        )
+    except ConversationResyncError as e:
+        logger.warning(f"Conversation not updated: {str(e)}")
+        return None
+
+@app.before_request
+def start_request_timer():
+    """Remember when the request started"""
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    """Record request latency and status"""
+    started = g.get('request_started')
+    if started is not None:
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        record_request(endpoint, request.method, response.status_code, time.perf_counter() - started)
+    return response
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
@@ -53,54 +578,65 @@ def chat():
                 'error': 'Message is required'
             }), 400
 
-        user_message = data['message']
-        context = data.get('context', {})
-        chat_history = data.get('history', [])
-
-        # Detect emotion in user message
-        emotion = emotion_detector.detect_emotion(user_message)
-        distress_level = emotion_detector.detect_distress_level(user_message)
-
-        # Process user message
-        processed_message = text_processor.preprocess(user_message)
-
-        # Prepare context for Gemini
-        system_message = f"""You are Anaira, an empathetic AI companion for FertilityNest, a fertility support app.
-        The user is on a {context.get('userJourneyType', 'fertility')} journey and is currently in the {context.get('fertilityStage', 'unknown')} stage.
-        {f"They are on day {context.get('cycleDay')} of their cycle." if context.get('cycleDay') else ''}
-        {f"They recently experienced these symptoms: {', '.join(context.get('recentSymptoms'))}." if context.get('recentSymptoms') else ''}
-        {f"They are taking these medications: {', '.join(context.get('recentMedications'))}." if context.get('recentMedications') else ''}
-
-        Be compassionate, informative, and supportive. Provide evidence-based information when possible, but clarify you're not a medical professional.
-        If the user seems distressed, offer support and suggest they speak with a healthcare provider."""
-
-        # Format chat history for Gemini
-        formatted_history = []
-        for msg in chat_history:
-            role = 'user' if msg['sender'] == 'user' else 'assistant'
-            formatted_history.append({
-                'role': role,
-                'content': msg['content']
+        chat_request = prepare_chat(data)
+
+        # FAQ questions answered before are served without calling Gemini
+        if chat_request.cached_response is not None:
+            return jsonify({
+                'success': True,
+                'response': chat_request.cached_response,
+                'emotion': chat_request.emotion,
+                'distressLevel': chat_request.distress_level,
+                'distressDetected': chat_request.distress_level >= 7,
+                'tokensSaved': chat_request.tokens_saved,
+                'cached': True,
+                'version': record_turn(chat_request, chat_request.cached_response)
             })
 
         # Get AI response
-        ai_response = ai_client.get_chat_response(
-            system_message=system_message,
-            user_message=processed_message,
-            chat_history=formatted_history
-        )
+        with request_scheduler.slot(**schedule_for(data, chat_priority(chat_request.distress_level))) as waited:
+            STAGE_SECONDS.observe(waited, 'queue_wait')
+            with STAGE_SECONDS.time('llm_chat'):
+                ai_response = ai_client.get_chat_response(
+                    system_message=chat_request.system_message,
+                    user_message=chat_request.user_message,
+                    chat_history=chat_request.history
+                )
+
+        record_llm_tokens('chat', chat_request.prompt_parts(), ai_response)
+        if ai_response == FALLBACK_CHAT_RESPONSE:
+            LLM_FALLBACKS.inc(1, 'chat')
+        remember_answer(chat_request, ai_response)
 
         # Prepare response
         response = {
             'success': True,
             'response': ai_response,
-            'emotion': emotion,
-            'distressLevel': distress_level,
-            'distressDetected': distress_level >= 7
+            'emotion': chat_request.emotion,
+            'distressLevel': chat_request.distress_level,
+            'distressDetected': chat_request.distress_level >= 7,
+            'tokensSaved': chat_request.tokens_saved,
+            'cached': False,
+            'version': record_turn(chat_request, ai_response)
         }
 
         return jsonify(response)
 
+    except ConversationResyncError as e:
+        logger.warning(f"Chat conversation needs a resync: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': 'Conversation is out of date, resend the full history',
+            'resync': True
+        }), 409
+
+    except SchedulerBusyError as e:
+        logger.warning(f"Rejected chat request: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': BUSY_ERROR
+        }), 503
+
     except Exception as e:
         logger.error(f"Error in chat endpoint: {str(e)}")
         return jsonify({
@@ -108,6 +644,90 @@ def chat():
             'error': str(e)
         }), 500
 
+@app.route('/api/chat/stream', methods=['POST'])
+def chat_stream():
+    """Streaming chat endpoint that forwards the AI response as server-sent events
+
+    The first event ('analysis') carries the emotion and distress result, then
+    'token' events carry response text as it arrives and 'done' carries the
+    full response.
+    """
+    try:
+        data = request.json
+
+        if not data or 'message' not in data:
+            return jsonify({
+                'success': False,
+                'error': 'Message is required'
+            }), 400
+
+        chat_request = prepare_chat(data)
+
+    except ConversationResyncError as e:
+        logger.warning(f"Chat conversation needs a resync: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': 'Conversation is out of date, resend the full history',
+            'resync': True
+        }), 409
+
+    except Exception as e:
+        logger.error(f"Error in chat stream endpoint: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+    def generate():
+        yield format_sse('analysis', {
+            'emotion': chat_request.emotion,
+            'distressLevel': chat_request.distress_level,
+            'distressDetected': chat_request.distress_level >= 7,
+            'tokensSaved': chat_request.tokens_saved
+        })
+
+        if chat_request.cached_response is not None:
+            yield format_sse('token', {'text': chat_request.cached_response})
+            yield format_sse('done', {
+                'response': chat_request.cached_response,
+                'cached': True,
+                'version': record_turn(chat_request, chat_request.cached_response)
+            })
+            return
+
+        chunks = []
+        try:
+            with request_scheduler.slot(**schedule_for(data, chat_priority(chat_request.distress_level))) as waited:
+                STAGE_SECONDS.observe(waited, 'queue_wait')
+                started = time.perf_counter()
+                for chunk in ai_client.stream_chat_response(
+                    system_message=chat_request.system_message,
+                    user_message=chat_request.user_message,
+                    chat_history=chat_request.history
+                ):
+                    if not chunks:
+                        STAGE_SECONDS.observe(time.perf_counter() - started, 'llm_stream_first_token')
+                    chunks.append(chunk)
+                    yield format_sse('token', {'text': chunk})
+                STAGE_SECONDS.observe(time.perf_counter() - started, 'llm_stream')
+
+            ai_response = ''.join(chunks)
+            record_llm_tokens('chat_stream', chat_request.prompt_parts(), ai_response)
+            remember_answer(chat_request, ai_response)
+            yield format_sse('done', {'response': ai_response, 'cached': False, 'version': record_turn(chat_request, ai_response)})
+
+        except SchedulerBusyError as e:
+            logger.warning(f"Rejected chat stream request: {str(e)}")
+            ERRORS.inc(1, '/api/chat/stream')
+            yield format_sse('error', {'error': BUSY_ERROR})
+
+        except Exception as e:
+            logger.error(f"Error streaming chat response: {str(e)}")
+            ERRORS.inc(1, '/api/chat/stream')
+            yield format_sse('error', {'error': str(e)})
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers=SSE_HEADERS)
+
 @app.route('/api/analyze-emotion', methods=['POST'])
 def analyze_emotion():
     """Analyze emotion in text"""
@@ -123,8 +743,8 @@ def analyze_emotion():
         text = data['text']
 
         # Detect emotion
-        emotion = emotion_detector.detect_emotion(text)
-        distress_level = emotion_detector.detect_distress_level(text)
+        with STAGE_SECONDS.time('emotion_detection'):
+            emotion, distress_level = detect_emotion(text)
 
         return jsonify({
             'success': True,
@@ -140,6 +760,98 @@ def analyze_emotion():
             'error': str(e)
         }), 500
 
+@app.route('/api/analyze-sentiment', methods=['POST'])
+def analyze_sentiment():
+    """Analyze sentiment locally, asking the LLM only when the keyword detector is unsure"""
+    try:
+        data = request.json
+
+        if not data or 'text' not in data:
+            return jsonify({
+                'success': False,
+                'error': 'Text is required'
+            }), 400
+
+        text = data['text']
+
+        with STAGE_SECONDS.time('sentiment_local'):
+            local = sentiment_cascade.classify(text)
+
+        llm_result = None
+        if sentiment_cascade.needs_llm(local):
+            try:
+                with request_scheduler.slot(**schedule_for(data, chat_priority(local.distress_level))) as waited:
+                    STAGE_SECONDS.observe(waited, 'queue_wait')
+                    with STAGE_SECONDS.time('llm_sentiment'):
+                        llm_result = ai_client.analyze_sentiment(text)
+            except SchedulerBusyError as e:
+                # The local answer is better than none
+                logger.warning(f"Answering sentiment locally, scheduler busy: {str(e)}")
+
+        result = sentiment_cascade.result(local, llm_result)
+
+        return jsonify({
+            'success': True,
+            **result,
+            'distressDetected': result['distressLevel'] >= 7
+        })
+
+    except Exception as e:
+        logger.error(f"Error in analyze-sentiment endpoint: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/api/analyze-emotion/batch', methods=['POST'])
+def analyze_emotion_batch():
+    """Analyze emotion in a batch of texts (used for backfills)"""
+    try:
+        data = request.json
+
+        if not data or not isinstance(data.get('texts'), list):
+            return jsonify({
+                'success': False,
+                'error': 'Texts must be a list'
+            }), 400
+
+        texts = data['texts']
+
+        if len(texts) > EMOTION_BATCH_MAX_TEXTS:
+            return jsonify({
+                'success': False,
+                'error': f'At most {EMOTION_BATCH_MAX_TEXTS} texts are allowed per batch'
+            }), 413
+
+        if not all(isinstance(text, str) for text in texts):
+            return jsonify({
+                'success': False,
+                'error': 'Every text must be a string'
+            }), 400
+
+        # Detect emotion for the whole batch in one scan
+        with STAGE_SECONDS.time('emotion_batch'):
+            results = detect_emotion_batch(texts)
+
+        return jsonify({
+            'success': True,
+            'results': [
+                {
+                    'emotion': emotion,
+                    'distressLevel': distress_level,
+                    'distressDetected': distress_level >= 7
+                }
+                for emotion, distress_level in results
+            ]
+        })
+
+    except Exception as e:
+        logger.error(f"Error in analyze-emotion batch endpoint: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
 @app.route('/api/generate-insights', methods=['POST'])
 def generate_insights():
     """Generate insights from user data"""
@@ -152,32 +864,64 @@ def generate_insights():
                 'error': 'Data is required'
             }), 400
 
-        cycles = data.get('cycles', [])
-        symptoms = data.get('symptoms', [])
-        medications = data.get('medications', [])
+        if not is_valid_insights_delta(data):
+            return jsonify({
+                'success': False,
+                'error': 'userId, a delta object and the aggregate version (or reset) are required for incremental insights'
+            }), 400
+
+        # Identical data returns the cached insights without calling Gemini
+        with STAGE_SECONDS.time('insights_cache_lookup'):
+            cache_key, build_prompt, version = prepare_insights(data)
+            insights = insights_cache.get(cache_key)
+        if insights is not None:
+            return jsonify({
+                'success': True,
+                'insights': insights,
+                'cached': True,
+                'version': version
+            })
 
         # Generate insights prompt
-        prompt = f"""Based on the following user data, provide helpful insights and patterns:
+        with STAGE_SECONDS.time('insights_prompt_build'):
+            prompt = build_prompt()
 
-        Cycle Information: {json.dumps(cycles)}
-        Symptoms: {json.dumps(symptoms)}
-        Medications: {json.dumps(medications)}
+        # Get insights from Gemini
+        with request_scheduler.slot(**schedule_for(data, PRIORITY_INSIGHTS)) as waited:
+            STAGE_SECONDS.observe(waited, 'queue_wait')
+            with STAGE_SECONDS.time('llm_completion'):
+                insights = ai_client.get_completion(prompt)
 
-        Please analyze this data and provide:
-        1. Any patterns or correlations between symptoms and cycle phases
-        2. Potential effects of medications on symptoms or cycle
-        3. Suggestions for tracking additional data points that might be helpful
-        4. General insights that might help the user better understand their fertility journey
-        """
+        record_llm_tokens('insights', [prompt], insights)
+        if insights == FALLBACK_COMPLETION:
+            LLM_FALLBACKS.inc(1, 'insights')
 
-        # Get insights from Gemini
-        insights = ai_client.get_completion(prompt)
+        # Never cache the fallback message
+        if insights != FALLBACK_COMPLETION:
+            insights_cache.set(cache_key, insights)
 
         return jsonify({
             'success': True,
-            'insights': insights
+            'insights': insights,
+            'cached': False,
+            'version': version
         })
 
+    except AggregateResyncError as e:
+        logger.warning(f"Insight aggregate needs a resync: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'resync': True
+        }), 409
+
+    except SchedulerBusyError as e:
+        logger.warning(f"Rejected generate-insights request: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': BUSY_ERROR
+        }), 503
+
     except Exception as e:
         logger.error(f"Error in generate-insights endpoint: {str(e)}")
         return jsonify({
@@ -185,6 +929,31 @@ def generate_insights():
             'error': str(e)
         }), 500
 
+@app.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    """Hit/miss counters for the response caches and upstream call coalescing"""
+    return jsonify({
+        'success': True,
+        'insights': insights_cache.stats(),
+        'insightAggregates': insight_aggregates.stats(),
+        'semantic': semantic_cache.stats() if semantic_cache is not None else None,
+        'conversations': conversation_store.stats(),
+        'coalescing': ai_client.single_flight.stats()
+    })
+
+@app.route('/api/scheduler/stats', methods=['GET'])
+def scheduler_stats():
+    """Queue depth and wait times per priority for upstream calls"""
+    return jsonify({
+        'success': True,
+        'scheduler': request_scheduler.stats()
+    })
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Latency, token, cache and error metrics in the Prometheus text format"""
+    return Response(metrics.render(), content_type=METRICS_CONTENT_TYPE)
+
 if __name__ == '__main__':
     port = int(os.getenv('PORT', 5001))
     app.run(host='0.0.0.0', port=port, debug=os.getenv('FLASK_DEBUG', 'False').lower() == 'true')
@@ -0,0 +1,547 @@
+import os
+import json
+import time
+import asyncio
+import logging
+from functools import partial
+from typing import Any, Dict, Tuple
+from quart import Quart, Response, g, request, websocket, jsonify
+from quart_cors import cors
+from app import (
+    ai_client, insights_cache, insight_aggregates, semantic_cache, conversation_store, request_scheduler,
+    keyword_emotion_detector, sentiment_cascade, detect_emotion, detect_emotion_batch,
+    prepare_chat, remember_answer, record_turn, prepare_insights, is_valid_insights_delta,
+    schedule_for, chat_priority, record_request, record_llm_tokens,
+    EMOTION_BATCH_MAX_TEXTS, DISTRESS_STREAM_MAX_LENGTH, BUSY_ERROR, ERRORS, LLM_FALLBACKS, STAGE_SECONDS
+)
+from api.request_scheduler import SchedulerBusyError, PRIORITY_INSIGHTS
+from api.prompts import FALLBACK_CHAT_RESPONSE, FALLBACK_COMPLETION
+from utils.insight_aggregates import AggregateResyncError
+from utils.conversation_store import ConversationResyncError
+from utils.metrics import metrics, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from utils.rpc import RPCServer, DEFAULT_MAX_FRAME_BYTES
+from utils.sse import format_sse, SSE_HEADERS
+
+# Async serving mode: `hypercorn asgi:app`. Upstream LLM calls are awaited
+# instead of holding a worker thread, and CPU-bound analysis runs in the
+# default thread pool (handing off to the analysis process pool when
+# ANALYSIS_WORKERS is set) so it never stalls the event loop.
+
+logger = logging.getLogger(__name__)
+
+DISTRESS_STREAMS = metrics.counter('ai_engine_distress_streams_total', 'Distress WebSocket connections opened')
+DISTRESS_ALERTS = metrics.counter('ai_engine_distress_stream_alerts_total', 'Drafts that reached distress level 7 or more while being typed')
+
+# Initialize Quart app
+app = Quart(__name__)
+app = cors(app)
+
+async def run_in_executor(func, *args, **kwargs):
+    """Run a blocking function in the default executor
+
+    Args:
+        func: Function to run
+        *args: Positional arguments for func
+        **kwargs: Keyword arguments for func
+
+    Returns:
+        The function's return value
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, partial(func, *args, **kwargs))
+
+@app.before_request
+async def start_request_timer():
+    """Remember when the request started"""
+    g.request_started = time.perf_counter()
+
+@app.after_request
+async def record_request_metrics(response):
+    """Record request latency and status"""
+    started = g.get('request_started')
+    if started is not None:
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        record_request(endpoint, request.method, response.status_code, time.perf_counter() - started)
+    return response
+
+@app.route('/health', methods=['GET'])
+async def health_check():
+    """Health check endpoint"""
+    return jsonify({
+        'status': 'healthy',
+        'service': 'FertilityNest AI Engine'
+    })
+
+# The chat, emotion and insights handlers return (body, status) so the HTTP
+# routes and the internal RPC server (utils/rpc.py) share them
+async def handle_chat(data: Dict[str, Any]) -> Tuple[Dict[str, Any], int]:
+    """Chat: analyze a message and generate the AI response
+
+    Args:
+        data: Request payload
+
+    Returns:
+        Tuple of (response body, HTTP status)
+    """
+    try:
+        if not data or 'message' not in data:
+            return {
+                'success': False,
+                'error': 'Message is required'
+            }, 400
+
+        # Detect emotion, process the message and build the prompt off the event loop
+        chat_request = await run_in_executor(prepare_chat, data)
+
+        if chat_request.cached_response is not None:
+            return {
+                'success': True,
+                'response': chat_request.cached_response,
+                'emotion': chat_request.emotion,
+                'distressLevel': chat_request.distress_level,
+                'distressDetected': chat_request.distress_level >= 7,
+                'tokensSaved': chat_request.tokens_saved,
+                'cached': True,
+                'version': record_turn(chat_request, chat_request.cached_response)
+            }, 200
+
+        # Get AI response without blocking other requests
+        async with request_scheduler.slot_async(**schedule_for(data, chat_priority(chat_request.distress_level))) as waited:
+            STAGE_SECONDS.observe(waited, 'queue_wait')
+            with STAGE_SECONDS.time('llm_chat'):
+                ai_response = await ai_client.get_chat_response_async(
+                    system_message=chat_request.system_message,
+                    user_message=chat_request.user_message,
+                    chat_history=chat_request.history
+                )
+
+        record_llm_tokens('chat', chat_request.prompt_parts(), ai_response)
+        if ai_response == FALLBACK_CHAT_RESPONSE:
+            LLM_FALLBACKS.inc(1, 'chat')
+        remember_answer(chat_request, ai_response)
+
+        return {
+            'success': True,
+            'response': ai_response,
+            'emotion': chat_request.emotion,
+            'distressLevel': chat_request.distress_level,
+            'distressDetected': chat_request.distress_level >= 7,
+            'tokensSaved': chat_request.tokens_saved,
+            'cached': False,
+            'version': record_turn(chat_request, ai_response)
+        }, 200
+
+    except ConversationResyncError as e:
+        logger.warning(f"Chat conversation needs a resync: {str(e)}")
+        return {
+            'success': False,
+            'error': 'Conversation is out of date, resend the full history',
+            'resync': True
+        }, 409
+
+    except SchedulerBusyError as e:
+        logger.warning(f"Rejected chat request: {str(e)}")
+        return {
+            'success': False,
+            'error': BUSY_ERROR
+        }, 503
+
+    except Exception as e:
+        logger.error(f"Error in chat endpoint: {str(e)}")
+        return {
+            'success': False,
+            'error': str(e)
+        }, 500
+
+@app.route('/api/chat', methods=['POST'])
+async def chat():
+    """Chat endpoint for processing user messages and generating AI responses"""
+    body, status = await handle_chat(await request.get_json())
+    return jsonify(body), status
+
+@app.route('/api/chat/stream', methods=['POST'])
+async def chat_stream():
+    """Streaming chat endpoint that forwards the AI response as server-sent events"""
+    try:
+        data = await request.get_json()
+
+        if not data or 'message' not in data:
+            return jsonify({
+                'success': False,
+                'error': 'Message is required'
+            }), 400
+
+        chat_request = await run_in_executor(prepare_chat, data)
+
+    except ConversationResyncError as e:
+        logger.warning(f"Chat conversation needs a resync: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': 'Conversation is out of date, resend the full history',
+            'resync': True
+        }), 409
+
+    except Exception as e:
+        logger.error(f"Error in chat stream endpoint: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+    async def generate():
+        yield format_sse('analysis', {
+            'emotion': chat_request.emotion,
+            'distressLevel': chat_request.distress_level,
+            'distressDetected': chat_request.distress_level >= 7,
+            'tokensSaved': chat_request.tokens_saved
+        })
+
+        if chat_request.cached_response is not None:
+            yield format_sse('token', {'text': chat_request.cached_response})
+            yield format_sse('done', {
+                'response': chat_request.cached_response,
+                'cached': True,
+                'version': record_turn(chat_request, chat_request.cached_response)
+            })
+            return
+
+        chunks = []
+        try:
+            async with request_scheduler.slot_async(**schedule_for(data, chat_priority(chat_request.distress_level))) as waited:
+                STAGE_SECONDS.observe(waited, 'queue_wait')
+                started = time.perf_counter()
+                async for chunk in ai_client.stream_chat_response_async(
+                    system_message=chat_request.system_message,
+                    user_message=chat_request.user_message,
+                    chat_history=chat_request.history
+                ):
+                    if not chunks:
+                        STAGE_SECONDS.observe(time.perf_counter() - started, 'llm_stream_first_token')
+                    chunks.append(chunk)
+                    yield format_sse('token', {'text': chunk})
+                STAGE_SECONDS.observe(time.perf_counter() - started, 'llm_stream')
+
+            ai_response = ''.join(chunks)
+            record_llm_tokens('chat_stream', chat_request.prompt_parts(), ai_response)
+            remember_answer(chat_request, ai_response)
+            yield format_sse('done', {'response': ai_response, 'cached': False, 'version': record_turn(chat_request, ai_response)})
+
+        except SchedulerBusyError as e:
+            logger.warning(f"Rejected chat stream request: {str(e)}")
+            ERRORS.inc(1, '/api/chat/stream')
+            yield format_sse('error', {'error': BUSY_ERROR})
+
+        except Exception as e:
+            logger.error(f"Error streaming chat response: {str(e)}")
+            ERRORS.inc(1, '/api/chat/stream')
+            yield format_sse('error', {'error': str(e)})
+
+    response = Response(generate(), mimetype='text/event-stream', headers=SSE_HEADERS)
+    # Long generations must not hit the default response timeout
+    response.timeout = None
+    return response
+
+async def handle_analyze_emotion(data: Dict[str, Any]) -> Tuple[Dict[str, Any], int]:
+    """Emotion and distress level of a text
+
+    Args:
+        data: Request payload
+
+    Returns:
+        Tuple of (response body, HTTP status)
+    """
+    try:
+        if not data or 'text' not in data:
+            return {
+                'success': False,
+                'error': 'Text is required'
+            }, 400
+
+        with STAGE_SECONDS.time('emotion_detection'):
+            emotion, distress_level = await run_in_executor(detect_emotion, data['text'])
+
+        return {
+            'success': True,
+            'emotion': emotion,
+            'distressLevel': distress_level,
+            'distressDetected': distress_level >= 7
+        }, 200
+
+    except Exception as e:
+        logger.error(f"Error in analyze-emotion endpoint: {str(e)}")
+        return {
+            'success': False,
+            'error': str(e)
+        }, 500
+
+@app.route('/api/analyze-emotion', methods=['POST'])
+async def analyze_emotion():
+    """Analyze emotion in text"""
+    body, status = await handle_analyze_emotion(await request.get_json())
+    return jsonify(body), status
+
+@app.route('/api/analyze-sentiment', methods=['POST'])
+async def analyze_sentiment():
+    """Analyze sentiment locally, asking the LLM only when the keyword detector is unsure"""
+    try:
+        data = await request.get_json()
+
+        if not data or 'text' not in data:
+            return jsonify({
+                'success': False,
+                'error': 'Text is required'
+            }), 400
+
+        text = data['text']
+
+        with STAGE_SECONDS.time('sentiment_local'):
+            local = await run_in_executor(sentiment_cascade.classify, text)
+
+        llm_result = None
+        if sentiment_cascade.needs_llm(local):
+            try:
+                async with request_scheduler.slot_async(**schedule_for(data, chat_priority(local.distress_level))) as waited:
+                    STAGE_SECONDS.observe(waited, 'queue_wait')
+                    with STAGE_SECONDS.time('llm_sentiment'):
+                        llm_result = await ai_client.analyze_sentiment_async(text)
+            except SchedulerBusyError as e:
+                # The local answer is better than none
+                logger.warning(f"Answering sentiment locally, scheduler busy: {str(e)}")
+
+        result = sentiment_cascade.result(local, llm_result)
+
+        return jsonify({
+            'success': True,
+            **result,
+            'distressDetected': result['distressLevel'] >= 7
+        })
+
+    except Exception as e:
+        logger.error(f"Error in analyze-sentiment endpoint: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/api/analyze-emotion/batch', methods=['POST'])
+async def analyze_emotion_batch():
+    """Analyze emotion in a batch of texts (used for backfills)"""
+    try:
+        data = await request.get_json()
+
+        if not data or not isinstance(data.get('texts'), list):
+            return jsonify({
+                'success': False,
+                'error': 'Texts must be a list'
+            }), 400
+
+        texts = data['texts']
+
+        if len(texts) > EMOTION_BATCH_MAX_TEXTS:
+            return jsonify({
+                'success': False,
+                'error': f'At most {EMOTION_BATCH_MAX_TEXTS} texts are allowed per batch'
+            }), 413
+
+        if not all(isinstance(text, str) for text in texts):
+            return jsonify({
+                'success': False,
+                'error': 'Every text must be a string'
+            }), 400
+
+        with STAGE_SECONDS.time('emotion_batch'):
+            results = await run_in_executor(detect_emotion_batch, texts)
+
+        return jsonify({
+            'success': True,
+            'results': [
+                {
+                    'emotion': emotion,
+                    'distressLevel': distress_level,
+                    'distressDetected': distress_level >= 7
+                }
+                for emotion, distress_level in results
+            ]
+        })
+
+    except Exception as e:
+        logger.error(f"Error in analyze-emotion batch endpoint: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+async def handle_generate_insights(data: Dict[str, Any]) -> Tuple[Dict[str, Any], int]:
+    """Insights from cycle, symptom and medication data
+
+    Args:
+        data: Request payload
+
+    Returns:
+        Tuple of (response body, HTTP status)
+    """
+    try:
+        if not data:
+            return {
+                'success': False,
+                'error': 'Data is required'
+            }, 400
+
+        if not is_valid_insights_delta(data):
+            return {
+                'success': False,
+                'error': 'userId, a delta object and the aggregate version (or reset) are required for incremental insights'
+            }, 400
+
+        # Hashing and serializing long histories (or updating the aggregate) is CPU work too
+        with STAGE_SECONDS.time('insights_cache_lookup'):
+            cache_key, build_prompt, version = await run_in_executor(prepare_insights, data)
+            insights = await run_in_executor(insights_cache.get, cache_key)
+        if insights is not None:
+            return {
+                'success': True,
+                'insights': insights,
+                'cached': True,
+                'version': version
+            }, 200
+
+        with STAGE_SECONDS.time('insights_prompt_build'):
+            prompt = await run_in_executor(build_prompt)
+
+        async with request_scheduler.slot_async(**schedule_for(data, PRIORITY_INSIGHTS)) as waited:
+            STAGE_SECONDS.observe(waited, 'queue_wait')
+            with STAGE_SECONDS.time('llm_completion'):
+                insights = await ai_client.get_completion_async(prompt)
+
+        record_llm_tokens('insights', [prompt], insights)
+        if insights == FALLBACK_COMPLETION:
+            LLM_FALLBACKS.inc(1, 'insights')
+
+        # Never cache the fallback message
+        if insights != FALLBACK_COMPLETION:
+            await run_in_executor(insights_cache.set, cache_key, insights)
+
+        return {
+            'success': True,
+            'insights': insights,
+            'cached': False,
+            'version': version
+        }, 200
+
+    except AggregateResyncError as e:
+        logger.warning(f"Insight aggregate needs a resync: {str(e)}")
+        return {
+            'success': False,
+            'error': str(e),
+            'resync': True
+        }, 409
+
+    except SchedulerBusyError as e:
+        logger.warning(f"Rejected generate-insights request: {str(e)}")
+        return {
+            'success': False,
+            'error': BUSY_ERROR
+        }, 503
+
+    except Exception as e:
+        logger.error(f"Error in generate-insights endpoint: {str(e)}")
+        return {
+            'success': False,
+            'error': str(e)
+        }, 500
+
+@app.route('/api/generate-insights', methods=['POST'])
+async def generate_insights():
+    """Generate insights from user data"""
+    body, status = await handle_generate_insights(await request.get_json())
+    return jsonify(body), status
+
+@app.websocket('/ws/distress')
+async def distress_stream():
+    """Distress level of a message while it is being typed
+
+    The client sends each edit of its draft as {"offset": n, "text": "..."}
+    (keep the first n characters, then append text; offset defaults to the end).
+    The server sends an 'alert' event when the level reaches 7 or more and a
+    'distress' event for other changes. An edit only scans its own characters,
+    so it runs directly on the event loop.
+    """
+    DISTRESS_STREAMS.inc()
+    stream = keyword_emotion_detector.distress_stream(DISTRESS_STREAM_MAX_LENGTH)
+    level = 0
+
+    while True:
+        try:
+            edit = json.loads(await websocket.receive())
+            if not isinstance(edit, dict):
+                raise ValueError('Edits must be objects with offset and text')
+            # Checked before use: int() of Infinity or 1e400 raises OverflowError
+            offset = edit.get('offset', stream.length)
+            if isinstance(offset, bool) or not isinstance(offset, int):
+                raise ValueError('offset must be an integer')
+            new_level = stream.update(offset, str(edit.get('text', '')))
+        except (ValueError, TypeError) as e:
+            await websocket.send(json.dumps({'event': 'error', 'error': str(e)}))
+            continue
+
+        if new_level == level:
+            continue
+
+        event = 'alert' if new_level >= 7 > level else 'distress'
+        if event == 'alert':
+            DISTRESS_ALERTS.inc()
+        level = new_level
+        await websocket.send(json.dumps({'event': event, 'distressLevel': level, 'distressDetected': level >= 7}))
+
+# RPC_PORT also serves the chat, emotion and insights handlers as compact
+# binary RPC (utils/rpc.py) for the backend, on this process's event loop
+rpc_server = RPCServer(
+    {
+        'chat': handle_chat,
+        'analyze_emotion': handle_analyze_emotion,
+        'generate_insights': handle_generate_insights
+    },
+    max_frame_bytes=int(os.getenv('RPC_MAX_FRAME_BYTES', DEFAULT_MAX_FRAME_BYTES)),
+    max_in_flight=int(os.getenv('RPC_MAX_IN_FLIGHT', 64)),
+    on_response=lambda method, status, seconds: record_request(f'rpc:{method}', 'RPC', status, seconds)
+)
+
+@app.before_serving
+async def start_rpc_server():
+    """Start the RPC listener when RPC_PORT is set"""
+    if os.getenv('RPC_PORT'):
+        await rpc_server.start(os.getenv('RPC_HOST', '127.0.0.1'), int(os.getenv('RPC_PORT')))
+
+@app.after_serving
+async def stop_rpc_server():
+    """Stop the RPC listener"""
+    await rpc_server.close()
+
+@app.route('/api/cache/stats', methods=['GET'])
+async def cache_stats():
+    """Hit/miss counters for the response caches and upstream call coalescing"""
+    return jsonify({
+        'success': True,
+        'insights': insights_cache.stats(),
+        'insightAggregates': insight_aggregates.stats(),
+        'semantic': semantic_cache.stats() if semantic_cache is not None else None,
+        'conversations': conversation_store.stats(),
+        'coalescing': ai_client.single_flight.stats()
+    })
+
+@app.route('/api/scheduler/stats', methods=['GET'])
+async def scheduler_stats():
+    """Queue depth and wait times per priority for upstream calls"""
+    return jsonify({
+        'success': True,
+        'scheduler': request_scheduler.stats()
+    })
+
+@app.route('/metrics', methods=['GET'])
+async def prometheus_metrics():
+    """Latency, token, cache and error metrics in the Prometheus text format"""
+    return Response(metrics.render(), content_type=METRICS_CONTENT_TYPE)
+
+if __name__ == '__main__':
+    port = int(os.getenv('PORT', 5001))
+    app.run(host='0.0.0.0', port=port, debug=os.getenv('FLASK_DEBUG', 'False').lower() == 'true')
@@ -0,0 +1,85 @@
+"""Throughput of text analysis in-process versus the analysis process pool
+
+Concurrent client threads analyze medium-length messages through
+TextAnalyzer, first in-process (all threads share the GIL) and then through
+an AnalysisPool of each requested size, and report messages per second:
+
+    python -m benchmarks.analysis_pool_benchmark --workers 1 2 4 --messages 4000 --concurrency 16
+
+Throughput with the pool should grow with the number of workers up to the
+number of cores, which needs a multi-core host to show. The CPU time the
+client process spends per message is reported too: the pool only pays off
+for messages whose in-process analysis costs more than that, whatever the
+core count (see ANALYSIS_MIN_TEXT_LENGTH).
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.fixtures import sample_messages
+from utils.analysis_pool import AnalysisPool
+from utils.emotion_detector import EmotionDetector
+from utils.text_analysis import TextAnalyzer
+from utils.text_processor import TextProcessor
+
+
+def process_cpu() -> float:
+    """CPU seconds used by this process, not counting its children"""
+    times = os.times()
+    return times.user + times.system
+
+
+def throughput(analyze, messages, concurrency: int):
+    """Messages per second analyzed by concurrent client threads
+
+    Returns:
+        Tuple of (messages per second, client process CPU microseconds per message)
+    """
+    started, cpu_started = time.perf_counter(), process_cpu()
+    with ThreadPoolExecutor(max_workers=concurrency) as clients:
+        for _ in clients.map(analyze, messages):
+            pass
+    elapsed, cpu = time.perf_counter() - started, process_cpu() - cpu_started
+    return len(messages) / elapsed, cpu / len(messages) * 1e6
+
+
+def run_pool_benchmark(workers, messages: int = 4000, concurrency: int = 16, sentences: int = 5) -> dict:
+    """Measure in-process and pooled analysis throughput
+
+    Returns:
+        Metric name -> messages per second or client CPU microseconds per message
+    """
+    analyzer = TextAnalyzer(EmotionDetector(), TextProcessor())
+    texts = sample_messages(sentences, count=messages)
+
+    results = {}
+    rate, cpu = throughput(analyzer.analyze, texts, concurrency)
+    results['pool.in_process.messages_per_s'], results['pool.in_process.cpu_us_per_msg'] = rate, cpu
+    for count in workers:
+        pool = AnalysisPool(count)
+        pool.run('text_analysis', texts[0])  # start the workers before timing
+        try:
+            rate, cpu = throughput(lambda text: pool.run('text_analysis', text), texts, concurrency)
+        finally:
+            pool.shutdown()
+        results[f'pool.workers_{count}.messages_per_s'], results[f'pool.workers_{count}.cpu_us_per_msg'] = rate, cpu
+    return results
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Compare in-process and process-pool text analysis throughput')
+    parser.add_argument('--workers', type=int, nargs='+', default=sorted({1, 2, os.cpu_count() or 1}))
+    parser.add_argument('--messages', type=int, default=4000)
+    parser.add_argument('--concurrency', type=int, default=16, help='Concurrent client threads')
+    parser.add_argument('--sentences', type=int, default=5, help='Sentences per message')
+    args = parser.parse_args()
+
+    for name, value in run_pool_benchmark(args.workers, args.messages, args.concurrency, args.sentences).items():
+        print(f"{name:40s} {value:9.0f} {'msg/s' if name.endswith('_per_s') else 'us/msg'}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
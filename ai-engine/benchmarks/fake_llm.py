@@ -0,0 +1,78 @@
+"""Local stand-in for the LLM clients with configurable latency"""
+import asyncio
+import random
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, List
+
+from api.prompts import NEUTRAL_SENTIMENT
+from api.single_flight import SingleFlight
+
+
+class FakeLLMClient:
+    """Answers like GeminiClient after a simulated upstream delay"""
+
+    def __init__(self, latency_ms: float = 50.0, jitter_ms: float = 10.0, chunks: int = 8, seed: int = 0):
+        """Initialize the fake client
+
+        Args:
+            latency_ms: Mean simulated upstream latency
+            jitter_ms: Uniform jitter added to or subtracted from the latency
+            chunks: Chunks a streamed response is split into
+            seed: Seed for the jitter
+        """
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.chunks = chunks
+        self.single_flight = SingleFlight()
+        self.calls = 0
+        self._random = random.Random(seed)
+
+    def _delay(self) -> float:
+        self.calls += 1
+        jitter = self._random.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0.0
+        return max(0.0, self.latency_ms + jitter) / 1000
+
+    def _response(self, text: str) -> str:
+        return f"I hear you. Here is a thoughtful, supportive answer about: {text[:80]}"
+
+    def get_chat_response(self, system_message: str, user_message: str, chat_history: List[Dict[str, str]] = None) -> str:
+        time.sleep(self._delay())
+        return self._response(user_message)
+
+    async def get_chat_response_async(self, system_message: str, user_message: str, chat_history: List[Dict[str, str]] = None) -> str:
+        await asyncio.sleep(self._delay())
+        return self._response(user_message)
+
+    def stream_chat_response(self, system_message: str, user_message: str, chat_history: List[Dict[str, str]] = None) -> Iterator[str]:
+        delay = self._delay() / self.chunks
+        words = self._response(user_message).split(' ')
+        size = max(1, len(words) // self.chunks)
+        for start in range(0, len(words), size):
+            time.sleep(delay)
+            yield ' '.join(words[start:start + size]) + ' '
+
+    async def stream_chat_response_async(
+        self, system_message: str, user_message: str, chat_history: List[Dict[str, str]] = None
+    ) -> AsyncIterator[str]:
+        delay = self._delay() / self.chunks
+        words = self._response(user_message).split(' ')
+        size = max(1, len(words) // self.chunks)
+        for start in range(0, len(words), size):
+            await asyncio.sleep(delay)
+            yield ' '.join(words[start:start + size]) + ' '
+
+    def get_completion(self, prompt: str, max_tokens: int = 500) -> str:
+        time.sleep(self._delay())
+        return self._response(prompt)
+
+    async def get_completion_async(self, prompt: str, max_tokens: int = 500) -> str:
+        await asyncio.sleep(self._delay())
+        return self._response(prompt)
+
+    def analyze_sentiment(self, text: str) -> Dict[str, Any]:
+        time.sleep(self._delay())
+        return dict(NEUTRAL_SENTIMENT)
+
+    async def analyze_sentiment_async(self, text: str) -> Dict[str, Any]:
+        await asyncio.sleep(self._delay())
+        return dict(NEUTRAL_SENTIMENT)
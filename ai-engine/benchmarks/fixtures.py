@@ -0,0 +1,81 @@
+"""Deterministic sample payloads shared by the benchmarks"""
+import random
+from datetime import date, timedelta
+
+# Sentences in the style of real chat messages, with and without emotion and distress keywords
+SENTENCES = [
+    "I'm on CD 14 and my BBT finally went up this morning.",
+    "We've been TTC for almost two years and I feel so tired of waiting.",
+    "Had my IUI yesterday, the doctor said everything looked good.",
+    "I'm really anxious about the beta results on Friday.",
+    "Got another BFN today and I can't stop crying.",
+    "My husband is being so supportive, I'm grateful for him.",
+    "The cramps are worse than usual this cycle and I'm worried.",
+    "Is spotting during the TWW normal or should I call the clinic?",
+    "I feel hopeless, like nothing is ever going to work for us.",
+    "Started my progesterone injections, they hurt but it's fine.",
+    "I'm excited, our FET is scheduled for next week!",
+    "Everyone around me is pregnant and I feel so alone.",
+    "Honestly I don't want to live like this anymore, it's too much.",
+    "Can stress really affect ovulation? My OPK has been negative for days.",
+    "Thank you for listening, talking about it helps a lot.",
+    "My AMH came back low and I'm scared we waited too long.",
+    "Went for a long walk today and I feel a bit calmer.",
+    "The clinic called to say only two embryos made it to day 5.",
+    "I keep thinking about the miscarriage, the grief comes in waves.",
+    "What foods are good for egg quality during IVF stims?"
+]
+
+# Message sizes measured by the benchmarks: (name, sentences per message)
+MESSAGE_SIZES = [('short', 1), ('medium', 5), ('long', 25)]
+
+def sample_messages(sentences: int, count: int = 200, seed: int = 0):
+    """Build count messages of the given number of sentences"""
+    rng = random.Random(seed)
+    return [' '.join(rng.choice(SENTENCES) for _ in range(sentences)) for _ in range(count)]
+
+def chat_payload(index: int, history_length: int = 10) -> dict:
+    """A /api/chat request body with history and user context"""
+    rng = random.Random(index)
+    history = [
+        {'sender': 'user' if i % 2 == 0 else 'ai', 'content': ' '.join(rng.sample(SENTENCES, 3))}
+        for i in range(history_length)
+    ]
+    return {
+        'message': ' '.join(rng.sample(SENTENCES, 2)),
+        'sessionId': f'benchmark-{index % 50}',
+        'userId': f'user-{index % 200}',
+        'context': {
+            'userJourneyType': 'ivf',
+            'fertilityStage': 'stimulation',
+            'cycleDay': rng.randint(1, 28),
+            'recentSymptoms': ['cramps', 'fatigue'],
+            'recentMedications': ['Gonal-F']
+        },
+        'history': history
+    }
+
+def insights_payload(index: int, cycles: int = 12) -> dict:
+    """A /api/generate-insights request body; each index gives different data"""
+    rng = random.Random(index)
+    start = date(2024, 1, 1) + timedelta(days=index % 365)
+    cycle_list, symptom_list = [], []
+    for i in range(cycles):
+        cycle_start = start + timedelta(days=28 * i)
+        cycle_list.append({
+            'startDate': cycle_start.isoformat(),
+            'cycleLength': rng.randint(25, 33),
+            'periodLength': rng.randint(3, 7)
+        })
+        for _ in range(3):
+            symptom_list.append({
+                'date': (cycle_start + timedelta(days=rng.randint(0, 27))).isoformat(),
+                'type': rng.choice(['cramps', 'headache', 'bloating', 'fatigue', 'mood_swings']),
+                'severity': rng.randint(1, 5)
+            })
+    return {
+        'userId': f'user-{index % 200}',
+        'cycles': cycle_list,
+        'symptoms': symptom_list,
+        'medications': [{'name': 'Folic acid', 'dosage': '400mcg'}]
+    }
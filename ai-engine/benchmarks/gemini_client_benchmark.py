@@ -0,0 +1,99 @@
+"""Per-call overhead benchmark for GeminiClient
+
+Replaces the SDK's network client with a local stub that answers instantly,
+so the measured time is only the client-side work done per call. Compares the
+previous per-call pattern (new GenerativeModel and config per call, chat
+started twice, history appended message by message) with GeminiClient:
+
+    python -m benchmarks.gemini_client_benchmark --calls 2000 --history 20
+"""
+import argparse
+import sys
+import time
+
+import google.ai.generativelanguage as glm
+import google.generativeai as genai
+from google.generativeai import client as genai_client
+
+from api.gemini_client import GeminiClient, SYSTEM_ACKNOWLEDGEMENT
+
+
+class StubGenerativeClient:
+    """Stands in for the generative service client and answers without I/O"""
+
+    def __init__(self):
+        self.calls = 0
+        self._response = glm.GenerateContentResponse(candidates=[
+            glm.Candidate(content=glm.Content(role='model', parts=[glm.Part(text='stub response')]))
+        ])
+
+    def generate_content(self, request=None, **kwargs):
+        self.calls += 1
+        return self._response
+
+
+def legacy_chat_call(system_message, user_message, chat_history):
+    """The per-call pattern GeminiClient used before models were reused"""
+    model = genai.GenerativeModel('gemini-1.5-pro')
+    chat = model.start_chat(history=[])
+    chat = model.start_chat(history=[
+        {"role": "user", "parts": [system_message]},
+        {"role": "model", "parts": [SYSTEM_ACKNOWLEDGEMENT]}
+    ])
+    for msg in chat_history:
+        role = "user" if msg["role"] == "user" else "model"
+        chat.history.append(glm.Content(role=role, parts=[glm.Part(text=msg["content"])]))
+    return chat.send_message(user_message).text
+
+
+def legacy_completion_call(prompt):
+    """The per-call completion pattern used before models were reused"""
+    model = genai.GenerativeModel('gemini-1.5-pro')
+    return model.generate_content(
+        prompt,
+        generation_config=genai.GenerationConfig(max_output_tokens=500, temperature=0.7, top_p=1.0)
+    ).text
+
+
+def time_calls(func, calls):
+    """Average microseconds per call"""
+    started = time.perf_counter()
+    for _ in range(calls):
+        func()
+    return (time.perf_counter() - started) / calls * 1e6
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Measure GeminiClient per-call overhead against a local stub')
+    parser.add_argument('--calls', type=int, default=2000)
+    parser.add_argument('--history', type=int, default=20, help='Previous messages per chat call')
+    args = parser.parse_args()
+
+    client = GeminiClient(api_key='benchmark-key')
+    stub = StubGenerativeClient()
+    genai_client._client_manager.clients['generative'] = stub
+
+    system_message = 'You are Anaira, an empathetic AI companion for FertilityNest.'
+    history = [
+        {'role': 'user' if i % 2 == 0 else 'assistant', 'content': f'Message {i} about my cycle and symptoms'}
+        for i in range(args.history)
+    ]
+
+    results = {
+        'chat (legacy)': time_calls(lambda: legacy_chat_call(system_message, 'How are you?', history), args.calls),
+        'chat (GeminiClient)': time_calls(lambda: client.get_chat_response(system_message, 'How are you?', history), args.calls),
+        'completion (legacy)': time_calls(lambda: legacy_completion_call('Summarize my cycle'), args.calls),
+        'completion (GeminiClient)': time_calls(lambda: client.get_completion('Summarize my cycle'), args.calls)
+    }
+
+    for name, micros in results.items():
+        print(f"{name:28s} {micros:9.1f} us/call")
+
+    print(f"chat overhead removed:       {results['chat (legacy)'] - results['chat (GeminiClient)']:9.1f} us/call")
+    print(f"completion overhead removed: {results['completion (legacy)'] - results['completion (GeminiClient)']:9.1f} us/call")
+    print(f"stub calls: {stub.calls}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,170 @@
+"""End-to-end load test of the Flask app against a fake LLM
+
+Serves ``app`` on a local port with the LLM client replaced by a FakeLLMClient
+of configurable latency, then sends concurrent requests to each endpoint over
+HTTP and reports throughput and latency percentiles:
+
+    python -m benchmarks.load_test --requests 500 --concurrency 16 --llm-latency-ms 50
+
+Engine overhead is the median latency minus the simulated LLM latency. With
+``--cassette`` the LLM answers come from a recorded cassette instead, with the
+recorded latencies; requests the cassette never recorded fail unless
+``--cassette-on-miss any`` substitutes another recording.
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from api.cassette import CassetteClient, CassetteStore, MISS_ANY, MISS_ERROR, REPLAY
+from benchmarks.fake_llm import FakeLLMClient
+from benchmarks.fixtures import SENTENCES, chat_payload, insights_payload
+
+# Endpoint name -> (path, payload builder, whether it calls the LLM)
+ENDPOINTS = {
+    'chat': ('/api/chat', chat_payload, True),
+    'analyze_emotion': ('/api/analyze-emotion', lambda i: {'text': ' '.join(SENTENCES[i % 7:i % 7 + 3])}, False),
+    'generate_insights': ('/api/generate-insights', insights_payload, True)
+}
+
+
+def percentile(samples, fraction: float) -> float:
+    """Nearest-rank percentile of sorted samples"""
+    return samples[min(len(samples) - 1, int(fraction * len(samples)))]
+
+
+def start_server():
+    """Serve the app on an ephemeral port
+
+    Returns:
+        Tuple of (server, base URL)
+    """
+    from werkzeug.serving import make_server
+    import app as engine
+
+    server = make_server('127.0.0.1', 0, engine.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+
+def post(url: str, payload: dict) -> float:
+    """POST a JSON payload and return the latency in seconds
+
+    Raises:
+        urllib.error.HTTPError: If the response status isn't 2xx
+    """
+    body = json.dumps(payload).encode('utf-8')
+    request = urllib.request.Request(url, data=body, headers={'Content-Type': 'application/json'})
+    started = time.perf_counter()
+    with urllib.request.urlopen(request, timeout=60) as response:
+        response.read()
+    return time.perf_counter() - started
+
+
+def failed(results: dict) -> bool:
+    """Whether any load-test request failed or got a non-2xx response"""
+    return any(name.endswith(('.errors', '.non_2xx')) and value for name, value in results.items())
+
+
+def run_load(
+    requests: int = 300,
+    concurrency: int = 16,
+    llm_latency_ms: float = 50.0,
+    jitter_ms: float = 10.0,
+    cassette_path: str = None,
+    on_miss: str = MISS_ERROR
+) -> dict:
+    """Load each endpoint in turn
+
+    Args:
+        requests: Requests per endpoint
+        concurrency: Concurrent clients
+        llm_latency_ms: Mean fake LLM latency
+        jitter_ms: Fake LLM latency jitter
+        cassette_path: Replay this cassette instead of using the fake LLM
+        on_miss: Cassette policy for requests that were never recorded
+
+    Returns:
+        Metric name -> value (latencies in milliseconds, throughput in requests per second)
+    """
+    os.environ.setdefault('GEMINI_API_KEY', 'benchmark-key')
+    import app as engine
+
+    if cassette_path:
+        engine.ai_client = CassetteClient(None, CassetteStore(cassette_path), mode=REPLAY, reproduce_latency=True, on_miss=on_miss, seed=0)
+        llm_latency_ms = 0.0
+    else:
+        engine.ai_client = FakeLLMClient(latency_ms=llm_latency_ms, jitter_ms=jitter_ms)
+    server, base_url = start_server()
+
+    results = {}
+    try:
+        for name, (path, build_payload, calls_llm) in ENDPOINTS.items():
+            payloads = [build_payload(i) for i in range(requests)]
+            failures = Counter()
+            latencies = []
+
+            def send(payload):
+                """Latency in seconds, or (kind, description) of the failure"""
+                try:
+                    return post(base_url + path, payload)
+                except urllib.error.HTTPError as e:
+                    return 'non_2xx', f'HTTP {e.code}: {e.read().decode("utf-8", "replace")[:200]}'
+                except Exception as e:
+                    return 'errors', f'{type(e).__name__}: {str(e)}'
+
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                for outcome in pool.map(send, payloads):
+                    if isinstance(outcome, tuple):
+                        failures[outcome] += 1
+                    else:
+                        latencies.append(outcome * 1000)
+            elapsed = time.perf_counter() - started
+
+            for (_, failure), count in failures.most_common(5):
+                print(f"{path}: {count} x {failure}", file=sys.stderr)
+            for kind in ('non_2xx', 'errors'):
+                results[f'e2e.{name}.{kind}'] = sum(count for (k, _), count in failures.items() if k == kind)
+
+            # Timings cover successful requests only, so error responses can't pass for fast ones
+            latencies.sort()
+            if not latencies:
+                continue
+            p50 = percentile(latencies, 0.5)
+            results[f'e2e.{name}.p50_ms'] = p50
+            results[f'e2e.{name}.p95_ms'] = percentile(latencies, 0.95)
+            results[f'e2e.{name}.p99_ms'] = percentile(latencies, 0.99)
+            results[f'e2e.{name}.overhead_ms'] = p50 - (llm_latency_ms if calls_llm else 0.0)
+            results[f'e2e.{name}.rps'] = len(latencies) / elapsed
+    finally:
+        server.shutdown()
+
+    return results
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Load test the AI engine against a fake LLM')
+    parser.add_argument('--requests', type=int, default=300, help='Requests per endpoint')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--llm-latency-ms', type=float, default=50.0)
+    parser.add_argument('--llm-jitter-ms', type=float, default=10.0)
+    parser.add_argument('--cassette', help='Replay LLM answers from this cassette file')
+    parser.add_argument('--cassette-on-miss', choices=(MISS_ERROR, MISS_ANY), default=MISS_ERROR,
+                        help='Fail unrecorded requests or answer them with another recording')
+    args = parser.parse_args()
+
+    results = run_load(args.requests, args.concurrency, args.llm_latency_ms, args.llm_jitter_ms, args.cassette, args.cassette_on_miss)
+    for name, value in results.items():
+        print(f"{name:40s} {value:10.2f}")
+    return 1 if failed(results) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,77 @@
+"""Micro-benchmarks for the local text analysis hot paths
+
+Times EmotionDetector, TextProcessor and the combined TextAnalyzer over
+short, medium and long messages and reports the best of several runs in
+microseconds per call:
+
+    python -m benchmarks.micro_benchmark
+"""
+import argparse
+import sys
+import time
+
+from benchmarks.fixtures import MESSAGE_SIZES, sample_messages
+from utils.emotion_detector import EmotionDetector
+from utils.text_analysis import TextAnalyzer
+from utils.text_processor import TextProcessor
+
+
+def time_per_call(func, inputs, repeat: int = 5, min_seconds: float = 0.1) -> float:
+    """Best-of-repeat microseconds per call of func over inputs"""
+    loops = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(loops):
+            for item in inputs:
+                func(item)
+        if time.perf_counter() - started >= min_seconds:
+            break
+        loops *= 2
+
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(loops):
+            for item in inputs:
+                func(item)
+        best = min(best, time.perf_counter() - started)
+    return best / (loops * len(inputs)) * 1e6
+
+
+def run_micro(repeat: int = 5, min_seconds: float = 0.1) -> dict:
+    """Run every micro-benchmark
+
+    Returns:
+        Metric name -> microseconds per call
+    """
+    detector = EmotionDetector()
+    processor = TextProcessor()
+    targets = {
+        'detect_emotion': detector.detect_emotion,
+        'detect_distress_level': detector.detect_distress_level,
+        'preprocess': processor.preprocess,
+        'extract_keywords': processor.extract_keywords,
+        'text_analysis': TextAnalyzer(detector, processor).analyze
+    }
+
+    results = {}
+    for size, sentences in MESSAGE_SIZES:
+        messages = sample_messages(sentences)
+        for name, func in targets.items():
+            results[f'micro.{name}.{size}_us'] = time_per_call(func, messages, repeat, min_seconds)
+    return results
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Micro-benchmark emotion detection and text processing')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--min-seconds', type=float, default=0.1, help='Minimum duration of one timed run')
+    args = parser.parse_args()
+
+    for name, micros in run_micro(args.repeat, args.min_seconds).items():
+        print(f"{name:40s} {micros:9.2f} us/call")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
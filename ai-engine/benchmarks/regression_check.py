@@ -0,0 +1,86 @@
+"""Compare benchmark results with the stored baselines
+
+Runs the micro-benchmarks (and, with ``--e2e``, the load test) and fails when
+a metric is slower than its baseline by more than the threshold:
+
+    python -m benchmarks.regression_check --threshold 0.25
+    python -m benchmarks.regression_check --e2e --update   # record new baselines
+
+Baselines are machine-specific; record them on the machine that runs the check.
+Every compared metric is lower-is-better (microseconds or milliseconds).
+"""
+import argparse
+import json
+import os
+import sys
+
+from benchmarks.micro_benchmark import run_micro
+
+BASELINES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines.json')
+
+# Load-test metrics that are compared; throughput and raw percentiles are reported only
+E2E_COMPARED_SUFFIX = '.overhead_ms'
+
+
+def compare(results: dict, baselines: dict, threshold: float) -> list:
+    """Find metrics that regressed
+
+    Args:
+        results: Metric name -> current value
+        baselines: Metric name -> baseline value
+        threshold: Allowed slowdown as a fraction (0.25 allows 25%)
+
+    Returns:
+        List of (name, baseline, current) tuples for regressed metrics
+    """
+    regressions = []
+    for name, current in results.items():
+        baseline = baselines.get(name)
+        if baseline is not None and current > baseline * (1 + threshold):
+            regressions.append((name, baseline, current))
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Check benchmark results against stored baselines')
+    parser.add_argument('--threshold', type=float, default=0.25, help='Allowed slowdown (fraction of the baseline)')
+    parser.add_argument('--e2e', action='store_true', help='Also run the end-to-end load test (needs Flask)')
+    parser.add_argument('--update', action='store_true', help='Write the results as the new baselines')
+    args = parser.parse_args()
+
+    results = run_micro()
+    if args.e2e:
+        from benchmarks.load_test import failed, run_load
+        e2e = run_load()
+        if failed(e2e):
+            print("Load test requests failed; not comparing end-to-end timings", file=sys.stderr)
+            return 1
+        results.update({name: value for name, value in e2e.items() if name.endswith(E2E_COMPARED_SUFFIX)})
+
+    baselines = {}
+    if os.path.exists(BASELINES_PATH):
+        with open(BASELINES_PATH) as f:
+            baselines = json.load(f)
+
+    if args.update:
+        baselines.update({name: round(value, 3) for name, value in results.items()})
+        with open(BASELINES_PATH, 'w') as f:
+            json.dump(dict(sorted(baselines.items())), f, indent=2)
+            f.write('\n')
+        print(f"Wrote {len(results)} baselines to {BASELINES_PATH}")
+        return 0
+
+    for name, current in results.items():
+        baseline = baselines.get(name)
+        status = f"baseline {baseline:10.2f}" if baseline is not None else "no baseline"
+        print(f"{name:40s} {current:10.2f}  ({status})")
+
+    regressions = compare(results, baselines, args.threshold)
+    for name, baseline, current in regressions:
+        print(f"REGRESSION {name}: {current:.2f} vs baseline {baseline:.2f} (+{(current / baseline - 1) * 100:.0f}%)")
+
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
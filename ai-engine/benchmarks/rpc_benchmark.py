@@ -0,0 +1,171 @@
+"""Internal call overhead of HTTP/JSON versus the binary RPC connection
+
+Serves the async app with hypercorn and its RPC listener on local ports, with
+an instant fake LLM so only transport and engine overhead is measured, then
+sends the same chat requests (with long histories) both ways and reports
+payload size, throughput and latency percentiles:
+
+    python -m benchmarks.rpc_benchmark --requests 2000 --concurrency 32 --history 40
+
+HTTP requests open a new connection each, like a backend without keep-alive;
+RPC requests share one multiplexed connection.
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import sys
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.fake_llm import FakeLLMClient
+from benchmarks.fixtures import chat_payload
+from benchmarks.load_test import percentile
+from utils.rpc import RPCClient, encode_frame
+
+
+def free_port() -> int:
+    """An unused local TCP port"""
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+def start_servers():
+    """Serve the async app over HTTP and RPC on ephemeral ports
+
+    Returns:
+        Tuple of (base URL, RPC port, shutdown event setter)
+    """
+    from hypercorn.asyncio import serve
+    from hypercorn.config import Config
+
+    http_port, rpc_port = free_port(), free_port()
+    os.environ['RPC_PORT'] = str(rpc_port)
+    import asgi as engine
+
+    engine.ai_client = FakeLLMClient(latency_ms=0.0, jitter_ms=0.0)
+    config = Config()
+    config.bind = [f'127.0.0.1:{http_port}']
+    config.accesslog = None
+
+    loop = asyncio.new_event_loop()
+    shutdown = asyncio.Event()
+    threading.Thread(
+        target=loop.run_until_complete,
+        args=(serve(engine.app, config, shutdown_trigger=shutdown.wait),),
+        daemon=True
+    ).start()
+
+    # Wait until both listeners accept connections
+    for port in (http_port, rpc_port):
+        deadline = time.monotonic() + 10
+        while True:
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f'Server did not start on port {port}')
+                time.sleep(0.05)
+
+    return f'http://127.0.0.1:{http_port}', rpc_port, lambda: loop.call_soon_threadsafe(shutdown.set)
+
+
+def summarize(prefix: str, latencies, elapsed: float) -> dict:
+    """Throughput and latency percentiles in milliseconds"""
+    latencies = sorted(latency * 1000 for latency in latencies)
+    return {
+        f'{prefix}.rps': len(latencies) / elapsed,
+        f'{prefix}.p50_ms': percentile(latencies, 0.5),
+        f'{prefix}.p95_ms': percentile(latencies, 0.95),
+        f'{prefix}.p99_ms': percentile(latencies, 0.99)
+    }
+
+
+def run_http(base_url: str, payloads, concurrency: int) -> dict:
+    """Send the payloads as JSON over a new HTTP connection each"""
+    def send(payload):
+        body = json.dumps(payload).encode('utf-8')
+        request = urllib.request.Request(base_url + '/api/chat', data=body, headers={'Content-Type': 'application/json'})
+        started = time.perf_counter()
+        with urllib.request.urlopen(request, timeout=60) as response:
+            response.read()
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as clients:
+        latencies = list(clients.map(send, payloads))
+    return summarize('rpc_bench.http', latencies, time.perf_counter() - started)
+
+
+async def run_rpc(port: int, payloads, concurrency: int) -> dict:
+    """Send the payloads over one RPC connection, concurrency calls at a time"""
+    client = RPCClient('127.0.0.1', port)
+    await client.connect()
+    slots = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def send(payload):
+        async with slots:
+            started = time.perf_counter()
+            status, _ = await client.call('chat', payload, timeout=60)
+            if status != 200:
+                raise RuntimeError(f'RPC status {status}')
+            latencies.append(time.perf_counter() - started)
+
+    try:
+        started = time.perf_counter()
+        await asyncio.gather(*(send(payload) for payload in payloads))
+        return summarize('rpc_bench.rpc', latencies, time.perf_counter() - started)
+    finally:
+        await client.close()
+
+
+def run_rpc_benchmark(requests: int = 2000, concurrency: int = 32, history: int = 40) -> dict:
+    """Compare HTTP/JSON and RPC for the same chat requests
+
+    Args:
+        requests: Requests per transport
+        concurrency: Calls in flight at once
+        history: Messages of chat history per request
+
+    Returns:
+        Metric name -> value (sizes in bytes, latencies in milliseconds, throughput in requests per second)
+    """
+    os.environ.setdefault('GEMINI_API_KEY', 'benchmark-key')
+    # Distinct sessions without a version, so every request sends its full history
+    payloads = [dict(chat_payload(i, history_length=history), sessionId=None) for i in range(requests)]
+
+    results = {
+        'rpc_bench.json_bytes': sum(len(json.dumps(payload).encode('utf-8')) for payload in payloads) / requests,
+        'rpc_bench.msgpack_bytes': sum(len(encode_frame([i, 'chat', payload])) for i, payload in enumerate(payloads)) / requests
+    }
+
+    base_url, rpc_port, shutdown = start_servers()
+    try:
+        run_http(base_url, payloads[:50], concurrency)  # warm up
+        results.update(run_http(base_url, payloads, concurrency))
+        results.update(asyncio.run(run_rpc(rpc_port, payloads, concurrency)))
+    finally:
+        shutdown()
+    return results
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Compare HTTP/JSON and binary RPC call overhead')
+    parser.add_argument('--requests', type=int, default=2000, help='Requests per transport')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--history', type=int, default=40, help='Chat history messages per request')
+    args = parser.parse_args()
+
+    for name, value in run_rpc_benchmark(args.requests, args.concurrency, args.history).items():
+        print(f"{name:40s} {value:10.2f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
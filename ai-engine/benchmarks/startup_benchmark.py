@@ -0,0 +1,92 @@
+"""Startup benchmark for the AI engine
+
+Imports ``app`` in fresh interpreters and reports import time and peak RSS.
+Exits non-zero when either exceeds its threshold, so it can gate CI:
+
+    python -m benchmarks.startup_benchmark --max-import-seconds 1.5 --max-rss-mb 150
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from statistics import median
+
+ENGINE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in the child interpreter; prints a JSON line with the measurements
+PROBE = """
+import json, resource, sys, time
+started = time.perf_counter()
+import app
+elapsed = time.perf_counter() - started
+rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+if sys.platform == 'darwin':
+    rss_kb //= 1024
+print(json.dumps({
+    'import_seconds': elapsed,
+    'rss_mb': rss_kb / 1024,
+    'heavy_modules': [m for m in ('tensorflow', 'torch', 'transformers', 'numpy', 'pandas') if m in sys.modules]
+}))
+"""
+
+
+def measure_startup(runs: int = 5) -> dict:
+    """Import the app in fresh interpreters and summarize the measurements
+
+    Args:
+        runs: Number of interpreters to start
+
+    Returns:
+        Dictionary with median import time, peak RSS and eagerly imported heavy modules
+    """
+    env = dict(os.environ)
+    env.setdefault('GEMINI_API_KEY', 'benchmark-key')
+    env.pop('AI_ENGINE_PRELOAD', None)
+
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, '-c', PROBE],
+            cwd=ENGINE_DIR,
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True
+        ).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+
+    return {
+        'import_seconds': median(sample['import_seconds'] for sample in samples),
+        'rss_mb': max(sample['rss_mb'] for sample in samples),
+        'heavy_modules': sorted({m for sample in samples for m in sample['heavy_modules']})
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Measure AI engine import time and memory')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--max-import-seconds', type=float, default=1.5)
+    parser.add_argument('--max-rss-mb', type=float, default=150.0)
+    args = parser.parse_args()
+
+    result = measure_startup(args.runs)
+    print(f"import time: {result['import_seconds']:.3f}s (limit {args.max_import_seconds}s)")
+    print(f"peak RSS:    {result['rss_mb']:.1f} MB (limit {args.max_rss_mb} MB)")
+
+    failures = []
+    if result['import_seconds'] > args.max_import_seconds:
+        failures.append('import time regressed')
+    if result['rss_mb'] > args.max_rss_mb:
+        failures.append('startup RSS regressed')
+    if result['heavy_modules']:
+        failures.append(f"heavy modules imported at startup: {', '.join(result['heavy_modules'])}")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,9 @@
+import os
+
+# Gunicorn settings for the AI engine (`gunicorn -c gunicorn.conf.py app:app`)
+bind = f"0.0.0.0:{os.getenv('PORT', 5001)}"
+workers = int(os.getenv('WEB_CONCURRENCY', 4))
+
+# Import the app (and any AI_ENGINE_PRELOAD backends) once in the master so
+# forked workers share the loaded models through copy-on-write
+preload_app = bool(os.getenv('AI_ENGINE_PRELOAD'))
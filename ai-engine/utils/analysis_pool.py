@@ -0,0 +1,145 @@
+import os
+import logging
+import importlib
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+def _tasks(module: str) -> Dict[str, Callable]:
+    """Task table of a tasks module (imported once per process)"""
+    return importlib.import_module(module).TASKS
+
+def _run_task(module: str, name: str, args: tuple) -> Any:
+    """Run a task in a worker process; only its name and arguments are pickled"""
+    return _tasks(module)[name](*args)
+
+class AnalysisPool:
+    """Process pool for CPU-bound text analysis
+
+    Tasks are the TASKS table of a module that builds the keyword lexicons and
+    compiled matchers at import. Workers come from a forkserver, a fresh
+    single-threaded process that imports the module once and forks each
+    worker from it, so the workers share those objects copy-on-write. Forking
+    the server process directly isn't safe once its scheduler, batcher and
+    request threads run: a lock held by another thread at the fork stays
+    locked in the child. The pool starts on first use in each process, so a
+    pre-forking server gives every worker its own pool. If the pool breaks
+    the task runs in-process and the pool is restarted on the next call.
+    """
+
+    def __init__(self, workers: int, tasks_module: str = 'utils.analysis_tasks', min_chunk_size: int = 64):
+        """Initialize the pool (workers are started on first use)
+
+        Args:
+            workers: Number of worker processes
+            tasks_module: Module with a TASKS dict of task name -> function
+            min_chunk_size: Smallest number of items sent to a worker by map
+        """
+        self.workers = max(1, workers)
+        self.tasks_module = tasks_module
+        self.min_chunk_size = max(1, min_chunk_size)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+        # Counters
+        self.tasks = 0
+        self.fallbacks = 0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        """Start the workers in this process if they aren't running yet"""
+        if self._executor is not None and self._pid == os.getpid():
+            return self._executor
+
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                # The forkserver is started with fork+exec, which is safe from any thread
+                context = multiprocessing.get_context('forkserver')
+                context.set_forkserver_preload([self.tasks_module])
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+                self._pid = os.getpid()
+                logger.info(f"Started analysis pool with {self.workers} worker processes")
+        return self._executor
+
+    def _reset(self, executor: ProcessPoolExecutor, error: Exception) -> None:
+        """Drop a broken pool so the next call starts a new one"""
+        logger.error(f"Analysis pool failed, running in-process: {str(error)}")
+        with self._lock:
+            # Another thread may already have replaced it
+            if self._executor is executor:
+                self._executor = None
+            self.fallbacks += 1
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _count(self, tasks: int) -> None:
+        with self._lock:
+            self.tasks += tasks
+
+    def run(self, name: str, *args: Any) -> Any:
+        """Run a task in a worker process and wait for the result
+
+        Args:
+            name: Registered task name
+            *args: Task arguments
+
+        Returns:
+            The task's return value
+        """
+        self._count(1)
+        executor = self._get_executor()
+        try:
+            return executor.submit(_run_task, self.tasks_module, name, args).result()
+        except BrokenProcessPool as e:
+            self._reset(executor, e)
+            return _tasks(self.tasks_module)[name](*args)
+
+    def map(self, name: str, items: List[Any]) -> List[Any]:
+        """Run a task that maps a list to a list of results, split across the workers
+
+        Fewer items than min_chunk_size run in-process, where they cost less
+        than a round trip to a worker.
+
+        Args:
+            name: Registered task name (the task takes and returns a list)
+            items: Items to process
+
+        Returns:
+            Results in the same order as items
+        """
+        if len(items) < self.min_chunk_size:
+            return _tasks(self.tasks_module)[name](items)
+
+        chunk_size = max(self.min_chunk_size, -(-len(items) // self.workers))
+        chunks = [items[offset:offset + chunk_size] for offset in range(0, len(items), chunk_size)]
+        self._count(len(chunks))
+        executor = self._get_executor()
+        try:
+            futures = [executor.submit(_run_task, self.tasks_module, name, (chunk,)) for chunk in chunks]
+            return [result for future in futures for result in future.result()]
+        except BrokenProcessPool as e:
+            self._reset(executor, e)
+            return _tasks(self.tasks_module)[name](items)
+
+    def shutdown(self) -> None:
+        """Stop the worker processes"""
+        with self._lock:
+            if self._executor is not None and self._pid == os.getpid():
+                self._executor.shutdown()
+            self._executor = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Get pool counters
+
+        Returns:
+            Dictionary with worker count, tasks submitted and in-process fallbacks
+        """
+        return {
+            'workers': self.workers,
+            'running': self._executor is not None and self._pid == os.getpid(),
+            'tasks': self.tasks,
+            'fallbacks': self.fallbacks
+        }
@@ -0,0 +1,24 @@
+"""Keyword analysis tasks run by the analysis pool
+
+The pool's forkserver imports this module once, so the lexicons and compiled
+matchers are built before the workers are forked from it and are shared
+copy-on-write.
+"""
+import gc
+from utils.emotion_detector import EmotionDetector
+from utils.text_analysis import TextAnalyzer
+from utils.text_processor import TextProcessor
+
+emotion_detector = EmotionDetector()
+text_analyzer = TextAnalyzer(emotion_detector, TextProcessor())
+
+TASKS = {
+    'text_analysis': text_analyzer.analyze,
+    'keyword_emotion': emotion_detector.detect_emotion_and_distress,
+    'keyword_emotion_batch': emotion_detector.detect_batch
+}
+
+# Objects created so far move to the permanent generation, so collections in
+# the workers don't write to (and copy) their pages
+gc.collect()
+gc.freeze()
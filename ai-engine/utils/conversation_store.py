@@ -0,0 +1,187 @@
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Tuple
+
+logger = logging.getLogger(__name__)
+
+class ConversationResyncError(RuntimeError):
+    """Raised when the client's conversation version doesn't match the server's copy"""
+
+class ChatMessage:
+    """One message of a stored conversation"""
+    __slots__ = ('role', 'content')
+
+    def __init__(self, role: str, content: str):
+        self.role = role
+        self.content = content
+
+    @classmethod
+    def from_backend(cls, msg: Dict[str, Any]) -> 'ChatMessage':
+        """Build a message from a backend chat message with 'sender' and 'content' keys"""
+        return cls('user' if msg['sender'] == 'user' else 'assistant', msg['content'])
+
+    def __getitem__(self, key: str) -> str:
+        """Read like the role/content dicts the history compactor works on"""
+        return getattr(self, key)
+
+    def to_dict(self) -> Dict[str, str]:
+        """Role/content dict for the LLM clients"""
+        return {'role': self.role, 'content': self.content}
+
+class _Conversation:
+    """Messages and version of one session
+
+    The messages are a tuple that is replaced, never modified, so a snapshot
+    handed to a request can't change under it when another turn is appended.
+    """
+    __slots__ = ('messages', 'version', 'last_used')
+
+    def __init__(self, messages: Tuple[ChatMessage, ...], version: int, last_used: float):
+        self.messages = messages
+        self.version = version
+        self.last_used = last_used
+
+class ConversationStore:
+    """Bounded in-memory chat history keyed by session id
+
+    Clients send only the new message with the session id and the version
+    they last saw (the number of messages in the conversation), so request
+    size and per-turn work don't grow with the conversation. Sessions idle for
+    idle_seconds and the least recently used ones beyond max_conversations are
+    evicted; a client whose version doesn't match (evicted, restarted or served
+    by another worker) gets a ConversationResyncError and resends the full
+    history once.
+
+    A conversation keeps at most max_messages. When it grows past that the
+    oldest half is dropped at once, so the rolling summary built from it is
+    rebuilt occasionally rather than on every turn.
+    """
+
+    def __init__(self, max_conversations: int = 10000, idle_seconds: float = 1800, max_messages: int = 200):
+        """Initialize the store
+
+        Args:
+            max_conversations: Maximum number of sessions kept in memory
+            idle_seconds: Seconds after its last turn that a session is evicted
+            max_messages: Maximum number of messages kept per session
+        """
+        self.max_conversations = max(1, max_conversations)
+        self.idle_seconds = idle_seconds
+        self.max_messages = max(2, max_messages)
+
+        self._conversations: 'OrderedDict[str, _Conversation]' = OrderedDict()
+        self._lock = threading.Lock()
+
+        # Counters
+        self.resets = 0
+        self.resyncs = 0
+        self.evictions = 0
+
+    def reset(self, session_id: str, history: Iterable[Dict[str, Any]]) -> int:
+        """Replace a session's messages with the full history sent by the client
+
+        Args:
+            session_id: Session id
+            history: Backend chat messages with 'sender' and 'content' keys, oldest first
+
+        Returns:
+            The session's version
+        """
+        messages = tuple(ChatMessage.from_backend(msg) for msg in history)
+        version = len(messages)
+        if len(messages) > self.max_messages:
+            messages = messages[-self.max_messages:]
+
+        with self._lock:
+            now = time.monotonic()
+            self._conversations[session_id] = _Conversation(messages, version, now)
+            self._conversations.move_to_end(session_id)
+            self.resets += 1
+            self._evict(now)
+        return version
+
+    def get(self, session_id: str, version: int) -> Tuple[ChatMessage, ...]:
+        """Get a session's messages
+
+        The tuple is a snapshot: later turns of the session don't change it.
+
+        Args:
+            session_id: Session id
+            version: Version the client last saw
+
+        Returns:
+            Messages, oldest first
+
+        Raises:
+            ConversationResyncError: If the session is unknown or at another version
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._evict(now)
+            conversation = self._conversations.get(session_id)
+            if conversation is None or conversation.version != version:
+                self.resyncs += 1
+                raise ConversationResyncError(
+                    f"session {session_id} is at version {conversation.version if conversation else None}, not {version}"
+                )
+            conversation.last_used = now
+            self._conversations.move_to_end(session_id)
+            return conversation.messages
+
+    def append(self, session_id: str, version: int, messages: Iterable[ChatMessage]) -> int:
+        """Add the messages of a finished turn
+
+        Args:
+            session_id: Session id
+            version: Version the turn was built on
+            messages: New messages, oldest first
+
+        Returns:
+            The session's new version
+
+        Raises:
+            ConversationResyncError: If the session changed or was evicted during the turn
+                (the session is dropped so the client resends its history)
+        """
+        with self._lock:
+            conversation = self._conversations.get(session_id)
+            if conversation is None or conversation.version != version:
+                self._conversations.pop(session_id, None)
+                self.resyncs += 1
+                raise ConversationResyncError(f"session {session_id} changed during the turn")
+
+            added = tuple(messages)
+            updated = conversation.messages + added
+            if len(updated) > self.max_messages:
+                updated = updated[-(self.max_messages // 2):]
+            conversation.messages = updated
+            conversation.version = version + len(added)
+
+            conversation.last_used = time.monotonic()
+            self._conversations.move_to_end(session_id)
+            return conversation.version
+
+    def _evict(self, now: float) -> None:
+        """Drop idle sessions and the least recently used ones beyond the limit (lock held)"""
+        while self._conversations:
+            session_id, conversation = next(iter(self._conversations.items()))
+            if len(self._conversations) <= self.max_conversations and now - conversation.last_used < self.idle_seconds:
+                break
+            del self._conversations[session_id]
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Get store counters
+
+        Returns:
+            Dictionary with session count, resets, resyncs and evictions
+        """
+        return {
+            'conversations': len(self._conversations),
+            'maxConversations': self.max_conversations,
+            'resets': self.resets,
+            'resyncs': self.resyncs,
+            'evictions': self.evictions
+        }
@@ -0,0 +1,199 @@
+import logging
+from typing import Dict, List, Optional, Tuple
+from utils.emotion_detector import EmotionDetector
+from utils.micro_batcher import MicroBatcher
+from utils.model_registry import model_registry
+
+logger = logging.getLogger(__name__)
+
+# Registry name of the local classifier pipeline
+CLASSIFIER_BACKEND = 'emotion_classifier'
+
+DEFAULT_EMOTION_MODEL = 'j-hartmann/emotion-english-distilroberta-base'
+
+class TransformerEmotionDetector:
+    """Local transformer emotion classifier with the EmotionDetector interface
+
+    Concurrent requests are grouped by a MicroBatcher into one CPU forward pass.
+    Distress levels always come from the keyword detector, which is also used
+    for the emotion whenever the classifier is unavailable, times out or is
+    not confident enough.
+    """
+
+    # Classifier labels mapped onto the emotions used by the app
+    LABEL_MAP = {
+        'joy': 'happy',
+        'love': 'happy',
+        'sadness': 'sad',
+        'anger': 'angry',
+        'disgust': 'angry',
+        'fear': 'anxious',
+        'optimism': 'hopeful',
+        'surprise': 'neutral',
+        'neutral': 'neutral'
+    }
+
+    def __init__(
+        self,
+        fallback: Optional[EmotionDetector] = None,
+        model_name: str = DEFAULT_EMOTION_MODEL,
+        max_batch_size: int = 32,
+        max_wait_ms: float = 5.0,
+        min_confidence: float = 0.4,
+        timeout: float = 2.0
+    ):
+        """Initialize the classifier (the model itself loads on first use)
+
+        Args:
+            fallback: Keyword detector used for distress levels and as fallback
+            model_name: Hugging Face text-classification model to run locally
+            max_batch_size: Largest number of texts per forward pass
+            max_wait_ms: Longest time a request waits for a batch to fill
+            min_confidence: Classifier score below which the keyword emotion is used
+            timeout: Seconds a request waits for the classifier before falling back
+        """
+        self.fallback = fallback or EmotionDetector()
+        self.model_name = model_name
+        self.max_batch_size = max_batch_size
+        self.min_confidence = min_confidence
+        self.timeout = timeout
+        self._available = True
+
+        model_registry.register(CLASSIFIER_BACKEND, self._load_pipeline)
+
+        self.batcher = MicroBatcher(
+            self._classify,
+            max_batch_size=max_batch_size,
+            max_wait_ms=max_wait_ms,
+            name='emotion-classifier'
+        )
+
+    def _load_pipeline(self):
+        """Load the text-classification pipeline on CPU"""
+        transformers = model_registry.get('transformers')
+        return transformers.pipeline(
+            'text-classification',
+            model=self.model_name,
+            device=-1
+        )
+
+    def _classify(self, texts: List[str]) -> List[Dict[str, float]]:
+        """Run one forward pass over a batch of texts
+
+        Args:
+            texts: Texts to classify
+
+        Returns:
+            List of {'label', 'score'} predictions in the same order
+        """
+        pipeline = model_registry.get(CLASSIFIER_BACKEND)
+        return pipeline(texts, batch_size=len(texts), truncation=True)
+
+    def _combine(self, keyword_result: Tuple[str, int], prediction: Optional[Dict[str, float]]) -> Tuple[str, int]:
+        """Merge a classifier prediction with the keyword result
+
+        Args:
+            keyword_result: (emotion, distress_level) from the keyword detector
+            prediction: Classifier prediction, or None if unavailable
+
+        Returns:
+            Tuple of (emotion, distress_level)
+        """
+        keyword_emotion, distress_level = keyword_result
+
+        # The classifier has no distress class, so keyword distress always wins
+        if keyword_emotion == 'distressed' or not prediction:
+            return keyword_emotion, distress_level
+
+        emotion = self.LABEL_MAP.get(prediction['label'].lower())
+        if emotion is None or prediction['score'] < self.min_confidence:
+            return keyword_emotion, distress_level
+
+        return emotion, distress_level
+
+    def _disable(self, error: Exception):
+        """Stop using the classifier after it fails to load"""
+        if self._available:
+            logger.error(f"Emotion classifier unavailable, using keyword detection: {str(error)}")
+        self._available = False
+
+    def detect_emotion(self, text: str) -> str:
+        """Detect primary emotion in text
+
+        Args:
+            text: Text to analyze
+
+        Returns:
+            Detected emotion (happy, sad, angry, anxious, distressed, hopeful, or neutral)
+        """
+        emotion, _ = self.detect_emotion_and_distress(text)
+        return emotion
+
+    def detect_distress_level(self, text: str) -> int:
+        """Detect distress level in text on a scale of 0-10
+
+        Args:
+            text: Text to analyze
+
+        Returns:
+            Distress level (0-10)
+        """
+        return self.fallback.detect_distress_level(text)
+
+    def detect_emotion_and_distress(self, text: str) -> Tuple[str, int]:
+        """Detect both emotion and distress level
+
+        Args:
+            text: Text to analyze
+
+        Returns:
+            Tuple of (emotion, distress_level)
+        """
+        keyword_result = self.fallback.detect_emotion_and_distress(text)
+        if not text or not self._available:
+            return keyword_result
+
+        try:
+            prediction = self.batcher.process(text, timeout=self.timeout)
+        except TimeoutError:
+            logger.warning("Emotion classifier timed out, using keyword detection")
+            prediction = None
+        except (ImportError, OSError) as e:
+            self._disable(e)
+            prediction = None
+        except Exception as e:
+            logger.error(f"Error classifying emotion: {str(e)}")
+            prediction = None
+
+        return self._combine(keyword_result, prediction)
+
+    def detect_batch(self, texts: List[str]) -> List[Tuple[str, int]]:
+        """Detect emotion and distress level for many texts at once
+
+        Large batches skip the request queue and are classified directly in
+        chunks of max_batch_size.
+
+        Args:
+            texts: Texts to analyze
+
+        Returns:
+            List of (emotion, distress_level) tuples in the same order as texts
+        """
+        keyword_results = self.fallback.detect_batch(texts)
+        if not self._available:
+            return keyword_results
+
+        predictions: List[Optional[Dict[str, float]]] = [None] * len(texts)
+        indexes = [index for index, text in enumerate(texts) if text]
+
+        try:
+            for offset in range(0, len(indexes), self.max_batch_size):
+                chunk = indexes[offset:offset + self.max_batch_size]
+                for index, prediction in zip(chunk, self._classify([texts[i] for i in chunk])):
+                    predictions[index] = prediction
+        except (ImportError, OSError) as e:
+            self._disable(e)
+        except Exception as e:
+            logger.error(f"Error classifying emotion batch: {str(e)}")
+
+        return [self._combine(result, prediction) for result, prediction in zip(keyword_results, predictions)]
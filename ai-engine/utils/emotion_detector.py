@@ -1,9 +1,13 @@
-import re
 import logging
+from array import array
 from typing import Dict, List, Tuple
+from utils.keyword_matcher import KeywordMatcher
 
 logger = logging.getLogger(__name__)
 
+# Joins batch texts for a shared scan; it is a non-word character no keyword contains
+BATCH_SEPARATOR = '\x00'
+
 class EmotionDetector:
     """Utility class for detecting emotions in text"""
     
@@ -75,39 +79,124 @@ class EmotionDetector:
             'worried': 2,
             'anxious': 2
         }
+        
+        # Compile both lexicons into one matcher so each message is scanned once
+        self._build_matcher()
     
-    def detect_emotion(self, text: str) -> str:
-        """Detect primary emotion in text
+    def _build_matcher(self):
+        """Build the shared keyword matcher and per-keyword scoring tables"""
+        self._emotions = list(self.emotion_keywords)
+        self._matcher = KeywordMatcher(
+            [keyword for keywords in self.emotion_keywords.values() for keyword in keywords]
+            + list(self.distress_keywords)
+        )
+        
+        # Emotion indexes each keyword scores for, and its distress level (0 if none)
+        self._keyword_emotions: List[Tuple[int, ...]] = [()] * len(self._matcher.keywords)
+        self._keyword_distress: List[int] = [0] * len(self._matcher.keywords)
+        
+        for index, emotion in enumerate(self._emotions):
+            for keyword in self.emotion_keywords[emotion]:
+                keyword_id = self._matcher.keyword_ids[keyword]
+                self._keyword_emotions[keyword_id] += (index,)
+        
+        for keyword, level in self.distress_keywords.items():
+            self._keyword_distress[self._matcher.keyword_ids[keyword]] = level
+        
+        # Highest distress level of the keywords ending at each matcher state
+        self._state_distress = self._matcher.state_max(self._keyword_distress)
+    
+    def _scan(self, text_lower: str) -> Tuple[List[int], int]:
+        """Score all emotions and the distress level in one pass
+        
+        Emotion keywords count whole-word, non-overlapping occurrences (the same
+        semantics as ``re.findall(r'\\bkeyword\\b')``); distress keywords match
+        anywhere in the text.
         
         Args:
-            text: Text to analyze
+            text_lower: Lowercased text to analyze
             
         Returns:
-            Detected emotion (happy, sad, angry, anxious, distressed, hopeful, or neutral)
+            Tuple of (emotion_scores, distress_level), with scores ordered like emotion_keywords
         """
-        if not text:
-            return 'neutral'
+        matches, _ = self._matcher.find_all(text_lower)
+        return self._score_matches(text_lower, matches)
+    
+    def _score_matches(self, text_lower: str, matches: List[Tuple[int, int, int]]) -> Tuple[List[int], int]:
+        """Turn matcher output for one text into emotion scores and a distress level
         
-        text_lower = text.lower()
-        emotion_scores = {}
+        Args:
+            text_lower: Lowercased text the matches were found in
+            matches: Matches from KeywordMatcher.find_all
+            
+        Returns:
+            Tuple of (emotion_scores, distress_level)
+        """
+        scores = [0] * len(self._emotions)
+        max_level = 0
+        last_end: Dict[int, int] = {}
+        text_length = len(text_lower)
         
-        # Count occurrences of emotion keywords
-        for emotion, keywords in self.emotion_keywords.items():
-            score = 0
-            for keyword in keywords:
-                # Count occurrences of keyword
-                count = len(re.findall(r'\b' + re.escape(keyword) + r'\b', text_lower))
-                score += count
+        for start, end, keyword_id in matches:
+            level = self._keyword_distress[keyword_id]
+            if level > max_level:
+                max_level = level
             
-            emotion_scores[emotion] = score
+            emotions = self._keyword_emotions[keyword_id]
+            if not emotions or start < last_end.get(keyword_id, 0):
+                continue
+            
+            # Word boundaries on both sides of the match
+            before = start > 0 and _is_word_char(text_lower[start - 1])
+            if before == _is_word_char(text_lower[start]):
+                continue
+            after = end < text_length and _is_word_char(text_lower[end])
+            if after == _is_word_char(text_lower[end - 1]):
+                continue
+            
+            last_end[keyword_id] = end
+            for index in emotions:
+                scores[index] += 1
         
+        return scores, max_level
+    
+    @property
+    def keywords(self) -> List[str]:
+        """Emotion and distress keywords, indexed by the keyword ids analyze_matches expects"""
+        return self._matcher.keywords
+    
+    def analyze_matches(self, text_lower: str, matches: List[Tuple[int, int, int]]) -> Tuple[str, int]:
+        """Detect emotion and distress level from keyword matches found elsewhere
+        
+        Lets a caller scanning text with a larger matcher reuse its matches,
+        as long as that matcher numbers ``keywords`` first, in the same order.
+        
+        Args:
+            text_lower: Lowercased text the matches were found in
+            matches: (start, end, keyword_id) matches of ``keywords`` ordered by end offset
+            
+        Returns:
+            Tuple of (emotion, distress_level)
+        """
+        scores, distress_level = self._score_matches(text_lower, matches)
+        return self._pick_emotion(scores), distress_level
+    
+    def _pick_emotion(self, scores: List[int]) -> str:
+        """Pick the primary emotion from emotion scores
+        
+        Args:
+            scores: Emotion scores ordered like emotion_keywords
+            
+        Returns:
+            Detected emotion (happy, sad, angry, anxious, distressed, hopeful, or neutral)
+        """
         # Get emotion with highest score
-        max_score = max(emotion_scores.values())
+        max_score = max(scores, default=0)
         if max_score == 0:
             return 'neutral'
         
         # Get all emotions with max score
-        max_emotions = [e for e, s in emotion_scores.items() if s == max_score]
+        max_emotions = [e for e, s in zip(self._emotions, scores) if s == max_score]
         
         # Prioritize distressed if it's one of the max emotions
         if 'distressed' in max_emotions:
@@ -116,6 +205,21 @@ class EmotionDetector:
         # Return first max emotion
         return max_emotions[0]
     
+    def detect_emotion(self, text: str) -> str:
+        """Detect primary emotion in text
+        
+        Args:
+            text: Text to analyze
+            
+        Returns:
+            Detected emotion (happy, sad, angry, anxious, distressed, hopeful, or neutral)
+        """
+        if not text:
+            return 'neutral'
+        
+        scores, _ = self._scan(text.lower())
+        return self._pick_emotion(scores)
+    
     def detect_distress_level(self, text: str) -> int:
         """Detect distress level in text on a scale of 0-10
         
@@ -128,18 +232,11 @@ class EmotionDetector:
         if not text:
             return 0
         
-        text_lower = text.lower()
-        max_level = 0
-        
-        # Check for distress keywords
-        for keyword, level in self.distress_keywords.items():
-            if keyword in text_lower:
-                max_level = max(max_level, level)
-        
-        return max_level
+        _, distress_level = self._scan(text.lower())
+        return distress_level
     
     def detect_emotion_and_distress(self, text: str) -> Tuple[str, int]:
-        """Detect both emotion and distress level
+        """Detect both emotion and distress level in a single pass
         
         Args:
             text: Text to analyze
@@ -147,7 +244,169 @@ class EmotionDetector:
         Returns:
             Tuple of (emotion, distress_level)
         """
-        emotion = self.detect_emotion(text)
-        distress_level = self.detect_distress_level(text)
+        if not text:
+            return 'neutral', 0
+        
+        scores, distress_level = self._scan(text.lower())
+        return self._pick_emotion(scores), distress_level
+    
+    def detect_with_scores(self, text: str) -> Tuple[str, Dict[str, int], int]:
+        """Detect emotion and distress level and return the keyword hits per emotion
+        
+        Args:
+            text: Text to analyze
+        
+        Returns:
+            Tuple of (emotion, emotion_scores, distress_level)
+        """
+        if not text:
+            return 'neutral', dict.fromkeys(self._emotions, 0), 0
+        
+        scores, distress_level = self._scan(text.lower())
+        return self._pick_emotion(scores), dict(zip(self._emotions, scores)), distress_level
+    
+    def detect_batch(self, texts: List[str]) -> List[Tuple[str, int]]:
+        """Detect emotion and distress level for many texts at once
+        
+        The texts are lowercased and scanned as one separator-joined string,
+        then the matches are split back per text.
+        
+        Args:
+            texts: Texts to analyze
+            
+        Returns:
+            List of (emotion, distress_level) tuples in the same order as texts
+        """
+        if not texts:
+            return []
+        
+        if any(BATCH_SEPARATOR in text for text in texts if text):
+            return [self.detect_emotion_and_distress(text) for text in texts]
+        
+        joined = BATCH_SEPARATOR.join(text or '' for text in texts).lower()
         
-        return emotion, distress_level
+        # Offsets of each text inside the joined string
+        starts = []
+        offset = 0
+        for segment in joined.split(BATCH_SEPARATOR):
+            starts.append(offset)
+            offset += len(segment) + 1
+        
+        starts.append(offset)
+        
+        # Matches never span a separator and arrive in text order, so they
+        # can be handed out to each text with a single forward walk
+        matches, _ = self._matcher.find_all(joined)
+        grouped: List[List[Tuple[int, int, int]]] = [[] for _ in texts]
+        index = 0
+        for match in matches:
+            while match[0] >= starts[index + 1]:
+                index += 1
+            grouped[index].append(match)
+        
+        # The separator is a non-word character, so word boundaries at the
+        # edges of each text behave exactly as they do for a standalone scan
+        results = []
+        for text_matches in grouped:
+            scores, distress_level = self._score_matches(joined, text_matches)
+            results.append((self._pick_emotion(scores), distress_level))
+        
+        return results
+    
+    def distress_stream(self, max_length: int = 10000) -> 'DistressStream':
+        """Start tracking the distress level of text that is being typed
+        
+        Args:
+            max_length: Longest text the stream accepts
+            
+        Returns:
+            DistressStream for one draft
+        """
+        return DistressStream(self._matcher, self._state_distress, max_length)
+
+
+class DistressStream:
+    """Distress level of a draft that changes a little at a time
+    
+    The matcher state and the running distress level are kept after every
+    character, so an edit that replaces the text from some offset onwards
+    (typing, backspace, or retyping the end) costs only the replaced and new
+    characters. The level always equals detect_distress_level on the full text.
+    """
+    
+    def __init__(self, matcher: KeywordMatcher, state_distress: List[int], max_length: int = 10000):
+        """Initialize an empty draft
+        
+        Args:
+            matcher: Matcher of the detector's keywords
+            state_distress: Distress level per matcher state
+            max_length: Longest text the stream accepts
+        """
+        self._matcher = matcher
+        self._state_distress = state_distress
+        self.max_length = max_length
+        
+        # Entry i is the matcher state and the highest distress level after i characters
+        self._states = array('i', [0])
+        self._levels = array('b', [0])
+    
+    @property
+    def length(self) -> int:
+        """Number of characters in the draft"""
+        return len(self._states) - 1
+    
+    @property
+    def distress_level(self) -> int:
+        """Distress level of the draft (0-10)"""
+        return self._levels[-1]
+    
+    def update(self, offset: int, text: str) -> int:
+        """Replace the draft from offset onwards with text
+        
+        Args:
+            offset: Characters of the current draft to keep
+            text: Text that follows them
+            
+        Returns:
+            Distress level of the new draft
+            
+        Raises:
+            ValueError: If the offset is outside the draft or the draft gets too long
+        """
+        if not 0 <= offset <= self.length:
+            raise ValueError(f"offset {offset} is outside the draft of {self.length} characters")
+        if offset + len(text) > self.max_length:
+            raise ValueError(f"drafts are limited to {self.max_length} characters")
+        
+        del self._states[offset + 1:]
+        del self._levels[offset + 1:]
+        if not text:
+            return self._levels[-1]
+        
+        lowered = text.lower()
+        if len(lowered) == len(text):
+            states = self._matcher.states(lowered, self._states[-1])
+        else:
+            # Some characters lowercase to several; keep one state per typed character
+            states = []
+            state = self._states[-1]
+            for char in text:
+                state = self._matcher.states(char.lower(), state)[-1]
+                states.append(state)
+        
+        state_distress = self._state_distress
+        level = self._levels[-1]
+        levels = []
+        for state in states:
+            if state_distress[state] > level:
+                level = state_distress[state]
+            levels.append(level)
+        
+        self._states.extend(states)
+        self._levels.extend(levels)
+        return level
+
+
+def _is_word_char(char: str) -> bool:
+    """Check whether a character counts as a word character for regex \\b"""
+    return char.isalnum() or char == '_'
@@ -0,0 +1,204 @@
+import re
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from utils.text_processor import TextProcessor
+
+logger = logging.getLogger(__name__)
+
+# Words and individual punctuation marks, a close approximation of LLM tokens
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+def count_tokens(text: str) -> int:
+    """Approximate the number of LLM tokens in text
+
+    Args:
+        text: Text to measure
+
+    Returns:
+        Approximate token count
+    """
+    return len(TOKEN_PATTERN.findall(text)) if text else 0
+
+class CompactedPrompt(NamedTuple):
+    """Chat prompt parts after history compaction"""
+    system_message: str
+    history: List[Dict[str, str]]
+    summary: str
+    tokens_saved: int
+
+class _SummaryState(NamedTuple):
+    """Rolling summary of the messages folded so far in one conversation
+
+    States are never modified once stored; extending one builds a new state,
+    so readers can use a state without holding the lock.
+    """
+    folded: int
+    head: str  # digest of the first message
+    tail: str  # digest of the last folded message
+    lines: Tuple[str, ...]
+    line_tokens: Tuple[int, ...]
+    summary: str
+    summary_tokens: int
+    folded_tokens: int
+
+_EMPTY_STATE = _SummaryState(0, '', '', (), (), '', 0, 0)
+
+class HistoryCompactor:
+    """Fits chat history into a token budget
+
+    The most recent turns are kept verbatim. Older turns are folded into a
+    rolling summary that is kept per conversation (by session id, or by the
+    first message when the client sends the full history) and extended with
+    only the newly folded messages each turn. A stored summary is reused only
+    when the request's first message and last folded message match the ones
+    it was built from, so checking it costs two hashes however long the
+    conversation is.
+    """
+
+    def __init__(
+        self,
+        token_budget: int = 3000,
+        summary_token_budget: int = 400,
+        message_summary_length: int = 120,
+        max_conversations: int = 10000,
+        text_processor: Optional[TextProcessor] = None
+    ):
+        """Initialize the compactor
+
+        Args:
+            token_budget: Token budget for system message, history and user message together
+            summary_token_budget: Tokens reserved for the summary of older turns
+            message_summary_length: Characters kept per folded message
+            max_conversations: Number of rolling summaries kept in memory
+            text_processor: Text processor used to summarize messages
+        """
+        self.token_budget = token_budget
+        self.summary_token_budget = summary_token_budget
+        self.message_summary_length = message_summary_length
+        self.max_conversations = max_conversations
+        self.text_processor = text_processor or TextProcessor()
+
+        self._states: 'OrderedDict[str, _SummaryState]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def compact(
+        self,
+        system_message: str,
+        user_message: str,
+        history: List[Dict[str, str]],
+        conversation_id: Optional[str] = None
+    ) -> CompactedPrompt:
+        """Compact chat history to fit the token budget
+
+        Args:
+            system_message: System message for context
+            user_message: Current user message
+            history: Previous messages with 'role' and 'content' keys, oldest first
+            conversation_id: Server-side session id; without one the summary is keyed by the first message
+
+        Returns:
+            CompactedPrompt with the system message (including any summary) and the kept history
+        """
+        if not history:
+            return CompactedPrompt(system_message, history, '', 0)
+
+        available = self.token_budget - count_tokens(system_message) - count_tokens(user_message)
+
+        # Keep the newest turns that fit; only the kept part is measured
+        kept_tokens = 0
+        split = len(history)
+        while split > 0:
+            tokens = count_tokens(history[split - 1]['content'])
+            if kept_tokens + tokens > available - (self.summary_token_budget if split > 1 else 0):
+                break
+            kept_tokens += tokens
+            split -= 1
+
+        if split == 0:
+            return CompactedPrompt(system_message, history, '', 0)
+
+        key = str(conversation_id) if conversation_id else f"first:{_digest(history[0])}"
+        state = self._fold(key, history, split)
+        tokens_saved = max(0, state.folded_tokens - state.summary_tokens)
+
+        compacted_system_message = f"{system_message}\n\n        Summary of the earlier conversation: {state.summary}"
+
+        return CompactedPrompt(compacted_system_message, history[split:], state.summary, tokens_saved)
+
+    def _fold(self, key: str, history: List[Dict[str, str]], split: int) -> _SummaryState:
+        """Extend (or rebuild) the rolling summary so it covers history[:split]
+
+        The lock only guards the lookup and the store; hashing and summarizing
+        run outside it, so conversations don't wait for each other.
+
+        Args:
+            key: Conversation id or first-message key
+            history: Full history
+            split: Number of oldest messages to fold
+
+        Returns:
+            Summary state covering history[:split]
+        """
+        with self._lock:
+            state = self._states.get(key)
+            if state is not None:
+                self._states.move_to_end(key)
+
+        # Reuse the summary only if it was built from a prefix of this history
+        if state is not None and (
+            state.folded > split
+            or state.head != _digest(history[0])
+            or state.tail != _digest(history[state.folded - 1])
+        ):
+            state = None
+
+        extended = self._extend(state or _EMPTY_STATE, history, split)
+        if extended is not state:
+            with self._lock:
+                self._states[key] = extended
+                self._states.move_to_end(key)
+                while len(self._states) > self.max_conversations:
+                    self._states.popitem(last=False)
+
+        return extended
+
+    def _extend(self, state: _SummaryState, history: List[Dict[str, str]], split: int) -> _SummaryState:
+        """New state with history[state.folded:split] folded into the summary"""
+        if state.folded == split:
+            return state
+
+        lines, line_tokens = list(state.lines), list(state.line_tokens)
+        summary_tokens, folded_tokens = state.summary_tokens, state.folded_tokens
+        for msg in history[state.folded:split]:
+            content = msg['content']
+            line = f"{msg['role']}: {self.text_processor.summarize(content, self.message_summary_length)}"
+            tokens = count_tokens(line)
+            lines.append(line)
+            line_tokens.append(tokens)
+            summary_tokens += tokens
+            folded_tokens += count_tokens(content)
+
+        # Drop the oldest summary lines once the summary outgrows its budget
+        dropped = 0
+        while len(lines) - dropped > 1 and summary_tokens > self.summary_token_budget:
+            summary_tokens -= line_tokens[dropped]
+            dropped += 1
+        lines, line_tokens = lines[dropped:], line_tokens[dropped:]
+
+        return _SummaryState(
+            folded=split,
+            head=state.head or _digest(history[0]),
+            tail=_digest(history[split - 1]),
+            lines=tuple(lines),
+            line_tokens=tuple(line_tokens),
+            summary=' '.join(lines),
+            summary_tokens=summary_tokens,
+            folded_tokens=folded_tokens
+        )
+
+def _digest(msg: Dict[str, str]) -> str:
+    """Hash identifying one message"""
+    return hashlib.sha1(f"{msg['role']}\0{msg['content']}".encode('utf-8')).hexdigest()
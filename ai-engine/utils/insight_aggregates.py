@@ -0,0 +1,628 @@
+import json
+import hashlib
+import logging
+import math
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from datetime import date, datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from utils.insight_stats import (
+    MAX_MEDICATIONS, MAX_PAIRS, MAX_SYMPTOMS, MIN_PAIR_DAYS, PHASES, RECENT_CYCLES,
+    DEFAULT_CYCLE_LENGTH, DEFAULT_PERIOD_LENGTH, PhaseRow, MedicationPair, cycle_phase, describe_medication,
+    format_cycle_section, format_phase_section, format_medication_section, join_sections
+)
+
+logger = logging.getLogger(__name__)
+
+# Bump when the persisted state layout changes; older aggregates are dropped and rebuilt
+AGGREGATE_VERSION = 2
+
+# Column of the phase histogram that counts symptoms outside any known cycle
+UNKNOWN_PHASE = len(PHASES)
+
+class AggregateResyncError(RuntimeError):
+    """Raised when a delta can't be applied incrementally and the full history has to be resent"""
+
+def _day(value: Any) -> Optional[int]:
+    """Parse an ISO date into a day ordinal (UTC), or None if it can't be parsed"""
+    if not isinstance(value, str):
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.strip().replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc)
+    return parsed.toordinal()
+
+def _number(value: Any) -> Optional[float]:
+    """Parse a number, or None if missing or not numeric"""
+    if isinstance(value, bool) or value is None:
+        return None
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return number if math.isfinite(number) else None
+
+def delta_hash(cycles: List[Any], symptoms: List[Any], medications: List[Any]) -> str:
+    """Hash identifying a delta, to recognize a retried request"""
+    payload = json.dumps([cycles, symptoms, medications], sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+class RunningStats:
+    """Count, mean, sd, range, median and linear trend of a series, updated one value at a time
+
+    The median comes from a histogram of the values, which stays small for
+    day counts such as cycle and period lengths.
+    """
+
+    def __init__(self):
+        """Initialize empty statistics"""
+        self.count = 0
+        self.total = 0.0
+        self.squares = 0.0
+        self.weighted = 0.0  # sum of position * value, for the trend
+        self.minimum = math.inf
+        self.maximum = -math.inf
+        self.histogram: Dict[float, int] = {}
+
+    def add(self, value: float) -> None:
+        """Append a value to the series"""
+        self.weighted += self.count * value
+        self.count += 1
+        self.total += value
+        self.squares += value * value
+        self.minimum = min(self.minimum, value)
+        self.maximum = max(self.maximum, value)
+        self.histogram[value] = self.histogram.get(value, 0) + 1
+
+    def with_value(self, value: Optional[float]) -> 'RunningStats':
+        """Copy of the statistics with one more value appended (or unchanged if None)"""
+        stats = RunningStats.from_state(self.to_state())
+        if value is not None:
+            stats.add(value)
+        return stats
+
+    def mean(self) -> float:
+        """Mean of the series"""
+        return self.total / self.count
+
+    def sd(self) -> Optional[float]:
+        """Sample standard deviation, or None with fewer than two values"""
+        if self.count < 2:
+            return None
+        return math.sqrt(max(0.0, (self.squares - self.total * self.total / self.count) / (self.count - 1)))
+
+    def median(self) -> Optional[float]:
+        """Median of the series, or None if empty"""
+        if not self.count:
+            return None
+        lower, upper = (self.count - 1) // 2, self.count // 2
+        seen, low_value = 0, None
+        for value in sorted(self.histogram):
+            seen += self.histogram[value]
+            if low_value is None and seen > lower:
+                low_value = value
+            if seen > upper:
+                return (low_value + value) / 2
+        return low_value
+
+    def slope(self) -> Optional[float]:
+        """Least-squares slope of value against position, or None with fewer than two values"""
+        n = self.count
+        if n < 2:
+            return None
+        sum_x = n * (n - 1) / 2
+        sum_xx = (n - 1) * n * (2 * n - 1) / 6
+        return (n * self.weighted - sum_x * self.total) / (n * sum_xx - sum_x * sum_x)
+
+    def to_state(self) -> list:
+        """Compact JSON-serializable state"""
+        return [self.count, self.total, self.squares, self.weighted, [[value, count] for value, count in self.histogram.items()]]
+
+    @classmethod
+    def from_state(cls, state: list) -> 'RunningStats':
+        """Rebuild statistics from to_state() output"""
+        stats = cls()
+        stats.count, stats.total, stats.squares, stats.weighted = state[0], state[1], state[2], state[3]
+        stats.histogram = {value: count for value, count in state[4]}
+        if stats.histogram:
+            stats.minimum, stats.maximum = min(stats.histogram), max(stats.histogram)
+        return stats
+
+class InsightAggregate:
+    """Running insight statistics for one user
+
+    Cycle, symptom and medication events are folded in as they arrive, so an
+    update costs O(new events) and the summary has the same sections as
+    summarize_tracking_data. Only the latest RECENT_CYCLES closed cycles are
+    kept: symptoms of the open cycle wait until it closes (its length may still
+    be unknown) and symptoms dated before the retained cycles need a resync.
+    Missing lengths are estimated from the medians at the time a cycle closes,
+    so phases can differ slightly from a batch summary of the same history.
+    Per-type symptom days are kept for the medication correlations.
+
+    version counts the deltas applied and last_delta is the hash of the
+    latest, so a retried delta can be recognized instead of counted twice.
+    """
+
+    def __init__(self):
+        """Initialize an empty aggregate"""
+        self.version = 0
+        self.last_delta = ''
+
+        self.cycle_count = 0
+        self.first_start: Optional[int] = None
+        self.open_cycle: Optional[List[Any]] = None  # [start, cycle length, period length]
+        self.closed_cycles: deque = deque(maxlen=RECENT_CYCLES)
+        self.lengths = RunningStats()
+        self.periods = RunningStats()
+
+        self.symptom_count = 0
+        self.phase_counts: Dict[str, List[int]] = {}
+        self.severity: Dict[str, List[float]] = {}  # type -> [sum, count]
+        self.pending: List[List[Any]] = []  # [day, type] of symptoms in the open cycle
+        self.symptom_days: Dict[str, List[int]] = {}
+        self.unsaved_days: List[List[Any]] = []  # [type, day] not yet written to the store
+
+        self.medications: Dict[str, List[Any]] = {}  # name -> [dosage, unit, start, end]
+
+    def apply(self, cycles: List[Any], symptoms: List[Any], medications: List[Any]) -> None:
+        """Fold new events into the aggregate
+
+        Args:
+            cycles: Cycle records (startDate, cycleLength, periodLength, optional nested symptoms)
+            symptoms: Symptom records (date, type, severity)
+            medications: Medication records (name, dosage, unit, startDate, endDate)
+
+        Raises:
+            AggregateResyncError: If an event is older than the retained history
+        """
+        cycle_records = [cycle for cycle in cycles or [] if isinstance(cycle, dict)]
+        symptom_records = [symptom for symptom in symptoms or [] if isinstance(symptom, dict)]
+        for cycle in cycle_records:
+            symptom_records.extend(symptom for symptom in cycle.get('symptoms') or [] if isinstance(symptom, dict))
+
+        # Cycles and symptoms in date order (a cycle before symptoms of its first day),
+        # so a full history replays like the same events arriving one by one
+        events = [(_day(cycle.get('startDate')), 0, cycle) for cycle in cycle_records]
+        events.extend(
+            (_day(symptom.get('date')), 1, symptom) for symptom in symptom_records if symptom.get('type') is not None
+        )
+        for day, kind, record in sorted((event for event in events if event[0] is not None), key=lambda event: event[:2]):
+            if kind == 0:
+                self.add_cycle(day, _number(record.get('cycleLength')), _number(record.get('periodLength')))
+            else:
+                self.add_symptom(day, str(record['type']), _number(record.get('severity')))
+
+        for medication in medications or []:
+            if isinstance(medication, dict) and medication.get('name') is not None:
+                self.add_medication(
+                    str(medication['name']), medication.get('dosage'), medication.get('unit'),
+                    _day(medication.get('startDate')), _day(medication.get('endDate'))
+                )
+
+    def add_cycle(self, start: int, length: Optional[float], period: Optional[float]) -> None:
+        """Add a cycle; the previous one closes with its length filled from the gap if unknown"""
+        if self.open_cycle is None:
+            self.first_start = start
+            self._fold_pending(start, None)
+        elif start == self.open_cycle[0]:
+            # The open cycle was resent, e.g. after its length was entered
+            if length is not None:
+                self.open_cycle[1] = length
+            if period is not None:
+                self.open_cycle[2] = period
+            return
+        elif start < self.open_cycle[0]:
+            raise AggregateResyncError('Cycle is older than the latest tracked cycle')
+        else:
+            closing = self.open_cycle
+            if closing[1] is None:
+                closing[1] = float(start - closing[0])
+            self._fold_pending(start, closing)
+            self.lengths.add(closing[1])
+            if closing[2] is not None:
+                self.periods.add(closing[2])
+            self.closed_cycles.append(closing)
+
+        self.open_cycle = [start, length, period]
+        self.cycle_count += 1
+
+    def add_symptom(self, day: int, symptom_type: str, severity: Optional[float]) -> None:
+        """Add a symptom to the phase histogram, severity means and symptom days"""
+        if self.open_cycle is None or day >= self.open_cycle[0]:
+            self.pending.append([day, symptom_type])
+        elif day < self.first_start:
+            self._count_phase(symptom_type, UNKNOWN_PHASE)
+        else:
+            cycle = next((cycle for cycle in reversed(self.closed_cycles) if day >= cycle[0]), None)
+            if cycle is None:
+                raise AggregateResyncError('Symptom is older than the retained cycles')
+            self._count_phase(symptom_type, self._phase(day, cycle))
+
+        self.phase_counts.setdefault(symptom_type, [0] * (len(PHASES) + 1))
+        self.symptom_count += 1
+        if severity is not None:
+            tally = self.severity.setdefault(symptom_type, [0.0, 0])
+            tally[0] += severity
+            tally[1] += 1
+
+        days = self.symptom_days.setdefault(symptom_type, [])
+        position = bisect_left(days, day)
+        if position == len(days) or days[position] != day:
+            days.insert(position, day)
+            self.unsaved_days.append([symptom_type, day])
+
+    def add_medication(self, name: str, dosage: Any, unit: Any, start: Optional[int], end: Optional[int]) -> None:
+        """Add or replace a medication (the latest record for a name wins)"""
+        self.medications.pop(name, None)
+        self.medications[name] = [dosage, unit, start, end]
+
+    def summary(self) -> str:
+        """Summary text with the same sections as summarize_tracking_data"""
+        return join_sections([self._cycle_section(), self._phase_section(), self._medication_section()])
+
+    def _phase(self, day: int, cycle: List[Any]) -> int:
+        """Phase column of a day in a cycle, with missing lengths taken from the medians so far"""
+        cycle_length = cycle[1] if cycle[1] is not None else self.lengths.median() or DEFAULT_CYCLE_LENGTH
+        period_length = cycle[2] if cycle[2] is not None else self.periods.median() or DEFAULT_PERIOD_LENGTH
+        phase = cycle_phase(day - cycle[0] + 1, cycle_length, period_length)
+        return PHASES.index(phase) if phase in PHASES else UNKNOWN_PHASE
+
+    def _count_phase(self, symptom_type: str, column: int) -> None:
+        """Increment one cell of the phase histogram"""
+        self.phase_counts.setdefault(symptom_type, [0] * (len(PHASES) + 1))[column] += 1
+
+    def _fold_pending(self, before: int, cycle: Optional[List[Any]]) -> None:
+        """Fold pending symptoms dated before a day into the histogram, within the given cycle"""
+        remaining = []
+        for day, symptom_type in self.pending:
+            if day >= before:
+                remaining.append([day, symptom_type])
+            else:
+                self._count_phase(symptom_type, self._phase(day, cycle) if cycle is not None else UNKNOWN_PHASE)
+        self.pending = remaining
+
+    def _cycle_section(self) -> str:
+        """Cycle length statistics"""
+        if self.open_cycle is None:
+            return ''
+
+        length_stats = None
+        lengths = self.lengths.with_value(self.open_cycle[1])
+        if lengths.count:
+            recent = [cycle[1] for cycle in self.closed_cycles]
+            if self.open_cycle[1] is not None:
+                recent.append(self.open_cycle[1])
+            recent = recent[-RECENT_CYCLES:]
+            length_stats = {
+                'mean': lengths.mean(),
+                'median': lengths.median(),
+                'min': lengths.minimum,
+                'max': lengths.maximum,
+                'sd': lengths.sd(),
+                'recent': sum(recent) / len(recent) if lengths.count > RECENT_CYCLES else None,
+                'trend': lengths.slope() if lengths.count >= 3 else None,
+                'next': date.fromordinal(self.open_cycle[0] + int(round(sum(recent) / len(recent))))
+            }
+
+        period_stats = None
+        periods = self.periods.with_value(self.open_cycle[2])
+        if periods.count:
+            period_stats = {'mean': periods.mean(), 'min': periods.minimum, 'max': periods.maximum}
+
+        return format_cycle_section(
+            self.cycle_count, date.fromordinal(self.first_start), date.fromordinal(self.open_cycle[0]),
+            length_stats, period_stats
+        )
+
+    def _phase_section(self) -> str:
+        """Symptom frequency by cycle phase, with the open cycle's symptoms placed provisionally"""
+        if not self.symptom_count:
+            return ''
+
+        counts = {symptom_type: list(row) for symptom_type, row in self.phase_counts.items()}
+        for day, symptom_type in self.pending:
+            column = self._phase(day, self.open_cycle) if self.open_cycle is not None else UNKNOWN_PHASE
+            counts[symptom_type][column] += 1
+
+        totals = {symptom_type: sum(row) for symptom_type, row in counts.items()}
+        rows = []
+        for symptom_type in sorted(counts, key=lambda name: -totals[name])[:MAX_SYMPTOMS]:
+            tally = self.severity.get(symptom_type)
+            rows.append(PhaseRow(
+                symptom_type,
+                counts[symptom_type][:len(PHASES)],
+                totals[symptom_type],
+                totals[symptom_type] / self.cycle_count if self.cycle_count else None,
+                tally[0] / tally[1] if tally else None
+            ))
+        return format_phase_section(self.symptom_count, len(counts), rows)
+
+    def _medication_section(self) -> str:
+        """Medication list and symptom/medication co-occurrence from the symptom days"""
+        if not self.medications:
+            return ''
+
+        shown = list(self.medications.items())[:MAX_MEDICATIONS]
+        described = [
+            describe_medication(
+                name,
+                ' '.join(str(part) for part in (dosage, unit) if part is not None and part),
+                date.fromordinal(start) if start is not None else None,
+                date.fromordinal(end) if end is not None else None
+            )
+            for name, (dosage, unit, start, end) in shown
+        ]
+
+        dated = [(name, start, end) for name, (_, _, start, end) in shown if start is not None]
+        if not self.symptom_days or not dated:
+            return format_medication_section(described, len(self.medications), [])
+
+        # Counts over the daily grid from the first to the last symptom day; phi from the 2x2 table
+        first_day = min(days[0] for days in self.symptom_days.values())
+        last_day = max(days[-1] for days in self.symptom_days.values())
+        total_days = last_day - first_day + 1
+
+        candidates = []
+        for name, start, end in dated:
+            end = end if end is not None else last_day
+            active_days = max(0, min(end, last_day) - max(start, first_day) + 1)
+            for symptom_type, days in self.symptom_days.items():
+                together = bisect_right(days, end) - bisect_left(days, start)
+                denominator = len(days) * (total_days - len(days)) * active_days * (total_days - active_days)
+                if together < MIN_PAIR_DAYS or not denominator:
+                    continue
+                candidates.append(MedicationPair(
+                    symptom_type,
+                    name,
+                    together,
+                    together / active_days,
+                    (len(days) - together) / (total_days - active_days),
+                    (total_days * together - len(days) * active_days) / math.sqrt(denominator)
+                ))
+
+        pairs = sorted(candidates, key=lambda pair: -abs(pair.correlation))[:MAX_PAIRS]
+        return format_medication_section(described, len(self.medications), pairs)
+
+    def to_state(self) -> Dict[str, Any]:
+        """Compact JSON-serializable state, without the symptom days (stored separately)"""
+        return {
+            'v': AGGREGATE_VERSION,
+            'delta': [self.version, self.last_delta],
+            'cycles': [self.cycle_count, self.first_start, self.open_cycle, list(self.closed_cycles)],
+            'lengths': self.lengths.to_state(),
+            'periods': self.periods.to_state(),
+            'symptoms': [self.symptom_count, self.phase_counts, self.severity, self.pending],
+            'medications': self.medications
+        }
+
+    @classmethod
+    def from_state(cls, state: Dict[str, Any], symptom_days: Dict[str, List[int]]) -> 'InsightAggregate':
+        """Rebuild an aggregate from to_state() output and its stored symptom days"""
+        aggregate = cls()
+        aggregate.version, aggregate.last_delta = state['delta']
+        aggregate.cycle_count, aggregate.first_start, aggregate.open_cycle, closed = state['cycles']
+        aggregate.closed_cycles.extend(closed)
+        aggregate.lengths = RunningStats.from_state(state['lengths'])
+        aggregate.periods = RunningStats.from_state(state['periods'])
+        aggregate.symptom_count, aggregate.phase_counts, aggregate.severity, aggregate.pending = state['symptoms']
+        aggregate.medications = state['medications']
+        aggregate.symptom_days = symptom_days
+        return aggregate
+
+class InsightAggregateStore:
+    """Per-user insight aggregates persisted in SQLite
+
+    Each user's running statistics are one zlib-compressed JSON row of bounded
+    size; symptom days are appended to a separate table, so saving an update
+    only writes the new days. Recently used aggregates stay in memory.
+
+    Several worker processes can share the file: every update runs in an
+    immediate (write-locked) transaction, and a cached aggregate is used only
+    while its revision matches the row on disk, so updates made by another
+    worker are never overwritten with a stale copy.
+    """
+
+    def __init__(self, path: str, max_cached: int = 1024):
+        """Initialize the aggregate store (the file is opened, or created, on first use)
+
+        Args:
+            path: SQLite file path
+            max_cached: Maximum number of aggregates kept in memory
+        """
+        self.path = path
+        self.max_cached = max(1, max_cached)
+        self._cached: 'OrderedDict[str, Tuple[str, InsightAggregate]]' = OrderedDict()  # user -> (revision, aggregate)
+        self._lock = threading.Lock()
+
+        # Counters
+        self.updates = 0
+        self.resyncs = 0
+
+        self._db: Optional[sqlite3.Connection] = None
+
+    def _open(self) -> sqlite3.Connection:
+        """Connect to the store and create its tables on first use (lock held)"""
+        if self._db is not None:
+            return self._db
+
+        # Transactions are explicit; the timeout covers other workers holding the write lock
+        db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=30)
+        db.execute(
+            'CREATE TABLE IF NOT EXISTS aggregates ('
+            "user_id TEXT PRIMARY KEY, state BLOB NOT NULL, revision TEXT NOT NULL DEFAULT '', updated_at REAL NOT NULL)"
+        )
+        if 'revision' not in [column[1] for column in db.execute('PRAGMA table_info(aggregates)')]:
+            db.execute("ALTER TABLE aggregates ADD COLUMN revision TEXT NOT NULL DEFAULT ''")
+        db.execute(
+            'CREATE TABLE IF NOT EXISTS symptom_days ('
+            'user_id TEXT NOT NULL, type TEXT NOT NULL, day INTEGER NOT NULL, '
+            'PRIMARY KEY (user_id, type, day)) WITHOUT ROWID'
+        )
+        self._db = db
+        return self._db
+
+    def apply(
+        self,
+        user_id: str,
+        cycles: List[Any],
+        symptoms: List[Any],
+        medications: List[Any],
+        reset: bool = False,
+        version: Optional[int] = None
+    ) -> Tuple[str, int]:
+        """Fold new events into a user's aggregate and summarize it
+
+        A delta is applied only on top of the version the client last saw. A
+        retry of the latest delta (same version and events, e.g. after a 503 or
+        a double submit) returns the current summary without applying it again.
+
+        Args:
+            user_id: User the events belong to
+            cycles: New cycle records
+            symptoms: New symptom records
+            medications: New or updated medication records
+            reset: Replace any stored aggregate (the events are the full history)
+            version: Aggregate version the delta was built on (ignored with reset)
+
+        Returns:
+            Tuple of (summary text for the insights prompt, new aggregate version)
+
+        Raises:
+            AggregateResyncError: If the user has no aggregate yet, the version
+                doesn't match or the delta can't be applied; the full history
+                has to be sent with reset
+        """
+        fingerprint = delta_hash(cycles, symptoms, medications)
+        with self._lock, self._transaction(user_id):
+            if reset:
+                self._delete(user_id)
+                aggregate = InsightAggregate()
+            else:
+                aggregate = self._load(user_id)
+                if aggregate is None:
+                    self.resyncs += 1
+                    raise AggregateResyncError('No insight aggregate for this user, send the full history with reset')
+                if version == aggregate.version - 1 and fingerprint == aggregate.last_delta:
+                    return aggregate.summary(), aggregate.version
+                if version != aggregate.version:
+                    self.resyncs += 1
+                    raise AggregateResyncError(f"Insight aggregate is at version {aggregate.version}, not {version}")
+
+            try:
+                aggregate.apply(cycles, symptoms, medications)
+            except AggregateResyncError:
+                # A partly applied delta leaves the aggregate inconsistent
+                self._delete(user_id)
+                self.resyncs += 1
+                raise
+
+            aggregate.version += 1
+            aggregate.last_delta = fingerprint
+            self._save(user_id, aggregate)
+            self.updates += 1
+            return aggregate.summary(), aggregate.version
+
+    def delete(self, user_id: str) -> None:
+        """Remove a user's aggregate"""
+        with self._lock, self._transaction(user_id):
+            self._delete(user_id)
+
+    @contextmanager
+    def _transaction(self, user_id: str) -> Iterator[None]:
+        """Write-locked transaction for one user's update (lock held)
+
+        A resync is committed, so a dropped aggregate stays dropped. Any other
+        error rolls back and forgets the cached aggregate, which may be half
+        updated.
+        """
+        self._open().execute('BEGIN IMMEDIATE')
+        try:
+            yield
+            self._db.execute('COMMIT')
+        except AggregateResyncError:
+            self._db.execute('COMMIT')
+            raise
+        except BaseException:
+            self._cached.pop(user_id, None)
+            if self._db.in_transaction:
+                self._db.execute('ROLLBACK')
+            raise
+
+    def _load(self, user_id: str) -> Optional[InsightAggregate]:
+        """Get an aggregate from memory, or from disk if another worker changed it (in a transaction)"""
+        row = self._db.execute('SELECT revision, state FROM aggregates WHERE user_id = ?', (user_id,)).fetchone()
+        if row is None:
+            self._cached.pop(user_id, None)
+            return None
+
+        revision = row[0]
+        cached = self._cached.get(user_id)
+        if cached is not None and cached[0] == revision:
+            self._cached.move_to_end(user_id)
+            return cached[1]
+
+        state = json.loads(zlib.decompress(row[1]))
+        if state.get('v') != AGGREGATE_VERSION:
+            self._cached.pop(user_id, None)
+            return None
+
+        symptom_days: Dict[str, List[int]] = {}
+        for symptom_type, day in self._db.execute(
+            'SELECT type, day FROM symptom_days WHERE user_id = ? ORDER BY type, day', (user_id,)
+        ):
+            symptom_days.setdefault(symptom_type, []).append(day)
+
+        aggregate = InsightAggregate.from_state(state, symptom_days)
+        self._remember(user_id, revision, aggregate)
+        return aggregate
+
+    def _save(self, user_id: str, aggregate: InsightAggregate) -> None:
+        """Write an aggregate and its new symptom days under a new revision (in a transaction)"""
+        blob = zlib.compress(json.dumps(aggregate.to_state(), separators=(',', ':')).encode('utf-8'))
+        revision = uuid.uuid4().hex
+        self._db.execute(
+            'INSERT OR REPLACE INTO aggregates (user_id, state, revision, updated_at) VALUES (?, ?, ?, ?)',
+            (user_id, blob, revision, time.time())
+        )
+        self._db.executemany(
+            'INSERT OR IGNORE INTO symptom_days (user_id, type, day) VALUES (?, ?, ?)',
+            [(user_id, symptom_type, day) for symptom_type, day in aggregate.unsaved_days]
+        )
+        aggregate.unsaved_days = []
+        self._remember(user_id, revision, aggregate)
+
+    def _delete(self, user_id: str) -> None:
+        """Remove a user's aggregate from memory and disk (in a transaction)"""
+        self._cached.pop(user_id, None)
+        self._db.execute('DELETE FROM aggregates WHERE user_id = ?', (user_id,))
+        self._db.execute('DELETE FROM symptom_days WHERE user_id = ?', (user_id,))
+
+    def _remember(self, user_id: str, revision: str, aggregate: InsightAggregate) -> None:
+        """Keep an aggregate in memory, evicting the least recently used (lock held)"""
+        self._cached[user_id] = (revision, aggregate)
+        self._cached.move_to_end(user_id)
+        while len(self._cached) > self.max_cached:
+            self._cached.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        """Get store counters
+
+        Returns:
+            Dictionary with update and resync counts and the in-memory size
+        """
+        return {
+            'updates': self.updates,
+            'resyncs': self.resyncs,
+            'cached': len(self._cached),
+            'maxCached': self.max_cached
+        }
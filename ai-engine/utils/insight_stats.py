@@ -0,0 +1,394 @@
+import logging
+from typing import Any, Dict, List, NamedTuple, Optional
+from utils.model_registry import model_registry
+
+logger = logging.getLogger(__name__)
+
+# Caps that keep the summary (and so the prompt) roughly constant in size
+MAX_SYMPTOMS = 8
+MAX_MEDICATIONS = 8
+MAX_PAIRS = 6
+RECENT_CYCLES = 3
+
+# Minimum days a symptom and a medication must coincide to be reported together
+MIN_PAIR_DAYS = 3
+
+PHASES = ['menstrual', 'follicular', 'ovulatory', 'luteal']
+
+# Ovulation is estimated this many days before the next period
+LUTEAL_PHASE_DAYS = 14
+DEFAULT_CYCLE_LENGTH = 28
+DEFAULT_PERIOD_LENGTH = 5
+
+class PhaseRow(NamedTuple):
+    """One symptom row of the phase table"""
+    symptom: str
+    phase_counts: List[int]
+    total: int
+    per_cycle: Optional[float]
+    mean_severity: Optional[float]
+
+class MedicationPair(NamedTuple):
+    """Co-occurrence of a symptom and a medication over the tracked days"""
+    symptom: str
+    medication: str
+    days_together: int
+    rate_on: float
+    rate_off: Optional[float]
+    correlation: float
+
+def summarize_tracking_data(cycles: List[Any], symptoms: List[Any], medications: List[Any]) -> str:
+    """Condense tracking records into a compact statistical summary
+
+    Computes cycle-length statistics, symptom frequency by cycle phase and
+    symptom/medication co-occurrence with pandas and NumPy. The output has a
+    bounded number of rows however long the history is.
+
+    Args:
+        cycles: Cycle records (startDate, cycleLength, periodLength, optional nested symptoms)
+        symptoms: Symptom records (date, type, severity)
+        medications: Medication records (name, dosage, unit, startDate, endDate)
+
+    Returns:
+        Summary text for the insights prompt
+    """
+    pd = model_registry.get('pandas')
+    np = model_registry.get('numpy')
+
+    cycle_frame = _cycle_frame(pd, cycles)
+    symptom_frame = _symptom_frame(pd, np, cycles, symptoms, cycle_frame)
+    medication_frame = _medication_frame(pd, medications)
+
+    sections = [
+        _cycle_section(np, cycle_frame),
+        _phase_section(pd, np, symptom_frame, len(cycle_frame)),
+        _medication_section(pd, np, symptom_frame, medication_frame)
+    ]
+    return join_sections(sections)
+
+def join_sections(sections: List[str]) -> str:
+    """Join the non-empty summary sections"""
+    sections = [section for section in sections if section]
+    return '\n\n'.join(sections) if sections else 'No cycle, symptom or medication data was provided.'
+
+def cycle_phase(cycle_day: int, cycle_length: float, period_length: float) -> str:
+    """Estimated cycle phase of a day (the scalar form of the rule in _symptom_frame)
+
+    Args:
+        cycle_day: Day of the cycle, starting at 1
+        cycle_length: Cycle length in days
+        period_length: Period length in days
+
+    Returns:
+        One of PHASES, or 'unknown' past the end of the cycle
+    """
+    ovulation_day = cycle_length - LUTEAL_PHASE_DAYS
+    if cycle_day > cycle_length:
+        return 'unknown'
+    if cycle_day <= period_length:
+        return 'menstrual'
+    if cycle_day < ovulation_day - 1:
+        return 'follicular'
+    if cycle_day <= ovulation_day + 1:
+        return 'ovulatory'
+    return 'luteal'
+
+def _records(items: Any) -> List[dict]:
+    """Keep only dict records"""
+    return [item for item in items or [] if isinstance(item, dict)]
+
+def _dates(pd, values):
+    """Parse ISO dates (unparseable values become NaT), normalized to days"""
+    return pd.to_datetime(values, errors='coerce', utc=True, format='ISO8601').dt.normalize()
+
+def _cycle_frame(pd, cycles: List[Any]):
+    """Cycles sorted by start, with missing lengths filled from the gap to the next cycle"""
+    frame = pd.DataFrame(_records(cycles), columns=['startDate', 'cycleLength', 'periodLength'])
+    frame['start'] = _dates(pd, frame['startDate'])
+    frame = frame.dropna(subset=['start']).sort_values('start').reset_index(drop=True)
+
+    frame['cycleLength'] = pd.to_numeric(frame['cycleLength'], errors='coerce')
+    frame['periodLength'] = pd.to_numeric(frame['periodLength'], errors='coerce')
+    frame['cycleLength'] = frame['cycleLength'].fillna(frame['start'].diff().shift(-1).dt.days)
+    return frame[['start', 'cycleLength', 'periodLength']]
+
+def _symptom_frame(pd, np, cycles: List[Any], symptoms: List[Any], cycle_frame):
+    """Symptoms (top-level and nested in cycles) with their cycle day and phase"""
+    records = _records(symptoms)
+    for cycle in _records(cycles):
+        records.extend(_records(cycle.get('symptoms')))
+
+    frame = pd.DataFrame(records, columns=['date', 'type', 'severity'])
+    frame['date'] = _dates(pd, frame['date'])
+    frame = frame.dropna(subset=['date', 'type'])
+    frame['type'] = frame['type'].astype(str)
+    frame['severity'] = pd.to_numeric(frame['severity'], errors='coerce')
+    frame = frame.sort_values('date').reset_index(drop=True)
+
+    if frame.empty or cycle_frame.empty:
+        frame['phase'] = 'unknown'
+        return frame
+
+    # Attach each symptom to the latest cycle that started on or before it
+    frame = pd.merge_asof(frame, cycle_frame, left_on='date', right_on='start', direction='backward')
+
+    cycle_length = frame['cycleLength'].fillna(cycle_frame['cycleLength'].median()).fillna(DEFAULT_CYCLE_LENGTH)
+    period_length = frame['periodLength'].fillna(cycle_frame['periodLength'].median()).fillna(DEFAULT_PERIOD_LENGTH)
+    cycle_day = (frame['date'] - frame['start']).dt.days + 1
+    ovulation_day = cycle_length - LUTEAL_PHASE_DAYS
+
+    frame['phase'] = np.select(
+        [
+            cycle_day.isna() | (cycle_day > cycle_length),
+            cycle_day <= period_length,
+            cycle_day < ovulation_day - 1,
+            cycle_day <= ovulation_day + 1
+        ],
+        ['unknown', 'menstrual', 'follicular', 'ovulatory'],
+        default='luteal'
+    )
+    return frame
+
+def _medication_frame(pd, medications: List[Any]):
+    """Medications with parsed start and end dates"""
+    frame = pd.DataFrame(_records(medications), columns=['name', 'dosage', 'unit', 'startDate', 'endDate'])
+    frame = frame.dropna(subset=['name'])
+    frame['name'] = frame['name'].astype(str)
+    frame['start'] = _dates(pd, frame['startDate'])
+    frame['end'] = _dates(pd, frame['endDate'])
+    return frame
+
+def _cycle_section(np, cycle_frame) -> str:
+    """Cycle length statistics"""
+    if cycle_frame.empty:
+        return ''
+
+    length_stats = None
+    lengths = cycle_frame['cycleLength'].dropna().to_numpy(dtype=float)
+    if len(lengths):
+        length_stats = {
+            'mean': lengths.mean(),
+            'median': np.median(lengths),
+            'min': lengths.min(),
+            'max': lengths.max(),
+            'sd': lengths.std(ddof=1) if len(lengths) > 1 else None,
+            'recent': lengths[-RECENT_CYCLES:].mean() if len(lengths) > RECENT_CYCLES else None,
+            'trend': np.polyfit(np.arange(len(lengths)), lengths, 1)[0] if len(lengths) >= 3 else None,
+            'next': cycle_frame['start'].iloc[-1] + np.timedelta64(int(round(lengths[-RECENT_CYCLES:].mean())), 'D')
+        }
+
+    period_stats = None
+    periods = cycle_frame['periodLength'].dropna().to_numpy(dtype=float)
+    if len(periods):
+        period_stats = {'mean': periods.mean(), 'min': periods.min(), 'max': periods.max()}
+
+    return format_cycle_section(
+        len(cycle_frame), cycle_frame['start'].iloc[0], cycle_frame['start'].iloc[-1], length_stats, period_stats
+    )
+
+def _phase_section(pd, np, symptom_frame, cycle_count: int) -> str:
+    """Symptom frequency by cycle phase as a compact table"""
+    if symptom_frame.empty:
+        return ''
+
+    type_codes, symptom_types = pd.factorize(symptom_frame['type'])
+    phase_codes = pd.Categorical(symptom_frame['phase'], categories=PHASES).codes
+    counts = np.zeros((len(symptom_types), len(PHASES) + 1), dtype=int)
+    np.add.at(counts, (type_codes, phase_codes), 1)  # unknown phase (-1) lands in the last column
+    totals = counts.sum(axis=1)
+
+    severity = symptom_frame['severity'].to_numpy(dtype=float)
+    rated = ~np.isnan(severity)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean_severity = np.bincount(type_codes[rated], severity[rated], len(symptom_types)) / np.bincount(
+            type_codes[rated], minlength=len(symptom_types)
+        )
+
+    rows = [
+        PhaseRow(
+            symptom_types[index],
+            [int(count) for count in counts[index, :len(PHASES)]],
+            int(totals[index]),
+            totals[index] / cycle_count if cycle_count else None,
+            mean_severity[index] if np.isfinite(mean_severity[index]) else None
+        )
+        for index in np.argsort(-totals, kind='stable')[:MAX_SYMPTOMS]
+    ]
+    return format_phase_section(len(symptom_frame), len(symptom_types), rows)
+
+def _medication_section(pd, np, symptom_frame, medication_frame) -> str:
+    """Medication list and symptom/medication co-occurrence and correlation"""
+    if medication_frame.empty:
+        return ''
+
+    medications = medication_frame.drop_duplicates('name', keep='last').head(MAX_MEDICATIONS)
+    described = [
+        describe_medication(
+            medication.name,
+            ' '.join(str(part) for part in (medication.dosage, medication.unit) if pd.notna(part) and part),
+            medication.start if pd.notna(medication.start) else None,
+            medication.end if pd.notna(medication.end) else None
+        )
+        for medication in medications.itertuples(index=False)
+    ]
+    medication_count = medication_frame['name'].nunique()
+
+    dated = medications.dropna(subset=['start'])
+    if symptom_frame.empty or dated.empty:
+        return format_medication_section(described, medication_count, [])
+
+    # Daily grid over the tracked period: which symptoms occurred, which medications were active
+    days = pd.date_range(symptom_frame['date'].min(), symptom_frame['date'].max(), freq='D')
+    type_codes, symptom_types = pd.factorize(symptom_frame['type'])
+    occurred = np.zeros((len(days), len(symptom_types)))
+    occurred[(symptom_frame['date'] - days[0]).dt.days.to_numpy(), type_codes] = 1.0
+
+    day_values = days.asi8
+    starts = dated['start'].to_numpy(dtype='datetime64[ns]').astype('int64')
+    ends = dated['end'].fillna(days[-1]).to_numpy(dtype='datetime64[ns]').astype('int64')
+    active = ((day_values[:, None] >= starts[None, :]) & (day_values[:, None] <= ends[None, :])).astype(float)
+
+    # Days together, symptom rate on/off each medication and the phi correlation, for every pair at once
+    together = occurred.T @ active
+    active_days = active.sum(axis=0)
+    inactive_days = len(days) - active_days
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rate_on = together / active_days
+        rate_off = (occurred.sum(axis=0)[:, None] - together) / inactive_days
+        occurred_centered = occurred - occurred.mean(axis=0)
+        active_centered = active - active.mean(axis=0)
+        correlation = (occurred_centered.T @ active_centered) / np.outer(
+            np.sqrt((occurred_centered ** 2).sum(axis=0)), np.sqrt((active_centered ** 2).sum(axis=0))
+        )
+
+    symptom_index, medication_index = np.nonzero((together >= MIN_PAIR_DAYS) & np.isfinite(correlation))
+    order = np.argsort(-np.abs(correlation[symptom_index, medication_index]))[:MAX_PAIRS]
+    names = list(dated['name'])
+    pairs = [
+        MedicationPair(
+            symptom_types[s],
+            names[m],
+            int(together[s, m]),
+            rate_on[s, m],
+            rate_off[s, m] if np.isfinite(rate_off[s, m]) else None,
+            correlation[s, m]
+        )
+        for s, m in zip(symptom_index[order], medication_index[order])
+    ]
+    return format_medication_section(described, medication_count, pairs)
+
+def describe_medication(name: str, dose: str, start: Optional[Any], end: Optional[Any]) -> str:
+    """One medication for the summary, e.g. "Clomid 50 mg (since 2024-03-01)"
+
+    Args:
+        name: Medication name
+        dose: Dosage and unit (may be empty)
+        start: Start date, or None if unknown
+        end: End date, or None if ongoing
+    """
+    if start is None:
+        period = ''
+    elif end is None:
+        period = f" (since {start:%Y-%m-%d})"
+    else:
+        period = f" ({start:%Y-%m-%d} to {end:%Y-%m-%d})"
+    return f"{name}{' ' + dose if dose else ''}{period}"
+
+def format_cycle_section(
+    count: int,
+    first: Any,
+    last: Any,
+    length_stats: Optional[Dict[str, Any]],
+    period_stats: Optional[Dict[str, Any]]
+) -> str:
+    """Render cycle statistics
+
+    Args:
+        count: Number of cycles
+        first: Start date of the first cycle
+        last: Start date of the latest cycle
+        length_stats: Cycle length mean, median, min, max, sd, recent, trend and next (None if unknown)
+        period_stats: Period length mean, min and max (None if unknown)
+
+    Returns:
+        Summary section text
+    """
+    lines = [f"Cycles tracked: {count} ({first:%Y-%m-%d} to {last:%Y-%m-%d})"]
+
+    if length_stats:
+        line = (
+            f"Cycle length (days): mean {length_stats['mean']:.1f}, median {length_stats['median']:.1f}, "
+            f"range {length_stats['min']:.0f}-{length_stats['max']:.0f}"
+        )
+        if length_stats.get('sd') is not None:
+            line += f", sd {length_stats['sd']:.1f}"
+        if length_stats.get('recent') is not None:
+            line += f", last {RECENT_CYCLES} cycles {length_stats['recent']:.1f}"
+        if length_stats.get('trend') is not None:
+            line += f", trend {length_stats['trend']:+.2f} days/cycle"
+        lines.append(line)
+        lines.append(f"Next period expected around {length_stats['next']:%Y-%m-%d}")
+
+    if period_stats:
+        lines.append(
+            f"Period length (days): mean {period_stats['mean']:.1f}, range {period_stats['min']:.0f}-{period_stats['max']:.0f}"
+        )
+
+    return '\n'.join(lines)
+
+def format_phase_section(symptom_count: int, type_count: int, rows: List[PhaseRow]) -> str:
+    """Render the symptom by cycle phase table
+
+    Args:
+        symptom_count: Number of symptoms logged
+        type_count: Number of distinct symptom types
+        rows: Most frequent symptom types, at most MAX_SYMPTOMS
+
+    Returns:
+        Summary section text
+    """
+    lines = [
+        f"Symptoms logged: {symptom_count} ({type_count} types)",
+        "Symptom frequency by cycle phase (phase estimated from cycle day; counts):",
+        "symptom | " + ' | '.join(PHASES) + " | total | per cycle | mean severity (1-5)"
+    ]
+    for row in rows:
+        per_cycle = f"{row.per_cycle:.1f}" if row.per_cycle is not None else '-'
+        severity = f"{row.mean_severity:.1f}" if row.mean_severity is not None else '-'
+        lines.append(
+            f"{row.symptom} | " + ' | '.join(str(count) for count in row.phase_counts)
+            + f" | {row.total} | {per_cycle} | {severity}"
+        )
+    if type_count > len(rows):
+        lines.append(f"({type_count - len(rows)} less frequent symptom types omitted)")
+
+    return '\n'.join(lines)
+
+def format_medication_section(described: List[str], medication_count: int, pairs: List[MedicationPair]) -> str:
+    """Render the medication list and the strongest symptom/medication pairs
+
+    Args:
+        described: Medication descriptions, at most MAX_MEDICATIONS
+        medication_count: Number of distinct medications
+        pairs: Pairs ordered by decreasing absolute correlation, at most MAX_PAIRS
+
+    Returns:
+        Summary section text
+    """
+    lines = ["Medications: " + '; '.join(described)]
+    if medication_count > len(described):
+        lines.append(f"({medication_count - len(described)} more medications omitted)")
+
+    if pairs:
+        lines.append(
+            "Symptom/medication co-occurrence "
+            "(days together; share of days with the symptom on vs off the medication; correlation):"
+        )
+        for pair in pairs:
+            off = f"{pair.rate_off:.0%}" if pair.rate_off is not None else '-'
+            lines.append(
+                f"{pair.symptom} + {pair.medication}: {pair.days_together} days; "
+                f"{pair.rate_on:.0%} on vs {off} off; r={pair.correlation:+.2f}"
+            )
+
+    return '\n'.join(lines)
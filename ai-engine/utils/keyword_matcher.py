@@ -0,0 +1,115 @@
+import logging
+from collections import deque
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+class KeywordMatcher:
+    """Aho-Corasick automaton for finding many keywords in a single pass over text"""
+
+    def __init__(self, keywords: Iterable[str]):
+        """Build the automaton
+
+        Args:
+            keywords: Keywords to match (duplicates are ignored)
+        """
+        self.keywords: List[str] = []
+        self.keyword_ids: Dict[str, int] = {}
+
+        # Trie edges, failure links and keyword ids ending at each state
+        goto: List[Dict[str, int]] = [{}]
+        outputs: List[List[int]] = [[]]
+
+        for keyword in keywords:
+            if not keyword or keyword in self.keyword_ids:
+                continue
+
+            keyword_id = len(self.keywords)
+            self.keywords.append(keyword)
+            self.keyword_ids[keyword] = keyword_id
+
+            state = 0
+            for char in keyword:
+                next_state = goto[state].get(char)
+                if next_state is None:
+                    next_state = len(goto)
+                    goto[state][char] = next_state
+                    goto.append({})
+                    outputs.append([])
+                state = next_state
+            outputs[state].append(keyword_id)
+
+        # Resolve failure links breadth-first into a deterministic transition table.
+        # Transitions back to the root are left out, so unknown characters cost one dict miss.
+        fail = [0] * len(goto)
+        self._transitions: List[Dict[str, int]] = [dict(goto[0])]
+        self._transitions.extend({} for _ in range(len(goto) - 1))
+
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            transitions = dict(self._transitions[fail[state]])
+            for char, child in goto[state].items():
+                transitions[char] = child
+                fail[child] = self._transitions[fail[state]].get(char, 0)
+                queue.append(child)
+            self._transitions[state] = transitions
+            outputs[state].extend(outputs[fail[state]])
+
+        self._lengths = [len(keyword) for keyword in self.keywords]
+        self._outputs: List[Tuple[int, ...]] = [tuple(ids) for ids in outputs]
+
+        logger.debug(f"Built keyword matcher with {len(self.keywords)} keywords and {len(goto)} states")
+
+    def find_all(self, text: str, state: int = 0) -> Tuple[List[Tuple[int, int, int]], int]:
+        """Find every (possibly overlapping) keyword occurrence in text
+
+        Args:
+            text: Text to scan (callers normalize case beforehand)
+            state: Automaton state to resume from (0 starts a fresh scan)
+
+        Returns:
+            Tuple of (matches, final_state), where matches is a list of
+            (start, end, keyword_id) ordered by end offset
+        """
+        transitions = self._transitions
+        outputs = self._outputs
+        lengths = self._lengths
+        matches = []
+
+        for index, char in enumerate(text):
+            state = transitions[state].get(char, 0)
+            if outputs[state]:
+                end = index + 1
+                for keyword_id in outputs[state]:
+                    matches.append((end - lengths[keyword_id], end, keyword_id))
+
+        return matches, state
+
+    def states(self, text: str, state: int = 0) -> List[int]:
+        """Automaton state after each character of text
+
+        Args:
+            text: Text to scan (callers normalize case beforehand)
+            state: Automaton state to resume from (0 starts a fresh scan)
+
+        Returns:
+            One state per character
+        """
+        transitions = self._transitions
+        states = []
+        for char in text:
+            state = transitions[state].get(char, 0)
+            states.append(state)
+        return states
+
+    def state_max(self, values: Sequence[int]) -> List[int]:
+        """Largest value among the keywords ending at each state
+
+        Args:
+            values: Value per keyword id
+
+        Returns:
+            Value per state (0 for states where no keyword ends)
+        """
+        return [max((values[keyword_id] for keyword_id in ids), default=0) for ids in self._outputs]
@@ -0,0 +1,297 @@
+"""BM25 index over the vetted fertility knowledge base
+
+The index is built offline from a corpus of articles (a directory of .md/.txt
+files, or a JSONL file of {"title", "text", "source"} records):
+
+    python -m utils.knowledge_index --corpus data/articles --output data/knowledge.idx
+
+Articles are split into passages and every posting stores its precomputed
+BM25 weight, so a query only sums the posting lists of its terms. The file is
+memory-mapped read-only, so all worker processes share one copy through the
+OS page cache.
+"""
+import re
+import os
+import sys
+import json
+import mmap
+import struct
+import hashlib
+import argparse
+import logging
+from collections import Counter
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple
+from utils.model_registry import model_registry
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'FNKI'
+FORMAT_VERSION = 1
+
+# magic, version, passages, terms, postings, average passage length, k1, b,
+# then the byte offsets of the six sections that follow
+HEADER = struct.Struct('<4sIIIIfff6Q')
+
+# Words per passage when articles are split
+PASSAGE_WORDS = 120
+
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+
+STOPWORDS = frozenset([
+    'a', 'about', 'after', 'all', 'also', 'an', 'and', 'any', 'are', 'as', 'at', 'be', 'been', 'before', 'but',
+    'by', 'can', 'could', 'do', 'does', 'for', 'from', 'had', 'has', 'have', 'how', 'i', 'if', 'in', 'into', 'is',
+    'it', 'its', 'may', 'me', 'more', 'my', 'no', 'not', 'of', 'on', 'or', 'our', 'should', 'so', 'some', 'such',
+    'than', 'that', 'the', 'their', 'them', 'then', 'there', 'these', 'they', 'this', 'to', 'up', 'was', 'we',
+    'were', 'what', 'when', 'where', 'which', 'who', 'why', 'will', 'with', 'would', 'you', 'your'
+])
+
+class Passage(NamedTuple):
+    """One indexed passage of an article"""
+    title: str
+    text: str
+    source: str
+
+class KnowledgeHit(NamedTuple):
+    """A retrieved passage and its BM25 score"""
+    title: str
+    text: str
+    source: str
+    score: float
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens without stopwords"""
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+def term_hash(term: str) -> int:
+    """Stable 64-bit hash of a term (the index stores hashes, not strings)"""
+    return int.from_bytes(hashlib.blake2b(term.encode('utf-8'), digest_size=8).digest(), 'little')
+
+def split_passages(title: str, text: str, source: str, max_words: int = PASSAGE_WORDS) -> List[Passage]:
+    """Split an article into passages of about max_words, on paragraph boundaries where possible
+
+    Args:
+        title: Article title
+        text: Article body
+        source: Where the article comes from (file name or URL)
+        max_words: Target passage length in words
+
+    Returns:
+        Passages in article order
+    """
+    passages = []
+    current: List[str] = []
+    for paragraph in re.split(r'\n\s*\n', text):
+        words = paragraph.split()
+        while words:
+            if current and len(current) + len(words) > max_words:
+                passages.append(Passage(title, ' '.join(current), source))
+                current = []
+            room = max_words - len(current)
+            current.extend(words[:room])
+            words = words[room:]
+    if current:
+        passages.append(Passage(title, ' '.join(current), source))
+    return passages
+
+def read_corpus(path: str, max_words: int = PASSAGE_WORDS) -> Iterator[Passage]:
+    """Read articles and split them into passages
+
+    Args:
+        path: Directory of .md/.txt articles (first line is the title) or a JSONL file
+        max_words: Target passage length in words
+
+    Yields:
+        Passages
+    """
+    if os.path.isfile(path):
+        with open(path, encoding='utf-8') as corpus:
+            for line in corpus:
+                if line.strip():
+                    article = json.loads(line)
+                    yield from split_passages(
+                        article.get('title', ''), article.get('text', ''), article.get('source', ''), max_words
+                    )
+        return
+
+    for root, _, files in os.walk(path):
+        for name in sorted(files):
+            if not name.endswith(('.md', '.txt')):
+                continue
+            with open(os.path.join(root, name), encoding='utf-8') as article:
+                lines = article.read().strip().splitlines()
+            if lines:
+                title = lines[0].lstrip('#').strip()
+                yield from split_passages(title, '\n'.join(lines[1:]), os.path.relpath(os.path.join(root, name), path), max_words)
+
+def build_index(passages: Iterable[Passage], path: str, k1: float = 1.2, b: float = 0.75) -> Dict[str, Any]:
+    """Build a BM25 index file
+
+    Args:
+        passages: Passages to index (title words count as passage text)
+        path: Output file
+        k1: BM25 term frequency saturation
+        b: BM25 length normalization
+
+    Returns:
+        Passage, term and posting counts
+    """
+    np = model_registry.get('numpy')
+
+    passages = list(passages)
+    postings: Dict[int, List[tuple]] = {}
+    lengths = []
+    for index, passage in enumerate(passages):
+        tokens = tokenize(f"{passage.title} {passage.text}")
+        lengths.append(len(tokens))
+        for term, count in Counter(tokens).items():
+            postings.setdefault(term_hash(term), []).append((index, count))
+
+    passage_count = len(passages)
+    average_length = sum(lengths) / passage_count if passage_count else 0.0
+    lengths = np.asarray(lengths, dtype=np.float64)
+
+    hashes = sorted(postings)
+    starts = np.zeros(len(hashes) + 1, dtype=np.uint64)
+    posting_passages = []
+    posting_weights = []
+    for position, key in enumerate(hashes):
+        documents = np.asarray([document for document, _ in postings[key]], dtype=np.uint32)
+        counts = np.asarray([count for _, count in postings[key]], dtype=np.float64)
+        idf = np.log(1 + (passage_count - len(documents) + 0.5) / (len(documents) + 0.5))
+        norm = k1 * (1 - b + b * lengths[documents] / average_length)
+        posting_passages.append(documents)
+        posting_weights.append((idf * counts * (k1 + 1) / (counts + norm)).astype(np.float32))
+        starts[position + 1] = starts[position] + len(documents)
+
+    blobs = [json.dumps(list(passage), ensure_ascii=False, separators=(',', ':')).encode('utf-8') for passage in passages]
+    blob_starts = np.zeros(passage_count + 1, dtype=np.uint64)
+    blob_starts[1:] = np.cumsum([len(blob) for blob in blobs], dtype=np.uint64)
+
+    sections = [
+        np.asarray(hashes, dtype=np.uint64).tobytes(),
+        starts.tobytes(),
+        (np.concatenate(posting_passages) if posting_passages else np.zeros(0, np.uint32)).tobytes(),
+        (np.concatenate(posting_weights) if posting_weights else np.zeros(0, np.float32)).tobytes(),
+        blob_starts.tobytes(),
+        b''.join(blobs)
+    ]
+
+    # Sections start on 8-byte boundaries so the arrays can be viewed in place
+    offsets = []
+    position = HEADER.size
+    for section in sections:
+        position += -position % 8
+        offsets.append(position)
+        position += len(section)
+
+    posting_count = int(starts[-1])
+    with open(path, 'wb') as output:
+        output.write(HEADER.pack(
+            MAGIC, FORMAT_VERSION, passage_count, len(hashes), posting_count, average_length, k1, b, *offsets
+        ))
+        for offset, section in zip(offsets, sections):
+            output.write(b'\0' * (offset - output.tell()))
+            output.write(section)
+
+    return {'passages': passage_count, 'terms': len(hashes), 'postings': posting_count}
+
+class KnowledgeIndex:
+    """Read-only, memory-mapped BM25 index built by build_index"""
+
+    def __init__(self, path: str):
+        """Map an index file
+
+        Args:
+            path: Index file
+        """
+        np = model_registry.get('numpy')
+        self._np = np
+        self.path = path
+
+        with open(path, 'rb') as index_file:
+            self._map = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        (magic, version, self.passage_count, term_count, posting_count,
+         self.average_length, self.k1, self.b, *offsets) = HEADER.unpack_from(self._map)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"{path} is not a version {FORMAT_VERSION} knowledge index")
+
+        # Zero-copy views of the mapped file
+        self._term_hashes = np.frombuffer(self._map, np.uint64, term_count, offsets[0])
+        self._term_starts = np.frombuffer(self._map, np.uint64, term_count + 1, offsets[1])
+        self._posting_passages = np.frombuffer(self._map, np.uint32, posting_count, offsets[2])
+        self._posting_weights = np.frombuffer(self._map, np.float32, posting_count, offsets[3])
+        self._blob_starts = np.frombuffer(self._map, np.uint64, self.passage_count + 1, offsets[4])
+        self._blob_offset = offsets[5]
+
+    def search(self, query: str, k: int = 3, min_score: float = 0.0) -> List[KnowledgeHit]:
+        """Find the passages that best match a query
+
+        Args:
+            query: Query text
+            k: Maximum number of passages
+            min_score: Minimum BM25 score of a returned passage
+
+        Returns:
+            Hits ordered by decreasing score
+        """
+        np = self._np
+        terms = set(tokenize(query))
+        if not terms or not self.passage_count or k <= 0:
+            return []
+
+        hashes = np.asarray(sorted(term_hash(term) for term in terms), dtype=np.uint64)
+        positions = np.searchsorted(self._term_hashes, hashes)
+        found = positions < len(self._term_hashes)
+        found[found] = self._term_hashes[positions[found]] == hashes[found]
+
+        ranges = [(int(self._term_starts[position]), int(self._term_starts[position + 1])) for position in positions[found]]
+        if not ranges:
+            return []
+
+        # One bincount over the matched posting lists sums each passage's term weights
+        scores = np.bincount(
+            np.concatenate([self._posting_passages[start:end] for start, end in ranges]),
+            np.concatenate([self._posting_weights[start:end] for start, end in ranges]),
+            minlength=self.passage_count
+        )
+
+        if k < self.passage_count:
+            candidates = np.argpartition(scores, self.passage_count - k)[self.passage_count - k:]
+        else:
+            candidates = np.arange(self.passage_count)
+        candidates = candidates[np.argsort(-scores[candidates], kind='stable')]
+
+        hits = []
+        for index in candidates:
+            score = float(scores[index])
+            if score <= 0 or score < min_score:
+                break
+            start = self._blob_offset + int(self._blob_starts[index])
+            end = self._blob_offset + int(self._blob_starts[index + 1])
+            title, text, source = json.loads(self._map[start:end])
+            hits.append(KnowledgeHit(title, text, source, score))
+        return hits
+
+    def close(self) -> None:
+        """Unmap the index file"""
+        # The array views hold exports of the map and must go first
+        self._term_hashes = self._term_starts = self._posting_passages = self._posting_weights = self._blob_starts = None
+        self._map.close()
+
+def main(argv=None) -> int:
+    """Build an index file from a corpus"""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--corpus', required=True, help='Directory of .md/.txt articles or a JSONL file')
+    parser.add_argument('--output', required=True, help='Index file to write')
+    parser.add_argument('--passage-words', type=int, default=PASSAGE_WORDS)
+    parser.add_argument('--k1', type=float, default=1.2)
+    parser.add_argument('--b', type=float, default=0.75)
+    args = parser.parse_args(argv)
+
+    stats = build_index(read_corpus(args.corpus, args.passage_words), args.output, k1=args.k1, b=args.b)
+    print(f"Indexed {stats['passages']} passages, {stats['terms']} terms, {stats['postings']} postings into {args.output}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,122 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+from typing import Any, Callable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+class MicroBatcher:
+    """Groups concurrent requests into one batched call
+
+    Requests are queued and a background thread hands them to ``batch_fn`` as
+    soon as ``max_batch_size`` items are waiting or the oldest one has waited
+    ``max_wait_ms``, whichever comes first.
+    """
+
+    def __init__(
+        self,
+        batch_fn: Callable[[List[Any]], List[Any]],
+        max_batch_size: int = 32,
+        max_wait_ms: float = 5.0,
+        name: str = 'micro-batcher'
+    ):
+        """Initialize the batcher
+
+        Args:
+            batch_fn: Function mapping a list of items to a list of results in the same order
+            max_batch_size: Largest batch passed to batch_fn
+            max_wait_ms: Longest time the first item of a batch waits for company
+            name: Name of the worker thread
+        """
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.name = name
+
+        self._queue: 'queue.Queue[Tuple[Any, Future]]' = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+        # Batch statistics
+        self.batches = 0
+        self.items = 0
+
+    def submit(self, item: Any) -> Future:
+        """Queue an item for the next batch
+
+        Args:
+            item: Item to process
+
+        Returns:
+            Future resolved with the item's result
+        """
+        # The worker is started lazily so the batcher can be built before a fork
+        if self._worker is None or not self._worker.is_alive():
+            with self._lock:
+                if self._worker is None or not self._worker.is_alive():
+                    self._worker = threading.Thread(target=self._run, name=self.name, daemon=True)
+                    self._worker.start()
+
+        future: Future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def process(self, item: Any, timeout: Optional[float] = None) -> Any:
+        """Process one item through the batcher and wait for its result
+
+        Args:
+            item: Item to process
+            timeout: Seconds to wait for the result
+
+        Returns:
+            Result for the item
+        """
+        future = self.submit(item)
+        try:
+            return future.result(timeout=timeout)
+        except TimeoutError:
+            # Drop the item from its batch if it hasn't started yet
+            future.cancel()
+            raise
+
+    @property
+    def average_batch_size(self) -> float:
+        """Average number of items per batch so far"""
+        return self.items / self.batches if self.batches else 0.0
+
+    def _run(self):
+        """Collect items into batches and run them until the process exits"""
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    if remaining > 0:
+                        batch.append(self._queue.get(timeout=remaining))
+                    else:
+                        batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            # Skip items whose callers already gave up
+            batch = [(item, future) for item, future in batch if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+
+            self.batches += 1
+            self.items += len(batch)
+
+            try:
+                results = self.batch_fn([item for item, _ in batch])
+                if len(results) != len(batch):
+                    raise ValueError(f"Expected {len(batch)} results, got {len(results)}")
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+            except Exception as e:
+                logger.error(f"Error processing batch in {self.name}: {str(e)}")
+                for _, future in batch:
+                    future.set_exception(e)
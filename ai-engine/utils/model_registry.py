@@ -0,0 +1,105 @@
+import gc
+import importlib
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List
+
+logger = logging.getLogger(__name__)
+
+class ModelRegistry:
+    """Registry of heavy models and libraries that are loaded on first use"""
+
+    def __init__(self):
+        """Initialize an empty registry"""
+        self._loaders: Dict[str, Callable[[], Any]] = {}
+        self._instances: Dict[str, Any] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, loader: Callable[[], Any]) -> None:
+        """Register a loader without running it
+
+        Args:
+            name: Name features use to request the backend
+            loader: Zero-argument callable that imports/builds the backend
+        """
+        with self._lock:
+            self._loaders[name] = loader
+            self._locks.setdefault(name, threading.Lock())
+
+    def register_module(self, name: str, module_name: str) -> None:
+        """Register a Python module that should only be imported on first use
+
+        Args:
+            name: Name features use to request the module
+            module_name: Importable module path
+        """
+        self.register(name, lambda: importlib.import_module(module_name))
+
+    def get(self, name: str) -> Any:
+        """Get a backend, loading it on first use
+
+        Args:
+            name: Registered backend name
+
+        Returns:
+            The loaded backend
+        """
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+
+        if name not in self._loaders:
+            raise KeyError(f"No model or backend registered as '{name}'")
+
+        # Only one thread loads a given backend; others wait for it
+        with self._locks[name]:
+            instance = self._instances.get(name)
+            if instance is None:
+                started = time.perf_counter()
+                instance = self._loaders[name]()
+                self._instances[name] = instance
+                logger.info(f"Loaded '{name}' in {time.perf_counter() - started:.2f}s")
+
+        return instance
+
+    def is_registered(self, name: str) -> bool:
+        """Check whether a backend is registered"""
+        return name in self._loaders
+
+    def is_loaded(self, name: str) -> bool:
+        """Check whether a backend has been loaded"""
+        return name in self._instances
+
+    def loaded(self) -> List[str]:
+        """Names of the backends loaded so far"""
+        return list(self._instances)
+
+    def preload(self, names: Iterable[str], freeze: bool = True) -> None:
+        """Load backends eagerly, e.g. in a pre-fork master process
+
+        Workers forked afterwards share the loaded weights through copy-on-write.
+
+        Args:
+            names: Backend names to load
+            freeze: Move loaded objects to the permanent GC generation so
+                collections in the workers don't touch (and copy) their pages
+        """
+        for name in names:
+            try:
+                self.get(name)
+            except Exception as e:
+                logger.error(f"Error preloading '{name}': {str(e)}")
+
+        if freeze:
+            gc.collect()
+            gc.freeze()
+
+
+# Shared registry used by the AI engine
+model_registry = ModelRegistry()
+model_registry.register_module('numpy', 'numpy')
+model_registry.register_module('pandas', 'pandas')
+model_registry.register_module('tensorflow', 'tensorflow')
+model_registry.register_module('transformers', 'transformers')
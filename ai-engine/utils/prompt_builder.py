@@ -0,0 +1,110 @@
+import json
+import logging
+from typing import Any, Dict, List, Optional, Sequence
+from utils.insight_stats import summarize_tracking_data
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever the insights prompt changes so cached insights are not reused
+INSIGHTS_PROMPT_VERSION = 2
+
+def build_system_message(context: Dict[str, Any], knowledge: Optional[Sequence[Any]] = None) -> str:
+    """Build the Anaira system message for a chat request
+
+    Args:
+        context: User context sent by the backend
+        knowledge: Retrieved knowledge base passages (title, text, source) to ground the answer
+
+    Returns:
+        System message text
+    """
+    return f"""You are Anaira, an empathetic AI companion for FertilityNest, a fertility support app.
+        The user is on a {context.get('userJourneyType', 'fertility')} journey and is currently in the {context.get('fertilityStage', 'unknown')} stage.
+        {f"They are on day {context.get('cycleDay')} of their cycle." if context.get('cycleDay') else ''}
+        {f"They recently experienced these symptoms: {', '.join(context.get('recentSymptoms'))}." if context.get('recentSymptoms') else ''}
+        {f"They are taking these medications: {', '.join(context.get('recentMedications'))}." if context.get('recentMedications') else ''}
+
+        Be compassionate, informative, and supportive. Provide evidence-based information when possible, but clarify you're not a medical professional.
+        If the user seems distressed, offer support and suggest they speak with a healthcare provider.{format_knowledge(knowledge)}"""
+
+def format_knowledge(knowledge: Optional[Sequence[Any]]) -> str:
+    """Render retrieved passages for the system message (empty if there are none)
+
+    Args:
+        knowledge: Passages with title, text and source
+
+    Returns:
+        Text to append to the system message
+    """
+    if not knowledge:
+        return ''
+    passages = '\n'.join(
+        f"        [{number}] {passage.title}: {passage.text}" for number, passage in enumerate(knowledge, 1)
+    )
+    return (
+        "\n\n        Reference passages from FertilityNest's vetted articles. Prefer them over general knowledge "
+        f"when they answer the question, and don't mention passages that aren't relevant:\n{passages}"
+    )
+
+def format_chat_history(chat_history: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+    """Convert backend chat messages into role/content pairs
+
+    Args:
+        chat_history: Messages with 'sender' and 'content' keys
+
+    Returns:
+        Messages with 'role' ('user' or 'assistant') and 'content' keys
+    """
+    return [
+        {
+            'role': 'user' if msg['sender'] == 'user' else 'assistant',
+            'content': msg['content']
+        }
+        for msg in chat_history
+    ]
+
+def build_insights_prompt(cycles: List[Any], symptoms: List[Any], medications: List[Any]) -> str:
+    """Build the prompt for generating insights from tracking data
+
+    The records are pre-aggregated locally into a compact summary table, so the
+    prompt stays roughly the same size however much history the user has. If
+    the summary cannot be computed the raw records are sent instead.
+
+    Args:
+        cycles: Cycle records
+        symptoms: Symptom records
+        medications: Medication records
+
+    Returns:
+        Prompt text
+    """
+    try:
+        data = summarize_tracking_data(cycles, symptoms, medications)
+    except Exception as e:
+        logger.error(f"Error summarizing tracking data, sending raw records: {str(e)}")
+        data = (
+            f"Cycle Information: {json.dumps(cycles)}\n"
+            f"Symptoms: {json.dumps(symptoms)}\n"
+            f"Medications: {json.dumps(medications)}"
+        )
+
+    return format_insights_prompt(data)
+
+def format_insights_prompt(summary: str) -> str:
+    """Build the insights prompt around an already computed tracking summary
+
+    Args:
+        summary: Summary text (from summarize_tracking_data or a user's insight aggregate)
+
+    Returns:
+        Prompt text
+    """
+    return f"""Based on the following summary of the user's tracking data, provide helpful insights and patterns:
+
+{summary}
+
+Please analyze this data and provide:
+1. Any patterns or correlations between symptoms and cycle phases
+2. Potential effects of medications on symptoms or cycle
+3. Suggestions for tracking additional data points that might be helpful
+4. General insights that might help the user better understand their fertility journey"""
@@ -0,0 +1,143 @@
+import json
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+class ResponseCache:
+    """Content-addressed response cache
+
+    Entries live in a bounded in-memory LRU with TTL expiry. An optional
+    SQLite file adds a second tier that survives restarts.
+    """
+
+    def __init__(self, max_entries: int = 512, ttl_seconds: float = 6 * 3600, disk_path: Optional[str] = None):
+        """Initialize the cache
+
+        Args:
+            max_entries: Maximum number of entries kept in memory
+            ttl_seconds: Seconds an entry stays valid
+            disk_path: SQLite file for the on-disk tier (disabled if None)
+        """
+        self.max_entries = max(1, max_entries)
+        self.ttl_seconds = ttl_seconds
+        self._entries: 'OrderedDict[str, Tuple[float, Any]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+        # Counters
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._db = None
+        if disk_path:
+            try:
+                self._db = sqlite3.connect(disk_path, check_same_thread=False)
+                self._db.execute(
+                    'CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)'
+                )
+                self._db.execute('DELETE FROM cache WHERE expires_at < ?', (time.time(),))
+                self._db.commit()
+            except sqlite3.Error as e:
+                logger.error(f"Error opening cache file {disk_path}, using memory only: {str(e)}")
+                self._db = None
+
+    @staticmethod
+    def make_key(*parts: Any) -> str:
+        """Hash JSON-serializable parts into a canonical cache key
+
+        Args:
+            *parts: Values identifying the response (input data, prompt version, ...)
+
+        Returns:
+            Hex SHA-256 digest of the canonical JSON encoding
+        """
+        canonical = json.dumps(parts, sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=str)
+        return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        """Get a cached value
+
+        Args:
+            key: Cache key
+
+        Returns:
+            Cached value, or None on a miss
+        """
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._entries[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    'SELECT value, expires_at FROM cache WHERE key = ? AND expires_at > ?', (key, now)
+                ).fetchone()
+                if row is not None:
+                    value = json.loads(row[0])
+                    self._remember(key, row[1], value)
+                    self.disk_hits += 1
+                    return value
+
+            self.misses += 1
+            return None
+
+    def set(self, key: str, value: Any) -> None:
+        """Store a value
+
+        Args:
+            key: Cache key
+            value: JSON-serializable value
+        """
+        expires_at = time.time() + self.ttl_seconds
+
+        with self._lock:
+            self._remember(key, expires_at, value)
+
+            if self._db is not None:
+                try:
+                    self._db.execute(
+                        'INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)',
+                        (key, json.dumps(value), expires_at)
+                    )
+                    self._db.commit()
+                except sqlite3.Error as e:
+                    logger.error(f"Error writing cache entry to disk: {str(e)}")
+
+    def _remember(self, key: str, expires_at: float, value: Any) -> None:
+        """Put an entry in the memory tier, evicting the least recently used (lock held)"""
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Get cache counters
+
+        Returns:
+            Dictionary with hit/miss counters, hit rate and size
+        """
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            'hits': self.hits,
+            'diskHits': self.disk_hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hitRate': (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            'size': len(self._entries),
+            'maxEntries': self.max_entries,
+            'diskEnabled': self._db is not None
+        }
@@ -0,0 +1,258 @@
+"""Compact binary RPC for internal callers
+
+Frames are a 4-byte big-endian length followed by a msgpack body. A request
+is [id, method, params] and its response is [id, status, body], where status
+and body are what the matching HTTP endpoint returns. Requests on one
+connection run concurrently and responses are sent as they finish, matched
+by id, so one persistent connection carries many calls at once.
+"""
+import time
+import struct
+import asyncio
+import logging
+import itertools
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from utils.model_registry import model_registry
+
+logger = logging.getLogger(__name__)
+
+model_registry.register_module('msgpack', 'msgpack')
+
+FRAME_HEADER = struct.Struct('>I')
+
+DEFAULT_MAX_FRAME_BYTES = 16 * 1024 * 1024
+
+Handler = Callable[[Any], Awaitable[Tuple[Dict[str, Any], int]]]
+
+class FrameTooLargeError(ValueError):
+    """Raised when a peer announces a frame larger than the limit"""
+
+def encode_frame(message: Any) -> bytes:
+    """Serialize a message into a length-prefixed msgpack frame"""
+    body = model_registry.get('msgpack').packb(message, use_bin_type=True)
+    return FRAME_HEADER.pack(len(body)) + body
+
+async def read_frame(reader: asyncio.StreamReader, max_bytes: int = DEFAULT_MAX_FRAME_BYTES) -> Optional[Any]:
+    """Read one frame
+
+    Args:
+        reader: Stream to read from
+        max_bytes: Largest accepted frame body
+
+    Returns:
+        The decoded message, or None if the peer closed the connection between frames
+
+    Raises:
+        FrameTooLargeError: If the frame is larger than max_bytes
+        asyncio.IncompleteReadError: If the connection closed inside a frame
+        ValueError: If the body isn't valid msgpack
+    """
+    try:
+        header = await reader.readexactly(FRAME_HEADER.size)
+    except asyncio.IncompleteReadError as e:
+        if not e.partial:
+            return None
+        raise
+
+    (length,) = FRAME_HEADER.unpack(header)
+    if length > max_bytes:
+        raise FrameTooLargeError(f"frame of {length} bytes is larger than {max_bytes}")
+    return model_registry.get('msgpack').unpackb(await reader.readexactly(length), raw=False)
+
+class RPCServer:
+    """Serves async handlers over persistent, multiplexed connections"""
+
+    def __init__(
+        self,
+        handlers: Dict[str, Handler],
+        max_frame_bytes: int = DEFAULT_MAX_FRAME_BYTES,
+        max_in_flight: int = 64,
+        on_response: Optional[Callable[[str, int, float], None]] = None
+    ):
+        """Initialize the server
+
+        Args:
+            handlers: Method name -> coroutine taking the params and returning (body, status)
+            max_frame_bytes: Largest accepted request frame
+            max_in_flight: Concurrent requests per connection before reading pauses
+            on_response: Called with (method, status, seconds) after each call
+        """
+        self.handlers = handlers
+        self.max_frame_bytes = max_frame_bytes
+        self.max_in_flight = max(1, max_in_flight)
+        self.on_response = on_response
+        self._server: Optional[asyncio.AbstractServer] = None
+
+        # Counters
+        self.connections = 0
+        self.calls = 0
+        self.protocol_errors = 0
+
+    async def start(self, host: str, port: int) -> None:
+        """Start listening (several worker processes can share the port)"""
+        model_registry.get('msgpack')
+        self._server = await asyncio.start_server(self._serve, host, port, reuse_port=True)
+        logger.info(f"RPC server listening on {host}:{port}")
+
+    async def close(self) -> None:
+        """Stop accepting connections"""
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Read requests from one connection and run each as its own task"""
+        self.connections += 1
+        slots = asyncio.Semaphore(self.max_in_flight)
+        write_lock = asyncio.Lock()
+        tasks = set()
+
+        try:
+            while True:
+                try:
+                    message = await read_frame(reader, self.max_frame_bytes)
+                except (ValueError, asyncio.IncompleteReadError, ConnectionError) as e:
+                    logger.warning(f"Closing RPC connection after a bad frame: {str(e) or type(e).__name__}")
+                    self.protocol_errors += 1
+                    break
+                if message is None:
+                    break
+
+                # Stop reading while the connection has too many calls in flight
+                await slots.acquire()
+                task = asyncio.ensure_future(self._call(message, writer, write_lock, slots))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            for task in tasks:
+                task.cancel()
+            writer.close()
+
+    async def _call(self, message: Any, writer: asyncio.StreamWriter, write_lock: asyncio.Lock, slots: asyncio.Semaphore) -> None:
+        """Run one request and send its response"""
+        started = time.perf_counter()
+        request_id, method = None, None
+        try:
+            request_id, method, params = message
+            handler = self.handlers.get(method)
+            if handler is None:
+                body, status = {'success': False, 'error': f"Unknown method {method}"}, 404
+            else:
+                body, status = await handler(params)
+        except (TypeError, ValueError):
+            body, status = {'success': False, 'error': 'Requests must be [id, method, params]'}, 400
+        except Exception as e:
+            logger.error(f"Error in RPC method {method}: {str(e)}")
+            body, status = {'success': False, 'error': str(e)}, 500
+        finally:
+            slots.release()
+
+        self.calls += 1
+        if self.on_response is not None:
+            # Unknown names are reported together so clients can't create unbounded metric labels
+            name = method if isinstance(method, str) and method in self.handlers else 'unknown'
+            self.on_response(name, status, time.perf_counter() - started)
+
+        try:
+            async with write_lock:
+                writer.write(encode_frame([request_id, status, body]))
+                await writer.drain()
+        except ConnectionError as e:
+            logger.warning(f"RPC client went away before the response: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Get server counters
+
+        Returns:
+            Dictionary with connections accepted, calls served and protocol errors
+        """
+        return {
+            'running': self._server is not None,
+            'connections': self.connections,
+            'calls': self.calls,
+            'protocolErrors': self.protocol_errors
+        }
+
+class RPCClient:
+    """Client for RPCServer that multiplexes concurrent calls over one connection"""
+
+    def __init__(self, host: str, port: int, max_frame_bytes: int = DEFAULT_MAX_FRAME_BYTES):
+        """Initialize the client (connect before calling)
+
+        Args:
+            host: Server host
+            port: Server port
+            max_frame_bytes: Largest accepted response frame
+        """
+        self.host = host
+        self.port = port
+        self.max_frame_bytes = max_frame_bytes
+        self._ids = itertools.count()
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._reader_task: Optional[asyncio.Task] = None
+
+    async def connect(self) -> None:
+        """Open the connection"""
+        reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        self._reader_task = asyncio.ensure_future(self._read_responses(reader))
+
+    async def call(self, method: str, params: Any, timeout: Optional[float] = None) -> Tuple[int, Dict[str, Any]]:
+        """Call a method and wait for its response
+
+        Args:
+            method: Method name (chat, analyze_emotion, generate_insights)
+            params: Request payload, as for the HTTP endpoint
+            timeout: Seconds to wait for the response
+
+        Returns:
+            Tuple of (status, body)
+
+        Raises:
+            ConnectionError: If the client isn't connected or the connection is lost
+            asyncio.TimeoutError: If the response takes longer than timeout
+        """
+        if self._writer is None:
+            raise ConnectionError('RPC client is not connected')
+
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        try:
+            self._writer.write(encode_frame([request_id, method, params]))
+            await self._writer.drain()
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            self._pending.pop(request_id, None)
+
+    async def _read_responses(self, reader: asyncio.StreamReader) -> None:
+        """Hand each response to the call waiting for its id"""
+        error: Exception = ConnectionError('RPC connection closed')
+        try:
+            while True:
+                message = await read_frame(reader, self.max_frame_bytes)
+                if message is None:
+                    break
+                request_id, status, body = message
+                future = self._pending.get(request_id)
+                if future is not None and not future.done():
+                    future.set_result((status, body))
+        except (ValueError, asyncio.IncompleteReadError, ConnectionError) as e:
+            error = ConnectionError(f"RPC connection failed: {str(e) or type(e).__name__}")
+        finally:
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(error)
+
+    async def close(self) -> None:
+        """Close the connection"""
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if self._reader_task is not None:
+            await asyncio.gather(self._reader_task, return_exceptions=True)
+            self._reader_task = None
@@ -0,0 +1,244 @@
+import re
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+from utils.micro_batcher import MicroBatcher
+from utils.model_registry import model_registry
+
+logger = logging.getLogger(__name__)
+
+# Registry name of the local sentence embedding model
+EMBEDDER_BACKEND = 'sentence_embedder'
+
+DEFAULT_EMBEDDING_MODEL = 'sentence-transformers/all-MiniLM-L6-v2'
+
+# Longest message (in words) still treated as a standalone FAQ question
+MAX_QUESTION_WORDS = 20
+
+QUESTION_WORDS = frozenset([
+    'what', "what's", 'whats', 'when', 'how', 'why', 'which', 'who', 'where',
+    'is', 'are', 'can', 'could', 'should', 'does', 'do', 'will', 'would'
+])
+
+# Words that tie a question to the user's own situation or to earlier turns
+PERSONAL_WORDS = frozenset([
+    'my', 'me', 'mine', 'myself', "i'm", 'im', "i've", 'ive', "i'd", 'we', "we're", "we've", 'our', 'us',
+    'it', 'that', 'this', 'these', 'those', 'they', 'them', 'he', 'she', 'him', 'her', 'his'
+])
+
+# "I" followed by one of these describes the user rather than asking in general
+PERSONAL_VERBS = frozenset(['am', 'have', 'had', 'was', 'feel', 'felt', 'got', 'think', 'started', 'missed'])
+
+WORD_PATTERN = re.compile(r"[a-z']+")
+
+def is_context_independent(text: str) -> bool:
+    """Check whether a message is a short, general question whose answer doesn't depend on the user
+
+    Args:
+        text: Raw message
+
+    Returns:
+        True for FAQ-style questions such as "what does ewcm mean"
+    """
+    words = WORD_PATTERN.findall(text.lower())
+    if not words or len(words) > MAX_QUESTION_WORDS:
+        return False
+    if words[0] not in QUESTION_WORDS and not text.rstrip().endswith('?'):
+        return False
+    if any(word in PERSONAL_WORDS for word in words):
+        return False
+    return not any(word == 'i' and following in PERSONAL_VERBS for word, following in zip(words, words[1:]))
+
+class SentenceEmbedder:
+    """Local CPU sentence embedding model
+
+    Concurrent requests are grouped by a MicroBatcher into one forward pass.
+    Embeddings are the attention-masked mean of the token states, scaled to
+    unit length so a dot product is the cosine similarity.
+    """
+
+    def __init__(self, model_name: str = DEFAULT_EMBEDDING_MODEL, max_batch_size: int = 32, max_wait_ms: float = 5.0):
+        """Initialize the embedder (the model itself loads on first use)
+
+        Args:
+            model_name: Hugging Face encoder model to run locally
+            max_batch_size: Largest number of texts per forward pass
+            max_wait_ms: Longest time a request waits for a batch to fill
+        """
+        self.model_name = model_name
+
+        model_registry.register(EMBEDDER_BACKEND, self._load_pipeline)
+
+        self.batcher = MicroBatcher(
+            self._embed_batch,
+            max_batch_size=max_batch_size,
+            max_wait_ms=max_wait_ms,
+            name='sentence-embedder'
+        )
+
+    def _load_pipeline(self):
+        """Load the feature-extraction pipeline on CPU"""
+        transformers = model_registry.get('transformers')
+        return transformers.pipeline('feature-extraction', model=self.model_name, device=-1)
+
+    def _embed_batch(self, texts: List[str]) -> List[Any]:
+        """Run one forward pass over a batch of texts
+
+        Args:
+            texts: Texts to embed
+
+        Returns:
+            Unit-length float32 vectors in the same order
+        """
+        np = model_registry.get('numpy')
+        pipeline = model_registry.get(EMBEDDER_BACKEND)
+
+        encoded = pipeline.tokenizer(texts, padding=True, truncation=True, return_tensors=pipeline.framework)
+        hidden = pipeline.model(**encoded)[0]
+        hidden = hidden.numpy() if pipeline.framework == 'tf' else hidden.detach().numpy()
+
+        # Padding tokens must not pull the mean towards the batch's longest text
+        mask = np.asarray(encoded['attention_mask'], dtype=np.float32)[:, :, None]
+        vectors = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1.0)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return list(vectors.astype(np.float32))
+
+    def embed(self, text: str, timeout: Optional[float] = None) -> Any:
+        """Embed one text through the batcher
+
+        Args:
+            text: Text to embed
+            timeout: Seconds to wait for the embedding
+
+        Returns:
+            Unit-length float32 vector
+        """
+        return self.batcher.process(text, timeout=timeout)
+
+class SemanticCache:
+    """LRU cache of answers looked up by question similarity
+
+    Question embeddings are rows of a preallocated NumPy matrix, so a lookup is
+    one matrix-vector product over at most max_entries rows. A hit needs a
+    cosine similarity of at least the threshold; the least recently used entry
+    gives up its row when the cache is full.
+    """
+
+    def __init__(self, embedder: SentenceEmbedder, max_entries: int = 1000, threshold: float = 0.92, timeout: float = 1.0):
+        """Initialize the cache
+
+        Args:
+            embedder: Sentence embedder for questions
+            max_entries: Maximum number of cached answers
+            threshold: Minimum cosine similarity for a hit
+            timeout: Seconds to wait for an embedding before skipping the cache
+        """
+        self.embedder = embedder
+        self.max_entries = max(1, max_entries)
+        self.threshold = threshold
+        self.timeout = timeout
+        self._available = True
+
+        self._vectors = None  # allocated on the first answer, once the dimension is known
+        self._entries: 'OrderedDict[int, Tuple[str, str]]' = OrderedDict()  # row -> (question, answer)
+        self._lock = threading.Lock()
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def embed(self, question: str) -> Optional[Any]:
+        """Embed a question, or None if the embedder is unavailable or too slow
+
+        Args:
+            question: Question text
+
+        Returns:
+            Question vector for get and set
+        """
+        if not self._available:
+            return None
+
+        try:
+            return self.embedder.embed(question, timeout=self.timeout)
+        except TimeoutError:
+            logger.warning("Sentence embedder timed out, skipping the semantic cache")
+        except (ImportError, OSError) as e:
+            logger.error(f"Sentence embedder unavailable, disabling the semantic cache: {str(e)}")
+            self._available = False
+        except Exception as e:
+            logger.error(f"Error embedding question: {str(e)}")
+        return None
+
+    def get(self, vector: Any) -> Optional[str]:
+        """Get the answer to the most similar cached question
+
+        Args:
+            vector: Question vector from embed
+
+        Returns:
+            Cached answer, or None if no question is similar enough
+        """
+        with self._lock:
+            row, similarity = self._nearest(vector)
+            if row is None or similarity < self.threshold:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(row)
+            self.hits += 1
+            return self._entries[row][1]
+
+    def set(self, vector: Any, question: str, answer: str) -> None:
+        """Store an answer, replacing the entry of a near-identical question
+
+        Args:
+            vector: Question vector from embed
+            question: Question text
+            answer: Answer to cache
+        """
+        with self._lock:
+            if self._vectors is None:
+                np = model_registry.get('numpy')
+                self._vectors = np.zeros((self.max_entries, len(vector)), dtype=np.float32)
+
+            row, similarity = self._nearest(vector)
+            if row is None or similarity < self.threshold:
+                if len(self._entries) < self.max_entries:
+                    row = len(self._entries)
+                else:
+                    row, _ = self._entries.popitem(last=False)
+                    self.evictions += 1
+
+            self._vectors[row] = vector
+            self._entries[row] = (question, answer)
+            self._entries.move_to_end(row)
+
+    def _nearest(self, vector: Any) -> Tuple[Optional[int], float]:
+        """Row and similarity of the most similar cached question (lock held)"""
+        if not self._entries:
+            return None, 0.0
+        # Rows are filled in order and reused after eviction, so the first len(entries) are in use
+        similarities = self._vectors[:len(self._entries)] @ vector
+        row = int(similarities.argmax())
+        return row, float(similarities[row])
+
+    def stats(self) -> Dict[str, Any]:
+        """Get cache counters
+
+        Returns:
+            Dictionary with hit/miss counters, hit rate and size
+        """
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hitRate': self.hits / lookups if lookups else 0.0,
+            'size': len(self._entries),
+            'maxEntries': self.max_entries,
+            'threshold': self.threshold,
+            'available': self._available
+        }
@@ -0,0 +1,285 @@
+"""Local-first sentiment analysis that asks the LLM only when unsure
+
+The keyword EmotionDetector labels every text first, and a logistic model
+over a few features of its keyword hits estimates the probability that the
+local label is right. Only texts below the confidence threshold go to the LLM.
+
+The default weights are conservative hand-set priors. Fit weights on texts
+labeled by the LLM (or by people) to calibrate the confidence, one JSON
+object per line with "text" and "sentiment":
+
+    python -m utils.sentiment_cascade --labeled labeled.jsonl --output sentiment_calibration.json
+"""
+import re
+import sys
+import json
+import math
+import argparse
+import logging
+import threading
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+from utils.emotion_detector import EmotionDetector
+from utils.model_registry import model_registry
+
+logger = logging.getLogger(__name__)
+
+POSITIVE_EMOTIONS = frozenset(['happy', 'hopeful'])
+NEGATIVE_EMOTIONS = frozenset(['sad', 'angry', 'anxious', 'distressed'])
+
+NEGATION_PATTERN = re.compile(r"\b(?:not|no|never|nothing|hardly|without|cannot)\b|n't\b")
+
+FEATURES = ('bias', 'margin', 'conflict', 'negated', 'log_words', 'distress_conflict', 'no_hits')
+
+# Prior weights: short texts with one clear emotion stay local; texts without
+# any keyword hit (the lexicon says nothing about "I lost the baby yesterday"),
+# mixed polarity, negated keywords, positive words in distress and long texts
+# go to the LLM
+DEFAULT_WEIGHTS = {
+    'bias': 2.0,
+    'margin': 0.8,
+    'conflict': -2.5,
+    'negated': -2.0,
+    'log_words': -0.35,
+    'distress_conflict': -2.5,
+    'no_hits': -4.0
+}
+
+class LocalSentiment(NamedTuple):
+    """Keyword detector result and its estimated probability of being right"""
+    sentiment: str
+    emotion: str
+    distress_level: int
+    confidence: float
+
+def sentiment_of(emotion: str, distress_level: int) -> str:
+    """Map a detected emotion and distress level to positive, negative or neutral"""
+    if distress_level >= 7 or emotion in NEGATIVE_EMOTIONS:
+        return 'negative'
+    if emotion in POSITIVE_EMOTIONS:
+        return 'positive'
+    return 'neutral'
+
+def extract_features(text: str, emotion: str, scores: Dict[str, int], distress_level: int) -> Dict[str, float]:
+    """Features of a keyword detection result that predict whether it is right
+
+    Args:
+        text: Analyzed text
+        emotion: Detected emotion
+        scores: Keyword hits per emotion
+        distress_level: Detected distress level
+
+    Returns:
+        Feature name -> value, for every name in FEATURES
+    """
+    ranked = sorted(scores.values(), reverse=True) + [0, 0]
+    hits = sum(ranked)
+    positive = sum(scores.get(name, 0) for name in POSITIVE_EMOTIONS)
+    negative = sum(scores.get(name, 0) for name in NEGATIVE_EMOTIONS)
+    lowered = text.lower()
+
+    return {
+        'bias': 1.0,
+        'margin': float(min(ranked[0] - ranked[1], 3)),
+        'conflict': float(positive > 0 and negative > 0),
+        'negated': float(hits > 0 and NEGATION_PATTERN.search(lowered) is not None),
+        'log_words': math.log1p(len(lowered.split())),
+        'distress_conflict': float(emotion in POSITIVE_EMOTIONS and distress_level >= 4),
+        'no_hits': float(hits == 0 and distress_level == 0)
+    }
+
+class SentimentCascade:
+    """Sentiment from the keyword detector, escalated to the LLM when uncertain"""
+
+    def __init__(self, detector: EmotionDetector, threshold: float = 0.7, weights: Optional[Dict[str, float]] = None):
+        """Initialize the cascade
+
+        Args:
+            detector: Keyword emotion detector
+            threshold: Minimum confidence to answer without the LLM
+            weights: Logistic weights per feature (DEFAULT_WEIGHTS if not given)
+        """
+        self.detector = detector
+        self.threshold = threshold
+        self.weights = dict(DEFAULT_WEIGHTS)
+        if weights:
+            self.weights.update(weights)
+        self._lock = threading.Lock()
+
+        # Counters
+        self.local = 0
+        self.escalated = 0
+        self.llm_failed = 0
+
+    @classmethod
+    def from_calibration(cls, detector: EmotionDetector, path: Optional[str], threshold: float = 0.7) -> 'SentimentCascade':
+        """Build a cascade with the weights in a calibration file (the defaults if none)
+
+        Args:
+            detector: Keyword emotion detector
+            path: JSON file written by the calibration command, or None
+            threshold: Minimum confidence to answer without the LLM
+
+        Returns:
+            SentimentCascade
+        """
+        weights = None
+        if path:
+            try:
+                with open(path, encoding='utf-8') as calibration:
+                    weights = json.load(calibration)['weights']
+            except (OSError, ValueError, KeyError) as e:
+                logger.error(f"Error loading sentiment calibration, using the default weights: {str(e)}")
+        return cls(detector, threshold, weights)
+
+    def classify(self, text: str) -> LocalSentiment:
+        """Label a text with the keyword detector
+
+        Args:
+            text: Text to analyze
+
+        Returns:
+            LocalSentiment with the calibrated confidence
+        """
+        emotion, scores, distress_level = self.detector.detect_with_scores(text or '')
+        features = extract_features(text or '', emotion, scores, distress_level)
+        z = sum(self.weights.get(name, 0.0) * value for name, value in features.items())
+        confidence = 1.0 / (1.0 + math.exp(-max(-30.0, min(30.0, z))))
+        return LocalSentiment(sentiment_of(emotion, distress_level), emotion, distress_level, confidence)
+
+    def needs_llm(self, local: LocalSentiment) -> bool:
+        """Whether the local result is too uncertain to return"""
+        return local.confidence < self.threshold
+
+    def result(self, local: LocalSentiment, llm_result: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Final sentiment analysis, counting which stage answered
+
+        The distress level never drops below the keyword detector's, so a
+        high-severity phrase can't be talked down by the model. When the LLM
+        call failed the client's neutral fallback (marked ``is_fallback``) is
+        ignored and the local result is returned.
+
+        Args:
+            local: Result of classify
+            llm_result: LLM sentiment analysis, or None if the local result is used
+
+        Returns:
+            Dictionary with sentiment, emotion, distressLevel, confidence and source
+        """
+        llm_failed = getattr(llm_result, 'is_fallback', False)
+        with self._lock:
+            if llm_result is None:
+                self.local += 1
+            else:
+                self.escalated += 1
+                if llm_failed:
+                    self.llm_failed += 1
+
+        if llm_result is None or llm_failed:
+            return {
+                'sentiment': local.sentiment,
+                'emotion': local.emotion,
+                'distressLevel': local.distress_level,
+                'confidence': round(local.confidence, 4),
+                'source': 'local'
+            }
+
+        return {
+            'sentiment': llm_result.get('sentiment', 'neutral'),
+            'emotion': llm_result.get('emotion', 'neutral'),
+            'distressLevel': max(local.distress_level, int(llm_result.get('distressLevel', 0))),
+            'confidence': round(local.confidence, 4),
+            'source': 'llm'
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        """Get cascade counters
+
+        Returns:
+            Dictionary with local and escalated counts (escalations whose LLM
+            call failed are counted in llmFailed too) and the escalation rate
+        """
+        total = self.local + self.escalated
+        return {
+            'local': self.local,
+            'escalated': self.escalated,
+            'llmFailed': self.llm_failed,
+            'escalationRate': self.escalated / total if total else 0.0,
+            'threshold': self.threshold
+        }
+
+def fit_calibration(
+    detector: EmotionDetector,
+    examples: Iterable[Tuple[str, str]],
+    l2: float = 1.0,
+    iterations: int = 50
+) -> Dict[str, float]:
+    """Fit the logistic weights to labeled texts (Newton's method with L2 regularization)
+
+    Args:
+        detector: Keyword emotion detector
+        examples: (text, reference sentiment) pairs
+        l2: Regularization strength (pulls the weights towards DEFAULT_WEIGHTS)
+        iterations: Maximum Newton steps
+
+    Returns:
+        Weight per feature
+    """
+    np = model_registry.get('numpy')
+
+    rows, labels = [], []
+    for text, sentiment in examples:
+        emotion, scores, distress_level = detector.detect_with_scores(text)
+        features = extract_features(text, emotion, scores, distress_level)
+        rows.append([features[name] for name in FEATURES])
+        labels.append(float(sentiment_of(emotion, distress_level) == sentiment))
+
+    x = np.asarray(rows, dtype=np.float64)
+    y = np.asarray(labels, dtype=np.float64)
+    prior = np.asarray([DEFAULT_WEIGHTS[name] for name in FEATURES])
+    weights = prior.copy()
+    for _ in range(iterations):
+        p = 1.0 / (1.0 + np.exp(-np.clip(x @ weights, -30, 30)))
+        gradient = x.T @ (p - y) + l2 * (weights - prior)
+        hessian = (x * (p * (1 - p))[:, None]).T @ x + l2 * np.eye(len(FEATURES))
+        step = np.linalg.solve(hessian, gradient)
+        weights -= step
+        if np.abs(step).max() < 1e-6:
+            break
+
+    return {name: float(weight) for name, weight in zip(FEATURES, weights)}
+
+def read_labeled(path: str) -> List[Tuple[str, str]]:
+    """Read (text, sentiment) pairs from a JSONL file"""
+    examples = []
+    with open(path, encoding='utf-8') as labeled:
+        for line in labeled:
+            if line.strip():
+                record = json.loads(line)
+                examples.append((record['text'], str(record['sentiment']).lower()))
+    return examples
+
+def main(argv=None) -> int:
+    """Fit calibration weights and report the resulting escalation rate"""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--labeled', required=True, help='JSONL file of {"text", "sentiment"} records')
+    parser.add_argument('--output', required=True, help='Calibration file to write')
+    parser.add_argument('--threshold', type=float, default=0.7)
+    parser.add_argument('--l2', type=float, default=1.0)
+    args = parser.parse_args(argv)
+
+    detector = EmotionDetector()
+    examples = read_labeled(args.labeled)
+    weights = fit_calibration(detector, examples, l2=args.l2)
+    with open(args.output, 'w', encoding='utf-8') as output:
+        json.dump({'weights': weights}, output, indent=2)
+
+    cascade = SentimentCascade(detector, args.threshold, weights)
+    local = [(cascade.classify(text), sentiment) for text, sentiment in examples]
+    kept = [(result, sentiment) for result, sentiment in local if not cascade.needs_llm(result)]
+    accuracy = sum(result.sentiment == sentiment for result, sentiment in kept) / len(kept) if kept else 0.0
+    print(f"Fitted on {len(examples)} texts: {1 - len(kept) / max(len(examples), 1):.1%} escalated, "
+          f"{accuracy:.1%} of local answers correct")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,20 @@
+import json
+from typing import Any
+
+def format_sse(event: str, data: Any) -> str:
+    """Format a server-sent event
+
+    Args:
+        event: Event name
+        data: JSON-serializable payload
+
+    Returns:
+        SSE frame ready to be written to the response stream
+    """
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+# Headers that keep proxies from buffering or caching event streams
+SSE_HEADERS = {
+    'Cache-Control': 'no-cache',
+    'X-Accel-Buffering': 'no'
+}
@@ -0,0 +1,158 @@
+import logging
+import string
+from typing import List, NamedTuple, Optional
+from utils.emotion_detector import EmotionDetector, _is_word_char
+from utils.keyword_matcher import KeywordMatcher
+from utils.text_processor import TextProcessor
+
+logger = logging.getLogger(__name__)
+
+PUNCTUATION = frozenset(string.punctuation)
+
+class TextAnalysis(NamedTuple):
+    """Everything the engine derives locally from one message"""
+    emotion: str
+    distress_level: int
+    processed_text: str
+    keywords: List[str]
+
+class TextAnalyzer:
+    """Single-pass text analysis pipeline
+
+    The message is lowercased once and scanned once with a matcher holding the
+    emotion and distress lexicon, medical terms and abbreviations. Emotion and
+    distress scoring, abbreviation expansion and keyword extraction all work
+    from that one list of matches, with the same results as EmotionDetector
+    and TextProcessor give separately.
+    """
+
+    def __init__(self, emotion_detector: Optional[EmotionDetector] = None, text_processor: Optional[TextProcessor] = None):
+        """Initialize the analyzer
+
+        Args:
+            emotion_detector: Keyword emotion detector whose lexicon is used
+            text_processor: Text processor whose abbreviations and medical terms are used
+        """
+        self.emotion_detector = emotion_detector or EmotionDetector()
+        self.text_processor = text_processor or TextProcessor()
+        self._build_matcher()
+
+    def _build_matcher(self):
+        """Build the combined matcher and per-keyword lookup tables"""
+        lexicon = self.emotion_detector.keywords
+        medical_terms = self.text_processor.medical_terms
+        abbreviations = self.text_processor.abbreviations
+
+        # The emotion lexicon comes first so its keyword ids are unchanged
+        self._matcher = KeywordMatcher(list(lexicon) + list(medical_terms) + list(abbreviations))
+        self._lexicon_size = len(lexicon)
+        ids = self._matcher.keyword_ids
+
+        self._medical_ids = frozenset(ids[term] for term in medical_terms)
+        self._abbreviation_ids = frozenset(ids[abbr] for abbr in abbreviations)
+
+        # Extracted keywords are listed medical terms first, then abbreviations
+        self._keyword_rank = {}
+        for keyword in list(medical_terms) + list(abbreviations):
+            self._keyword_rank.setdefault(ids[keyword], len(self._keyword_rank))
+
+    def analyze(self, text: str) -> TextAnalysis:
+        """Analyze a message
+
+        Args:
+            text: Raw message
+
+        Returns:
+            TextAnalysis with emotion, distress level, preprocessed text and keywords
+        """
+        if not text:
+            return TextAnalysis('neutral', 0, '', [])
+
+        text_lower = text.lower()
+
+        # Match offsets are only valid for the original text if lowercasing kept its length
+        if len(text_lower) != len(text):
+            return self._analyze_separately(text)
+
+        matches, _ = self._matcher.find_all(text_lower)
+        lexicon_size = self._lexicon_size
+        emotion, distress_level = self.emotion_detector.analyze_matches(
+            text_lower, [match for match in matches if match[2] < lexicon_size]
+        )
+
+        found = set()
+        expansions = []
+        text_length = len(text_lower)
+        for start, end, keyword_id in matches:
+            if keyword_id in self._medical_ids:
+                found.add(keyword_id)
+
+            if keyword_id not in self._abbreviation_ids:
+                continue
+
+            # Keyword extraction wants a whole-word match (regex \b on both sides)
+            if not (start > 0 and _is_word_char(text_lower[start - 1])) and not (
+                end < text_length and _is_word_char(text_lower[end])
+            ):
+                found.add(keyword_id)
+
+            # Expansion wants the whole whitespace token, minus surrounding punctuation
+            token_end = _token_end(text_lower, start, end)
+            if token_end is not None:
+                expansions.append((token_end, keyword_id))
+
+        processed_text = self.text_processor.clean_punctuation(self._expand(text, expansions))
+        keywords = [self._matcher.keywords[keyword_id] for keyword_id in sorted(found, key=self._keyword_rank.__getitem__)]
+
+        return TextAnalysis(emotion, distress_level, processed_text, keywords)
+
+    def _expand(self, text: str, expansions: List[tuple]) -> str:
+        """Insert abbreviation expansions after their tokens"""
+        if not expansions:
+            return text
+
+        abbreviations = self.text_processor.abbreviations
+        keywords = self._matcher.keywords
+        pieces = []
+        position = 0
+        for token_end, keyword_id in expansions:
+            pieces.append(text[position:token_end])
+            pieces.append(f" ({abbreviations[keywords[keyword_id]]})")
+            position = token_end
+        pieces.append(text[position:])
+        return ''.join(pieces)
+
+    def _analyze_separately(self, text: str) -> TextAnalysis:
+        """Fallback for text whose lowercase form has a different length"""
+        emotion, distress_level = self.emotion_detector.detect_emotion_and_distress(text)
+        return TextAnalysis(
+            emotion,
+            distress_level,
+            self.text_processor.preprocess(text),
+            self.text_processor.extract_keywords(text)
+        )
+
+def _token_end(text: str, start: int, end: int) -> Optional[int]:
+    """End of the whitespace token if text[start:end] is that token with its edge punctuation stripped
+
+    Args:
+        text: Text containing the match
+        start: Match start
+        end: Match end
+
+    Returns:
+        Offset just past the token, or None if the match is not the whole token
+    """
+    index = start - 1
+    while index >= 0 and text[index] in PUNCTUATION:
+        index -= 1
+    if index >= 0 and not text[index].isspace():
+        return None
+
+    index = end
+    while index < len(text) and text[index] in PUNCTUATION:
+        index += 1
+    if index < len(text) and not text[index].isspace():
+        return None
+
+    return index